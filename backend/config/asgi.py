@@ -3,6 +3,11 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the preferred entry point in production: the AI views are async, so a
+single process can keep hundreds of LLM calls in flight, e.g.
+
+    uvicorn config.asgi:application --workers 2
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -36,6 +36,26 @@ DEBUG=False
 
 ALLOWED_HOSTS = ["127.0.0.1", "localhost"]
 
+# Bearer token for internal/scripted endpoints (e.g. batch analysis)
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
+
+# true: POST /student/ai/analyze/ queues the analysis and returns a job id (202)
+# unless the client sends ?async=0; false: only with ?async=1. Needs `manage.py ai_workers`.
+AI_ANALYZE_ASYNC = os.getenv("AI_ANALYZE_ASYNC", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# LLM backend for myapp.ai: "openai" | "fake" (offline canned answers) | "replay"
+# (recorded fixtures) | "module:factory". Built lazily on the first AI call.
+AI_PROVIDER = os.getenv("AI_PROVIDER", "openai")
+AI_PROVIDER_BASE_URL = os.getenv("AI_PROVIDER_BASE_URL", "")   # OpenAI-compatible server, e.g. a local stub
+AI_REPLAY_FIXTURES = os.getenv("AI_REPLAY_FIXTURES", "")
+AI_REPLAY_RECORD = os.getenv("AI_REPLAY_RECORD", "false")
+
+# Files written at runtime (myapp/ai/paths.py): kept out of the source tree and
+# out of git, since the similar-answer index stores student complaint texts.
+AI_DATA_DIR = Path(os.getenv("AI_DATA_DIR") or BASE_DIR / "var")
+AI_ROUTER_MODEL = os.getenv("AI_ROUTER_MODEL") or str(AI_DATA_DIR / "router_model.json")
+AI_SIMILAR_INDEX = os.getenv("AI_SIMILAR_INDEX") or str(AI_DATA_DIR / "similar_index")
+
 
 # Application definition
 
@@ -51,6 +71,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'myapp.middleware.CompressionMiddleware',   # JSON / text only, see myapp/middleware.py
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -86,9 +107,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # reuse connections across requests; health checks drop ones that went stale
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# DB_SQLITE_TUNED=true: WAL (readers don't block the writer), fsync only at checkpoints,
+# memory-mapped reads, and writers wait for the lock instead of failing with "database is locked".
+SQLITE_TUNED_OPTIONS = {
+    'init_command': (
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        f"PRAGMA mmap_size={int(os.getenv('DB_SQLITE_MMAP_MB', '256')) * 1024 * 1024};"
+        "PRAGMA temp_store=MEMORY;"
+    ),
+    'timeout': float(os.getenv("DB_SQLITE_BUSY_TIMEOUT", "5")),   # busy_timeout, seconds
+    'transaction_mode': 'IMMEDIATE',   # take the write lock up front; avoids upgrade deadlocks
+}
+if os.getenv("DB_SQLITE_TUNED", "false").strip().lower() in ("1", "true", "yes", "on"):
+    DATABASES['default']['OPTIONS'] = SQLITE_TUNED_OPTIONS
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,3 +169,15 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# One JSON line per analyzed request (stage timings, tokens, retries) when
+# AI_METRICS_LOG=true; see myapp/ai/metrics.py
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {"console": {"class": "logging.StreamHandler", "formatter": "message"}},
+    "loggers": {
+        "myapp.ai.requests": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
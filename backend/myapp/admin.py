@@ -1,3 +1,5 @@
 from django.contrib import admin
-from .models import Ticket
+from .models import AIRecord, AnalysisJob, Ticket
 admin.site.register(Ticket)
+admin.site.register(AIRecord)
+admin.site.register(AnalysisJob)
@@ -0,0 +1,178 @@
+# ==============================================
+# Bulk complaint analysis (backfills, re-runs)
+# ==============================================
+# ai_agent_many() / ai_agent_many_async() run complaints with bounded
+# concurrency and yield one record per item in completion order:
+#   {"id": ..., "result": {...}}   on success
+#   {"id": ..., "error": "..."}    on failure (never raised)
+# The OpenAI Batch API helpers write/read the offline JSONL file format so
+# large jobs can be submitted at batch pricing instead.
+from __future__ import annotations
+import asyncio
+import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List
+
+from .complaint_agent import ai_agent, ai_agent_async, _answer, _request_kwargs
+from .ratelimit import BATCH
+from .schema import check_output
+
+DEFAULT_CONCURRENCY = 8
+
+
+def iter_jsonl_items(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse JSONL input. Each line is {"id": ..., "text": ...}, {"text": ...}
+    or a bare JSON string. Bad lines come back as error records so one typo
+    doesn't abort a backfill.
+    """
+    for n, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield {"id": f"line:{n}", "error": f"invalid JSON: {e}"}
+            continue
+        if isinstance(obj, str):
+            obj = {"text": obj}
+        if not isinstance(obj, dict) or not str(obj.get("text") or "").strip():
+            yield {"id": (obj.get("id") if isinstance(obj, dict) else None) or f"line:{n}", "error": "text required"}
+            continue
+        yield {"id": obj.get("id", f"line:{n}"), "text": str(obj["text"])}
+
+
+def _iter_items(complaints: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """Accept plain strings, (id, text) pairs or dicts with id/text."""
+    for i, item in enumerate(complaints):
+        if isinstance(item, str):
+            yield {"id": i, "text": item}
+        elif isinstance(item, tuple):
+            yield {"id": item[0], "text": item[1]}
+        else:
+            item = dict(item)
+            item.setdefault("id", i)
+            yield item
+
+
+def _record(item_id: Any, result: Any) -> Dict[str, Any]:
+    if isinstance(result, BaseException):
+        return {"id": item_id, "error": f"Unexpected error: {result}"}
+    if not isinstance(result, dict):
+        return {"id": item_id, "error": "Unexpected result type"}
+    if "error" in result:
+        return {"id": item_id, "error": result["error"]}
+    return {"id": item_id, "result": result}
+
+
+def ai_agent_many(complaints: Iterable[Any], *, concurrency: int = DEFAULT_CONCURRENCY,
+                  **agent_kwargs: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Thread-pool version for scripts and management commands. At most
+    `concurrency` calls run at once and only a small window of the input is
+    read ahead, so a huge JSONL file is streamed rather than loaded.
+    """
+    concurrency = max(1, concurrency)
+    agent_kwargs.setdefault("priority", BATCH)  # interactive requests go first in the rate limiter
+    items = _iter_items(complaints)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ai_agent_many")
+    pending: Dict[Any, Any] = {}
+    ready: List[Dict[str, Any]] = []
+
+    def submit_next() -> bool:
+        for item in items:
+            if "error" in item:
+                ready.append({"id": item["id"], "error": item["error"]})
+                continue
+            pending[pool.submit(ai_agent, item["text"], **agent_kwargs)] = item["id"]
+            return True
+        return False
+
+    try:
+        for _ in range(concurrency * 2):
+            if not submit_next():
+                break
+        while pending or ready:
+            while ready:
+                yield ready.pop(0)
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                item_id = pending.pop(fut)
+                exc = fut.exception()
+                yield _record(item_id, exc if exc is not None else fut.result())
+                submit_next()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def ai_agent_many_async(complaints: Iterable[Any], *, concurrency: int = DEFAULT_CONCURRENCY,
+                              **agent_kwargs: Any) -> AsyncIterator[Dict[str, Any]]:
+    """Semaphore-bounded asyncio version, used by the batch endpoint."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    agent_kwargs.setdefault("priority", BATCH)
+
+    async def one(item: Dict[str, Any]) -> Dict[str, Any]:
+        if "error" in item:
+            return {"id": item["id"], "error": item["error"]}
+        async with sem:
+            try:
+                result = await ai_agent_async(item["text"], **agent_kwargs)
+            except Exception as e:
+                result = e
+        return _record(item["id"], result)
+
+    tasks = [asyncio.ensure_future(one(item)) for item in _iter_items(complaints)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+# ---- OpenAI Batch API file format (offline)
+
+def to_batch_requests(complaints: Iterable[Any], *, model: str = "gpt-4o-mini",
+                      max_tokens: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Yield Batch API input lines (one /v1/chat/completions request each)."""
+    for item in _iter_items(complaints):
+        if "error" in item:
+            continue
+        body = _request_kwargs(item["text"], model=model, max_tokens=max_tokens)
+        body.pop("timeout", None)  # client-side option, not part of the request body
+        yield {"custom_id": str(item["id"]), "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+
+def parse_batch_output(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Turn a Batch API output/error file back into our {"id", "result"|"error"} records."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield {"id": None, "error": f"invalid JSON: {e}"}
+            continue
+        item_id = obj.get("custom_id")
+        err = obj.get("error")
+        if err:
+            yield {"id": item_id, "error": str(err.get("message") or err) if isinstance(err, dict) else str(err)}
+            continue
+        response = obj.get("response") or {}
+        if response.get("status_code") != 200:
+            yield {"id": item_id, "error": f"HTTP {response.get('status_code')}"}
+            continue
+        try:
+            content = response["body"]["choices"][0]["message"]["content"]
+            # same repair/validation as the interactive path; no re-ask offline
+            record = _record(item_id, _answer(check_output(content), None))
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            record = {"id": item_id, "error": f"Unparseable completion: {e}"}
+        except Exception as e:
+            record = _record(item_id, e)
+        yield record
+
@@ -0,0 +1,256 @@
+# ==============================================
+# Response cache for ai_agent()
+# ==============================================
+# Two tiers:
+#   1) in-process LRU (always on when caching is enabled)
+#   2) optional shared tier: Django cache framework or a SQLite table
+# Entries are keyed on a hash of the normalized complaint + model + max_tokens
+# + prompt version, and stored as JSON text so every hit hands out a fresh copy
+# (callers may mutate the answer they get).
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+AI_CACHE_ENABLED = os.getenv("AI_CACHE", "true").strip().lower() not in ("0", "false", "no", "off")
+AI_CACHE_TTL_S = int(os.getenv("AI_CACHE_TTL", "86400"))          # 1 day
+AI_CACHE_MAX_ITEMS = int(os.getenv("AI_CACHE_MAX_ITEMS", "1024"))  # in-process LRU size
+# "" (local only) | "django" | "django:<alias>" | "sqlite:<path>"
+AI_CACHE_BACKEND = os.getenv("AI_CACHE_BACKEND", "").strip()
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_complaint(text: str) -> str:
+    """Collapse whitespace and case so trivially different submissions share a key."""
+    return _WS_RE.sub(" ", (text or "").strip()).casefold()
+
+
+def cache_key(student_complaint: str, *, model: str, max_tokens: int, prompt_version: str) -> str:
+    payload = "\x1f".join([prompt_version, model, str(max_tokens), normalize_complaint(student_complaint)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# ---- tier 1: in-process LRU with TTL
+
+class LRUCache:
+    def __init__(self, max_items: int = 1024, ttl_s: int = 86400):
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl_s: Optional[int] = None) -> None:
+        expires_at = time.time() + (self.ttl_s if ttl_s is None else ttl_s)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ---- tier 2: shared backends
+
+class DjangoCacheTier:
+    """Uses a cache from settings.CACHES (redis, memcached, db, file...)."""
+
+    def __init__(self, alias: str = "default"):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(f"ai_agent:{key}")
+
+    def set(self, key: str, value: str, ttl_s: int) -> None:
+        self._cache.set(f"ai_agent:{key}", value, timeout=ttl_s)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(f"ai_agent:{key}")
+
+    def clear(self) -> None:
+        # never flush a shared Django cache wholesale; entries just expire
+        pass
+
+
+class SQLiteCacheTier:
+    """Small key/value table in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path: str, max_rows: int = 50_000):
+        self.path = path
+        self.max_rows = max_rows
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ai_response_cache_expires ON ai_response_cache(expires_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute(
+            "SELECT value FROM ai_response_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl_s: int) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO ai_response_cache(key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + ttl_s, now),
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict(conn, now)
+        conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM ai_response_cache WHERE expires_at < ?", (now,))
+        conn.execute(
+            "DELETE FROM ai_response_cache WHERE key IN ("
+            " SELECT key FROM ai_response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM ai_response_cache WHERE key = ?", (key,))
+        conn.commit()
+
+    def clear(self) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM ai_response_cache")
+        conn.commit()
+
+
+# ---- the cache used by ai_agent()
+
+class ResponseCache:
+    def __init__(self, local: LRUCache, shared: Any = None, ttl_s: int = 86400):
+        self.local = local
+        self.shared = shared
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "local_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0, "errors": 0}
+
+    def _bump(self, *names: str) -> None:
+        with self._lock:
+            for n in names:
+                self._stats[n] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.local.get(key)
+        if value is not None:
+            self._bump("hits", "local_hits")
+            return json.loads(value)
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception:
+                # the shared tier is best-effort; a broken backend must not break analysis
+                self._bump("errors")
+                value = None
+            if value is not None:
+                self.local.set(key, value)
+                self._bump("hits", "shared_hits")
+                return json.loads(value)
+        self._bump("misses")
+        return None
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        value = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+        self.local.set(key, value, self.ttl_s)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, self.ttl_s)
+            except Exception:
+                self._bump("errors")
+        self._bump("sets")
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self) -> None:
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+        out["local_size"] = len(self.local)
+        out["local_evictions"] = self.local.evictions
+        return out
+
+
+def _build_shared_tier(spec: str) -> Any:
+    if not spec:
+        return None
+    if spec == "django" or spec.startswith("django:"):
+        return DjangoCacheTier(spec.partition(":")[2] or "default")
+    if spec.startswith("sqlite:"):
+        return SQLiteCacheTier(spec.partition(":")[2])
+    raise ValueError(f"Unknown AI_CACHE_BACKEND: {spec!r}")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Process-wide cache, built on first use. Returns None when AI_CACHE is off."""
+    global _cache
+    if not AI_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    LRUCache(AI_CACHE_MAX_ITEMS, AI_CACHE_TTL_S),
+                    _build_shared_tier(AI_CACHE_BACKEND),
+                    AI_CACHE_TTL_S,
+                )
+    return _cache
@@ -0,0 +1,226 @@
+# ==============================================
+# Model cascade: cheap tiers first, the strong model only when needed
+# ==============================================
+# With AI_CASCADE=true (or ai_agent(..., cascade=True)) an LLM-bound complaint
+# goes through up to three tiers instead of one fixed model:
+#   route  -- routing-only call (ROUTE_PROMPT, a few dozen output tokens);
+#             confident non-technical -> answered here; low confidence -> strong
+#   cheap  -- the full answer from a small model, with the route as a hint
+#   strong -- the full answer from the big model, only when the cheap one is
+#             unusable after schema.py's repairs (no JSON, fields missing, fewer
+#             than 3 steps) or reports a low routing.confidence
+# A confident local router hint (router.py) skips the route call. When the
+# strong tier fails, the cheap answer (if any parsed) is returned instead.
+# Cascade decides; complaint_agent makes the calls (sync or async), so both
+# paths share one plan. Every tier reports latency, tokens and cost (USD, from
+# AI_MODEL_PRICES) through `info["tiers"]`, the log line and /metrics.
+from __future__ import annotations
+import json
+import os
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from .metrics import count_tier
+from .prompt import CATEGORIES, build_messages, build_route_messages, cached_tokens, response_format
+from .resilience import LLM_TIMEOUT_S
+from .router import NON_TECHNICAL, RoutePrediction, non_technical_result
+from .schema import Checked, check_output
+
+AI_CASCADE_ENABLED = os.getenv("AI_CASCADE", "false").strip().lower() in ("1", "true", "yes", "on")
+AI_CASCADE_ROUTE_MODEL = os.getenv("AI_CASCADE_ROUTE_MODEL", "gpt-4o-mini")
+AI_CASCADE_ROUTE_MAX_TOKENS = int(os.getenv("AI_CASCADE_ROUTE_MAX_TOKENS", "60"))
+AI_CASCADE_ROUTE_COMPLAINT_TOKENS = int(os.getenv("AI_CASCADE_ROUTE_COMPLAINT_TOKENS", "400"))
+AI_CASCADE_CHEAP_MODEL = os.getenv("AI_CASCADE_CHEAP_MODEL", "gpt-4o-mini")
+AI_CASCADE_CHEAP_MAX_TOKENS = int(os.getenv("AI_CASCADE_CHEAP_MAX_TOKENS", "900"))
+AI_CASCADE_STRONG_MODEL = os.getenv("AI_CASCADE_STRONG_MODEL", "gpt-4o")
+AI_CASCADE_STRONG_MAX_TOKENS = int(os.getenv("AI_CASCADE_STRONG_MAX_TOKENS", "1200"))
+# route says non-technical at or above this -> answer without a full call;
+# a local router hint at or above this -> skip the route call
+AI_CASCADE_ANSWER_CONFIDENCE = float(os.getenv("AI_CASCADE_ANSWER_CONFIDENCE", "0.85"))
+# route or cheap answer below this -> strong model
+AI_CASCADE_ESCALATE_BELOW = float(os.getenv("AI_CASCADE_ESCALATE_BELOW", "0.6"))
+
+# USD per 1M tokens: (input, cached input, output). AI_MODEL_PRICES='{"my-model": [1, 0.5, 4]}' adds/overrides.
+MODEL_PRICES: Dict[str, tuple] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("AI_MODEL_PRICES") or "{}").items()})
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    model: str
+    max_tokens: int
+
+
+ROUTE = Tier("route", AI_CASCADE_ROUTE_MODEL, AI_CASCADE_ROUTE_MAX_TOKENS)
+CHEAP = Tier("cheap", AI_CASCADE_CHEAP_MODEL, AI_CASCADE_CHEAP_MAX_TOKENS)
+STRONG = Tier("strong", AI_CASCADE_STRONG_MODEL, AI_CASCADE_STRONG_MAX_TOKENS)
+
+
+def cost_usd(model: str, usage: Any) -> Optional[float]:
+    """What one response cost, or None for a model without a price."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None or usage is None:
+        return None
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    cached = cached_tokens(usage) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    return ((prompt - cached) * prices[0] + cached * prices[1] + completion * prices[2]) / 1_000_000
+
+
+def parse_route(content: str) -> Optional[RoutePrediction]:
+    """The route tier's answer ({"is_technical", "category", "confidence"}, optionally under "routing")."""
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(data, dict) and isinstance(data.get("routing"), dict):
+        data = data["routing"]
+    if not isinstance(data, dict) or data.get("category") not in CATEGORIES:
+        return None
+    try:
+        confidence = min(1.0, max(0.0, float(data.get("confidence"))))
+    except (TypeError, ValueError):
+        return None
+    is_technical = data["category"] != NON_TECHNICAL and data.get("is_technical") is not False
+    return RoutePrediction(data["category"], is_technical, confidence)
+
+
+def escalation_reason(checked: Checked) -> Optional[str]:
+    """Why a full answer is not good enough to return (None = return it)."""
+    if checked.result is None:
+        return "json"
+    if checked.failed:
+        # schema.py already repaired what it could; too few steps is the usual leftover
+        return "steps" if list(checked.failed) == ["steps_to_apply"] and checked.result.steps_to_apply else "schema"
+    if checked.result.routing.confidence < AI_CASCADE_ESCALATE_BELOW:
+        return "confidence"
+    return None
+
+
+class Cascade:
+    """
+    The tier plan for one complaint. The agent loops:
+        tier = plan.first()
+        while tier: resp = <call plan.request(tier)>; tier = plan.advance(tier, resp, seconds)
+    and returns plan.result; a call that raises goes to plan.failed() instead.
+    """
+
+    def __init__(self, student_complaint: str, hint: Optional[RoutePrediction] = None):
+        self.text = student_complaint
+        self.hint = hint
+        self.tiers: List[Dict[str, Any]] = []   # one report per call made
+        self.result: Optional[Dict[str, Any]] = None
+        self.answered_by: Optional[Tier] = None
+        self.escalation: Optional[str] = None
+        self.repairs: List[str] = []            # schema.py repairs of the returned answer
+        self._fallback: Optional[Dict[str, Any]] = None
+        self._fallback_tier: Optional[Tier] = None
+        self._fallback_repairs: List[str] = []
+        self._usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+    def first(self) -> Tier:
+        if self.hint is not None and self.hint.is_technical and self.hint.confidence >= AI_CASCADE_ANSWER_CONFIDENCE:
+            return CHEAP
+        return ROUTE
+
+    def request(self, tier: Tier) -> Dict[str, Any]:
+        """chat.completions.create arguments for `tier`."""
+        if tier is ROUTE:
+            messages = build_route_messages(self.text, model=tier.model,
+                                            max_complaint_tokens=AI_CASCADE_ROUTE_COMPLAINT_TOKENS)
+            fmt: Dict[str, Any] = {"type": "json_object"}
+        else:
+            messages = build_messages(self.text, model=tier.model, hint=self.hint)
+            fmt = response_format()
+        return dict(model=tier.model, temperature=0, max_tokens=tier.max_tokens, response_format=fmt,
+                    messages=messages, timeout=LLM_TIMEOUT_S)
+
+    def advance(self, tier: Tier, resp: Any, seconds: float) -> Optional[Tier]:
+        """Record `tier`'s response; returns the next tier to call, or None when `result` is set."""
+        content = resp.choices[0].message.content
+        if tier is ROUTE:
+            outcome, nxt = self._after_route(parse_route(content))
+        else:
+            outcome, nxt = self._after_answer(tier, content)
+        self._report(tier, resp.usage, seconds, outcome)
+        return nxt
+
+    def _after_route(self, pred: Optional[RoutePrediction]):
+        if pred is None:
+            return "unparsed", CHEAP
+        if not pred.is_technical and pred.confidence >= AI_CASCADE_ANSWER_CONFIDENCE:
+            self.result, self.answered_by = non_technical_result(pred), ROUTE
+            self.result["routing"]["source"] = "cascade_route"
+            return "answered", None
+        if pred.confidence < AI_CASCADE_ESCALATE_BELOW:
+            self.escalation = "route_confidence"
+            self.hint = pred
+            return "escalated", STRONG
+        self.hint = pred
+        return "continued", CHEAP
+
+    def _after_answer(self, tier: Tier, content: str):
+        checked = check_output(content)
+        reason = escalation_reason(checked)
+        if reason is None or tier is STRONG:
+            if checked.result is None:
+                if self.fallback_result() is None:
+                    raise ValueError("the model did not return a JSON object")
+                return "unparsed", None
+            self.result, self.answered_by, self.repairs = checked.result.to_dict(), tier, checked.repairs
+            return ("answered" if reason is None else f"answered_{reason}"), None
+        self.escalation = reason
+        if checked.result is not None:   # repaired, but usable if the strong tier fails
+            self._fallback, self._fallback_tier, self._fallback_repairs = checked.result.to_dict(), tier, checked.repairs
+        return "escalated", STRONG
+
+    def fallback_result(self) -> Optional[Dict[str, Any]]:
+        """Make the usable cheap answer (if any) the result."""
+        if self._fallback is not None:
+            self.result, self.answered_by, self.repairs = self._fallback, self._fallback_tier, self._fallback_repairs
+        return self._fallback
+
+    def failed(self, tier: Tier, seconds: float) -> Optional[Dict[str, Any]]:
+        """`tier`'s call raised; returns the fallback answer to use instead, or None (re-raise)."""
+        self._report(tier, None, seconds, "failed")
+        return self.fallback_result()
+
+    def _report(self, tier: Tier, usage: Any, seconds: float, outcome: str) -> None:
+        cost = cost_usd(tier.model, usage)
+        prompt = getattr(usage, "prompt_tokens", None)
+        completion = getattr(usage, "completion_tokens", None)
+        self._usage["prompt_tokens"] += prompt or 0
+        self._usage["completion_tokens"] += completion or 0
+        self._usage["cached_tokens"] += cached_tokens(usage) or 0
+        self.tiers.append({
+            "tier": tier.name, "model": tier.model, "ms": round(seconds * 1000, 1), "outcome": outcome,
+            "prompt_tokens": prompt, "completion_tokens": completion, "cost_usd": cost,
+        })
+        count_tier(tier.name, outcome, cost)
+
+    @property
+    def cost(self) -> Optional[float]:
+        costs = [t["cost_usd"] for t in self.tiers if t["cost_usd"] is not None]
+        return round(sum(costs), 8) if costs else None
+
+    def usage(self) -> Any:
+        """All tiers' tokens, shaped like resp.usage (for _Memo.report / record_usage)."""
+        return SimpleNamespace(
+            prompt_tokens=self._usage["prompt_tokens"],
+            completion_tokens=self._usage["completion_tokens"],
+            prompt_tokens_details=SimpleNamespace(cached_tokens=self._usage["cached_tokens"]),
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        """What ai_agent adds to `info`."""
+        tier = self.answered_by
+        return {"model": tier and tier.model, "tier": tier and tier.name, "tiers": self.tiers,
+                "escalation": self.escalation, "cost_usd": self.cost, "schema_repairs": self.repairs}
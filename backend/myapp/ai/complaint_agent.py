@@ -2,23 +2,31 @@
 # JSON-structured Technical Complaint AI Agent
 # ==============================================
 from __future__ import annotations
-import os
-import json
-import sys
-from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
-from typing import Any, List, Dict
+import asyncio
+import copy
+import functools
+from typing import Any, AsyncIterator, Iterable, List, Dict, Tuple
 import re
 import time
-from openai import APIConnectionError, RateLimitError, APIStatusError
-import httpx
-LLM_TIMEOUT_S = int(os.getenv("LLM_TIMEOUT", "25"))  # 25s hard limit
-
-# For Windows consoles with Arabic/Unicode text
-try:
-    sys.stdout.reconfigure(encoding="utf-8")
-except Exception:
-    pass
+from .cache import cache_key, get_cache
+from .stream_json import StreamingResultParser, replay_events
+from .ratelimit import INTERACTIVE, RateLimited, estimate_tokens, get_scheduler
+from .prompt import (
+    PROMPT_VERSION, RESPONSE_SCHEMA, SYSTEM_PROMPT, add_usage, build_messages, cached_tokens, record_usage,
+    response_format,
+)
+from .metrics import annotate, count_answer, count_error, count_schema_fixes, observe, span
+from .schema import AI_SCHEMA_REASK, AgentResult, Checked, Step, as_step, check_output, merge, reask_messages
+from .providers import get_async_client, get_client
+from .router import RoutePrediction, preroute
+from .similar import get_index
+from .cascade import AI_CASCADE_ENABLED, Cascade
+from .singleflight import AI_SINGLEFLIGHT_ENABLED, Abandoned, aprocess_lock, flights, process_lock
+from .hedge import hedge_create, hedger, hedging
+from .resilience import (
+    LLM_TIMEOUT_S, CircuitOpenError, RetryBudgetExhausted, acall_with_retries, call_with_retries, degraded_result,
+)
+
 # ---- helpers for fallback mapping ----
 
 _CMD_LINE_RE = re.compile(
@@ -48,9 +56,43 @@ _INLINE_CMD_PATTERNS = [
     re.compile(r"(cmd\s+/c\s+\S.+)", re.IGNORECASE),
 ]
 
+# Derived from _INLINE_CMD_PATTERNS so they stay in sync:
+#  - _ANY_INLINE_CMD_RE: one alternation, same answer as any(p.search(s) for p in patterns)
+#  - _INLINE_CMD_KEYWORDS: each pattern's leading literal. IGNORECASE patterns get no
+#    literal-prefix speedup in `re`, so a full findall tries every offset; instead we
+#    str.find() the keyword in the lowercased text and only try the pattern there.
+_ANY_INLINE_CMD_RE = re.compile("|".join(p.pattern for p in _INLINE_CMD_PATTERNS), re.IGNORECASE)
+_INLINE_CMD_KEYWORDS = [
+    (re.match(r"\(([A-Za-z]+)", p.pattern).group(1).lower(), p) for p in _INLINE_CMD_PATTERNS
+]
+# non-ASCII letters IGNORECASE matches against ASCII ones (U+0130 also lowercases to two
+# chars, shifting offsets); when present the keyword search can't be trusted
+_ODD_CASE_FOLD_RE = re.compile("[\u0130\u0131\u017f\u212a]")
+
 def _lines(s: str) -> List[str]:
     return [ln.rstrip("\r") for ln in (s or "").splitlines()]
 
+def _strip_prompt(s: str) -> str:
+    s = s.strip()
+    return s[1:].strip() if s.startswith("$") else s
+
+def _pattern_matches(code_raw: str) -> List[str]:
+    """Same matches, in the same order, as [m for p in _INLINE_CMD_PATTERNS for m in p.findall(code_raw)]."""
+    if not code_raw.isascii() and _ODD_CASE_FOLD_RE.search(code_raw):
+        return [m for p in _INLINE_CMD_PATTERNS for m in p.findall(code_raw)]
+    lowered = code_raw.lower()   # same length and offsets as code_raw here
+    out: List[str] = []
+    for kw, patt in _INLINE_CMD_KEYWORDS:
+        pos = lowered.find(kw)
+        while pos != -1:
+            m = patt.match(code_raw, pos)
+            if m:
+                out.append(m.group(1))
+                pos = lowered.find(kw, m.end())   # findall doesn't overlap its own matches
+            else:
+                pos = lowered.find(kw, pos + 1)
+    return out
+
 def _extract_commands_list(code_raw: str) -> List[str]:
     """Extract only real commands from a mixed code/prose block."""
     if not code_raw:
@@ -60,221 +102,630 @@ def _extract_commands_list(code_raw: str) -> List[str]:
     # triple blocks
     for block in _TRIPLE_BLOCK_RE.findall(code_raw):
         for ln in _lines(block):
-            s = ln.strip()
-            if not s:
-                continue
-            if s.startswith("$"):
-                s = s[1:].strip()
-            if _CMD_LINE_RE.match(s):
+            s = _strip_prompt(ln)
+            if s and _CMD_LINE_RE.match(s):
                 candidates.append(s)
 
     # inline backticks
     for inline in _INLINE_BT_RE.findall(code_raw):
-        s = inline.strip()
-        if s.startswith("$"):
-            s = s[1:].strip()
-        if _CMD_LINE_RE.match(s) or any(p.search(s) for p in _INLINE_CMD_PATTERNS):
+        s = _strip_prompt(inline)
+        if _CMD_LINE_RE.match(s) or _ANY_INLINE_CMD_RE.search(s):
             candidates.append(s)
 
     # patterns anywhere
-    for patt in _INLINE_CMD_PATTERNS:
-        for m in patt.findall(code_raw):
-            s = m.strip()
-            if s.startswith("$"):
-                s = s[1:].strip()
-            candidates.append(s)
+    candidates.extend(_strip_prompt(m) for m in _pattern_matches(code_raw))
 
     # whole-line commands
     for ln in _lines(code_raw):
-        s = ln.strip()
-        if s.startswith("$"):
-            s = s[1:].strip()
+        s = _strip_prompt(ln)
         if _CMD_LINE_RE.match(s):
             candidates.append(s)
 
-    # dedup
-    seen = set(); dedup: List[str] = []
-    for c in candidates:
-        if c not in seen:
-            seen.add(c); dedup.append(c)
-    return dedup
+    # dedup, first occurrence wins
+    return list(dict.fromkeys(candidates))
 
 _STOPWORDS = {
     "the","to","and","of","in","on","for","a","an","with","be","is","are","it","that","this","your","you",
     "if","then","by","as","from","using","use","run","running","check","open","ensure","make","sure"
 }
 
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+_BONUS_TOKENS = ("version", "install")
+
 def _tokens(s: str) -> List[str]:
-    return [t for t in re.findall(r"[a-z0-9_]+", (s or "").lower()) if t not in _STOPWORDS]
+    return [t for t in _TOKEN_RE.findall((s or "").lower()) if t not in _STOPWORDS]
+
+@functools.lru_cache(maxsize=8192)
+def _token_set(s: str) -> frozenset:
+    # step/command texts repeat a lot across stored answers; tokenize each once
+    return frozenset(_tokens(s))
+
+
+class StepMatcher:
+    """
+    Scores commands against a fixed list of step texts.
+    Step token sets and an inverted index (token -> step indexes) are built once,
+    so each command only touches the steps it shares a token with. Same score as
+    before: overlap / min(len) + 0.25 per shared "version"/"install", kept when
+    >= 0.25, ties going to the lowest step index.
+    """
+    __slots__ = ("_sizes", "_postings")
+
+    def __init__(self, steps_texts: List[str]):
+        self._sizes: List[int] = []
+        self._postings: Dict[str, List[int]] = {}
+        for i, text in enumerate(steps_texts):
+            stoks = _token_set(text)
+            self._sizes.append(len(stoks))
+            for t in stoks:
+                self._postings.setdefault(t, []).append(i)
+
+    def best(self, cmd: str) -> int | None:
+        ctoks = _token_set(cmd)
+        if not ctoks:
+            return None
+        overlap: Dict[int, int] = {}
+        for t in ctoks:
+            for i in self._postings.get(t, ()):
+                overlap[i] = overlap.get(i, 0) + 1
+        if not overlap:
+            return None
+        bonus_steps = set()
+        for t in _BONUS_TOKENS:
+            if t in ctoks:
+                bonus_steps.update(self._postings.get(t, ()))
+        n = len(ctoks)
+        best_i, best_score = None, 0.0
+        for i in sorted(overlap):
+            score = overlap[i] / min(n, self._sizes[i])
+            if i in bonus_steps:
+                score += 0.25
+            if score > best_score:
+                best_i, best_score = i, score
+        return best_i if best_score >= 0.25 else None
+
+    def match(self, cmds: List[str]) -> List[int | None]:
+        return [self.best(c) for c in cmds]
+
 
 def _best_step_idx_for_cmd(cmd: str, steps_texts: List[str]) -> int | None:
     """Attach command to the most similar step; return None if low confidence."""
-    ctoks = set(_tokens(cmd))
-    if not ctoks:
-        return None
-    best_i, best_score = None, 0.0
-    for i, step in enumerate(steps_texts):
-        stoks = set(_tokens(step))
-        if not stoks:
-            continue
-        inter = len(ctoks & stoks)
-        score = inter / max(1, min(len(ctoks), len(stoks)))
-        if ("version" in ctoks and "version" in stoks) or ("install" in ctoks and "install" in stoks):
-            score += 0.25
-        if score > best_score:
-            best_i, best_score = i, score
-    return best_i if (best_i is not None and best_score >= 0.25) else None
+    return StepMatcher(steps_texts).best(cmd)
 
 
 # ==============================================
-# 1) Load API key from .env
+# 1) LLM client: built lazily by providers.py (AI_PROVIDER), nothing at import
 # ==============================================
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("OPENAI_API_KEY not found in .env")
+def __getattr__(name: str) -> Any:
+    # `complaint_agent.client` still works for older callers
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-client = OpenAI(api_key=api_key)
-print("OpenAI Key loaded:", True)
+def _error_result(exc: Exception) -> dict[str, Any]:
+    from openai import OpenAIError   # imported on the error path only (see providers.py)
+    count_error("error")
+    if isinstance(exc, OpenAIError):
+        return {"error": f"OpenAI API error: {str(exc)}", "raw": ""}
+    return {"error": f"Unexpected error: {str(exc)}", "raw": ""}
 
 # ==============================================
-# 2) JSON schema (as text) + strict system rules
+# 2) Prompt (static system prefix + schema) lives in prompt.py
+# 3) Agent function
 # ==============================================
-SYSTEM_PROMPT = (
-    "You are an AI teaching assistant for a student helpdesk. "
-    "Return STRICT JSON ONLY (no markdown, no extra text). "
-    "Follow the JSON schema exactly (keys, types, names). "
-    "Guidelines:\n"
-    "- If the complaint is NON-TECHNICAL: set routing.is_technical=false and steps_to_apply must be []. "
-    "  Do NOT output any steps or commands.\n"
-    "- If the complaint is TECHNICAL: produce BETWEEN 3 AND 6 steps. "
-    "  Each step must be ONE clear action. "
-    "  If a step requires any terminal/CLI command, ALWAYS include those commands in step.commands "
-    "(one command per line, no numbering, no prose). "
-    "  If a step is GUI-only (e.g., menu clicks), leave step.commands as [].\n"
-    "- Put commands under the matching step; do not dump them all in solution.code. "
-    "  Use solution.code only if you must provide a full block and cannot map commands to steps.\n"
-    "- Keep 'summary' short and helpful. Keep 'verification_checklist' concrete.\n"
-    "- Use plain ASCII quotes. Return ONLY the JSON object—no fences or commentary."
-)
+def _request_kwargs(student_complaint: str, *, model: str, max_tokens: int,
+                    hint: RoutePrediction | None = None) -> dict[str, Any]:
+    """Arguments for chat.completions.create, shared by the sync and async paths."""
+    return dict(
+        model=model,
+        temperature=0,
+        max_tokens=max_tokens,
+        response_format=response_format(),
+        messages=build_messages(student_complaint, model=model, hint=hint),
+        # overall budget; the retry layer narrows it per attempt
+        timeout=LLM_TIMEOUT_S,
+    )
+
+
+class _Memo:
+    """
+    Everything that can answer a complaint without the LLM, for one ai_agent call:
+    exact-match cache -> local pre-router -> similar past answer. use_cache=False
+    bypasses the cache and the similarity index (the router still applies).
+    The async entry points go through alocal_answer() / astore(): every tier
+    can block (SQLite / Redis, the index file and its lock), so they run in a
+    worker thread instead of on the event loop.
+    """
+
+    def __init__(self, student_complaint: str, *, model: str, max_tokens: int, use_cache: bool):
+        self.text = student_complaint
+        self.use_cache = use_cache
+        self.cache = None   # resolved by local_answer(): the first get_index() loads numpy and the index file
+        self.index = None
+        # also the prompt hash reported through `info` (AIRecord.prompt_hash)
+        self.key = cache_key(student_complaint, model=model, max_tokens=max_tokens, prompt_version=PROMPT_VERSION)
+        self.tag = f"{model}:{max_tokens}:{PROMPT_VERSION}"
+        self.source = "llm"
+        self.started = time.monotonic()
+
+    def local_answer(self) -> Tuple[dict[str, Any] | None, RoutePrediction | None]:
+        """Returns (answer, None) when no LLM call is needed, else (None, routing hint)."""
+        if self.use_cache:
+            self.cache, self.index = get_cache(), get_index()
+        if self.cache is not None:
+            cached = self.cache.get(self.key)
+            if cached is not None:
+                self.source = "cache"
+                return cached, None
+        # confidently non-technical complaints are answered by the local router
+        local, hint = preroute(self.text)
+        if local is not None:
+            self.source = "router"
+            return local, None
+        if self.index is not None:
+            hit = self.index.lookup(self.text, self.tag)
+            if hit is not None:
+                if self.cache is not None:
+                    self.cache.set(self.key, hit[0])
+                self.source = "similar"
+                return hit[0], None
+        return None, hint
+
+    async def alocal_answer(self) -> Tuple[dict[str, Any] | None, RoutePrediction | None]:
+        """local_answer() in a worker thread."""
+        return await asyncio.to_thread(self.local_answer)
+
+    def report(self, info: dict[str, Any] | None, usage: Any = None) -> None:
+        """Fill the caller's `info` dict: where the answer came from, token usage, latency."""
+        record_usage(usage)
+        count_answer(self.source)
+        fields = dict(
+            source=self.source,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            cached_prompt_tokens=cached_tokens(usage),
+            completion_tokens=getattr(usage, "completion_tokens", None),
+        )
+        annotate(**fields)
+        if info is None:
+            return
+        info.update(
+            fields,
+            prompt_hash=self.key,
+            prompt_version=PROMPT_VERSION,
+            latency_ms=int((time.monotonic() - self.started) * 1000),
+        )
+
+    def store(self, parsed: Any) -> Any:
+        if isinstance(parsed, dict):
+            with span("store"):
+                if self.cache is not None:
+                    self.cache.set(self.key, parsed)
+                if self.index is not None:
+                    self.index.add(self.text, self.tag, parsed)
+        return parsed
+
+    async def astore(self, parsed: Any) -> Any:
+        """store() in a worker thread, for the async entry points."""
+        return await asyncio.to_thread(self.store, parsed)
+
+
+def _acquire_quota(kwargs: dict[str, Any], priority: int) -> None:
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        scheduler.acquire(estimate_tokens(kwargs["messages"], kwargs["max_tokens"]), priority=priority)
+
+
+async def _aacquire_quota(kwargs: dict[str, Any], priority: int) -> None:
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        await scheduler.aacquire(estimate_tokens(kwargs["messages"], kwargs["max_tokens"]), priority=priority)
+
+
+def _complete(kwargs: dict[str, Any], priority: int) -> Any:
+    """chat.completions.create(**kwargs) through the retry layer; hedged (hedge.py) when enabled for `priority`."""
+    create = get_client().chat.completions.create
+    if not hedging(priority):
+        return call_with_retries(lambda timeout: create(**{**kwargs, "timeout": timeout}))
+    backup = hedge_create()
+    return call_with_retries(lambda timeout: hedger.call(create, kwargs, timeout, hedge_create=backup))
+
+
+async def _acomplete(kwargs: dict[str, Any], priority: int) -> Any:
+    create = get_async_client().chat.completions.create
+    if not hedging(priority):
+        return await acall_with_retries(lambda timeout: create(**{**kwargs, "timeout": timeout}))
+    backup = hedge_create(async_=True)
+    return await acall_with_retries(lambda timeout: hedger.acall(create, kwargs, timeout, hedge_create=backup))
+
 
-# ===== JSON schema the model must follow =====
-RESPONSE_SCHEMA = r"""
-Return a SINGLE JSON object that matches EXACTLY this schema:
-
-{
-  "routing": {
-    "is_technical": true,
-    "category": "coding_bug | coding_how_to | dev_env_tooling | data_ml_dl | sys_networks | theory_concept | other_technical | non_technical",
-    "confidence": 0.0
-  },
-  "summary": "Short explanation for the student.",
-  "steps_to_apply": [
-    {
-      "text": "One clear action for this step.",
-      "commands": ["optional terminal/CLI commands for THIS step (0..N), one per line, no prose"]
+def _reask_kwargs(kwargs: dict[str, Any], checked: Checked, resp: Any) -> dict[str, Any]:
+    """A follow-up asking only for the fields check_output() could not repair (schema.py)."""
+    return {
+        **kwargs,
+        "messages": reask_messages(kwargs["messages"], checked, resp.choices[0].message.content),
+        "response_format": {"type": "json_object"},   # a subset of the keys: strict json_schema would reject it
     }
-  ],
-  "verification_checklist": ["bullet checks the student can validate"],
-  "requests_for_more_info": ["0..3 questions for the student, or [] if not needed"],
-  "solution": {
-    "code_language": "bash | python | text | null",
-    "code": "OPTIONAL: full code/commands block ONLY IF absolutely needed (prefer step.commands)."
-  }
-}
 
-Rules:
-- Non-technical -> routing.is_technical=false AND steps_to_apply=[]
-- Technical -> 3..6 steps, one action per step. If a step needs a command, put it in step.commands.
-- No markdown, no backticks around the whole JSON, no commentary—JSON only.
-"""
-# ==============================================
-# 3) Agent function
-# ==============================================
-def ai_agent(student_complaint: str, *,model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000) -> dict[str, Any]:
+
+def _answer(checked: Checked, info: dict[str, Any] | None, reasked: List[str] | None = None) -> dict[str, Any]:
+    """The normalized dict for a checked reply; raises when nothing usable came back."""
+    if checked.result is None:
+        raise ValueError("the model did not return a JSON object")
+    count_schema_fixes(checked.repairs)
+    if reasked:
+        count_schema_fixes(["reask"])
+    if info is not None:
+        info.update(schema_repairs=checked.repairs, reasked=reasked)
+    return checked.result.to_dict()
+
+
+def _cascade_report(memo: _Memo, plan: Cascade, info: dict[str, Any] | None) -> None:
+    count_schema_fixes(plan.repairs)
+    memo.report(info, plan.usage())
+    summary = plan.summary()
+    annotate(tier=summary["tier"], cost_usd=summary["cost_usd"])
+    if info is not None:
+        info.update(summary)
+
+
+def _cascade_done(memo: _Memo, plan: Cascade, info: dict[str, Any] | None) -> dict[str, Any]:
+    _cascade_report(memo, plan, info)
+    return memo.store(plan.result)
+
+
+async def _acascade_done(memo: _Memo, plan: Cascade, info: dict[str, Any] | None) -> dict[str, Any]:
+    _cascade_report(memo, plan, info)
+    return await memo.astore(plan.result)
+
+
+def _cascade(memo: _Memo, hint: RoutePrediction | None, priority: int, info: dict[str, Any] | None) -> dict[str, Any]:
+    """The LLM part of ai_agent() as a model cascade (cascade.py)."""
+    plan = Cascade(memo.text, hint)
+    tier = plan.first()
+    while tier is not None:
+        with span("build_prompt"):
+            kwargs = plan.request(tier)
+        t0 = time.perf_counter()
+        try:
+            with span("quota_wait"):
+                _acquire_quota(kwargs, priority)
+            with span(f"llm_{tier.name}"):
+                resp = _complete(kwargs, priority)
+        except Exception:
+            if plan.failed(tier, time.perf_counter() - t0) is None:   # no usable cheap answer to fall back on
+                raise
+            break
+        tier = plan.advance(tier, resp, time.perf_counter() - t0)
+    return _cascade_done(memo, plan, info)
+
+
+async def _acascade(memo: _Memo, hint: RoutePrediction | None, priority: int,
+                    info: dict[str, Any] | None) -> dict[str, Any]:
+    plan = Cascade(memo.text, hint)
+    tier = plan.first()
+    while tier is not None:
+        with span("build_prompt"):
+            kwargs = plan.request(tier)
+        t0 = time.perf_counter()
+        try:
+            with span("quota_wait"):
+                await _aacquire_quota(kwargs, priority)
+            with span(f"llm_{tier.name}"):
+                resp = await _acomplete(kwargs, priority)
+        except Exception:
+            if plan.failed(tier, time.perf_counter() - t0) is None:
+                raise
+            break
+        tier = plan.advance(tier, resp, time.perf_counter() - t0)
+    return await _acascade_done(memo, plan, info)
+
+
+def _ai_agent(student_complaint: str, *, model: str, max_tokens: int, use_cache: bool, priority: int,
+              cascade: bool, info: dict[str, Any] | None) -> dict[str, Any]:
+    memo = _Memo(student_complaint, model=model, max_tokens=max_tokens, use_cache=use_cache)
+    with span("local_answer"):   # cache -> router -> similar
+        local, hint = memo.local_answer()
+    if local is not None:
+        memo.report(info)
+        return local
+
+    try:
+        if cascade:
+            return _cascade(memo, hint, priority, info)
+        with span("build_prompt"):
+            kwargs = _request_kwargs(student_complaint, model=model, max_tokens=max_tokens, hint=hint)
+        with span("quota_wait"):
+            _acquire_quota(kwargs, priority)
+        with span("llm"):
+            resp = _complete(kwargs, priority)
+        with span("parse_json"):
+            checked = check_output(resp.choices[0].message.content)
+        usage, reasked = resp.usage, None
+        if checked.failed and AI_SCHEMA_REASK:
+            reasked = list(checked.failed)
+            try:
+                with span("reask"):
+                    again = _complete(_reask_kwargs(kwargs, checked, resp), priority)
+            except Exception:
+                if checked.result is None:
+                    raise
+            else:
+                checked = merge(checked, again.choices[0].message.content)
+                usage = add_usage(usage, again.usage)
+        memo.report(info, usage)
+        return memo.store(_answer(checked, info, reasked))
+
+    except (CircuitOpenError, RetryBudgetExhausted, RateLimited) as unavailable:
+        count_error("unavailable")
+        return degraded_result(unavailable)
+    except Exception as e:
+        return _error_result(e)
+
+
+async def _ai_agent_async(student_complaint: str, *, model: str, max_tokens: int, use_cache: bool, priority: int,
+                          cascade: bool, info: dict[str, Any] | None) -> dict[str, Any]:
+    memo = _Memo(student_complaint, model=model, max_tokens=max_tokens, use_cache=use_cache)
+    with span("local_answer"):   # cache -> router -> similar
+        local, hint = await memo.alocal_answer()
+    if local is not None:
+        memo.report(info)
+        return local
+
+    try:
+        if cascade:
+            return await _acascade(memo, hint, priority, info)
+        with span("build_prompt"):
+            kwargs = _request_kwargs(student_complaint, model=model, max_tokens=max_tokens, hint=hint)
+        with span("quota_wait"):
+            await _aacquire_quota(kwargs, priority)
+        with span("llm"):
+            resp = await _acomplete(kwargs, priority)
+        with span("parse_json"):
+            checked = check_output(resp.choices[0].message.content)
+        usage, reasked = resp.usage, None
+        if checked.failed and AI_SCHEMA_REASK:
+            reasked = list(checked.failed)
+            try:
+                with span("reask"):
+                    again = await _acomplete(_reask_kwargs(kwargs, checked, resp), priority)
+            except Exception:
+                if checked.result is None:
+                    raise
+            else:
+                checked = merge(checked, again.choices[0].message.content)
+                usage = add_usage(usage, again.usage)
+        memo.report(info, usage)
+        return await memo.astore(_answer(checked, info, reasked))
+
+    except (CircuitOpenError, RetryBudgetExhausted, RateLimited) as unavailable:
+        count_error("unavailable")
+        return degraded_result(unavailable)
+    except Exception as e:
+        return _error_result(e)
+
+
+def _flight_key(student_complaint: str, *, model: str, max_tokens: int, use_cache: bool, cascade: bool) -> str:
+    # use_cache=False callers must not be handed a cached answer by a leader that had one
+    key = cache_key(student_complaint, model=model, max_tokens=max_tokens, prompt_version=PROMPT_VERSION)
+    return key + (":cascade" if cascade else "") + ("" if use_cache else ":fresh")
+
+
+def _shared_answer(result: dict[str, Any], leader_info: dict[str, Any], info: dict[str, Any] | None,
+                   started: float) -> dict[str, Any]:
+    """A waiter's copy of the leader's answer; its tokens were billed to the leader."""
+    observe("coalesced_wait", time.monotonic() - started)
+    if "error" not in result:
+        count_answer("coalesced")
+        annotate(source="coalesced")
+    if info is not None:
+        info.update(
+            copy.deepcopy(leader_info), source="coalesced", prompt_tokens=None, cached_prompt_tokens=None, completion_tokens=None,
+            latency_ms=int((time.monotonic() - started) * 1000),
+        )
+    return copy.deepcopy(result)   # callers may mutate their answer
+
+
+def _wait_expired(exc: TimeoutError) -> dict[str, Any]:
+    count_error("unavailable")
+    return degraded_result(exc)
+
+
+def ai_agent(student_complaint: str, *,model: str = "gpt-4o-mini", temperature: float = 0.0, max_tokens: int = 1000,
+             use_cache: bool = True, priority: int = INTERACTIVE, cascade: bool | None = None,
+             info: dict[str, Any] | None = None) -> dict[str, Any]:
     """
     Takes a student's complaint and returns a structured JSON dict.
+    Successful answers are cached (see cache.py); pass use_cache=False to force a fresh call.
+    `priority` orders the call in the rate limiter queue (ratelimit.INTERACTIVE / BATCH).
+    Pass a dict as `info` to get source / prompt_hash / token usage / latency_ms back.
+    Identical complaints in flight at the same time share one call (singleflight.py).
+    cascade=True (default: AI_CASCADE) replaces the single `model` call with the
+    route -> cheap -> strong tiers of cascade.py; `info` then also gets the tiers.
     """
-    
+    cascade = AI_CASCADE_ENABLED if cascade is None else cascade
+    args = dict(model=model, max_tokens=max_tokens, use_cache=use_cache, priority=priority, cascade=cascade)
+    if not AI_SINGLEFLIGHT_ENABLED:
+        return _ai_agent(student_complaint, info=info, **args)
+    key = _flight_key(student_complaint, model=model, max_tokens=max_tokens, use_cache=use_cache, cascade=cascade)
+    started = time.monotonic()
+
+    def call() -> Tuple[dict[str, Any], dict[str, Any]]:
+        # the leader's info travels with the result: waiters only see what the shared future holds
+        leader_info: dict[str, Any] = {}
+        if not use_cache:
+            return _ai_agent(student_complaint, info=leader_info, **args), leader_info
+        with process_lock(key):   # another process answering the same complaint fills the shared cache
+            return _ai_agent(student_complaint, info=leader_info, **args), leader_info
+
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            temperature=0,             
-            max_tokens=max_tokens,
-            # Forces the model to emit a single JSON object (no prose)
-            response_format={"type": "json_object"},
-            messages= [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"{RESPONSE_SCHEMA}\n\nStudent complaint:\n{student_complaint}"},
-                ],
-            # request lower latency
-            timeout=30,
-        )
-        raw = resp.choices[0].message.content
-        parsed = json.loads(raw)
-        return parsed
+        (result, leader_info), shared = flights.do(key, call)
+    except Abandoned:
+        return _ai_agent(student_complaint, info=info, **args)
+    except TimeoutError as waited_too_long:
+        return _wait_expired(waited_too_long)
+    if shared:
+        return _shared_answer(result, leader_info, info, started)
+    if info is not None:
+        info.update(leader_info)
+    return result
+
+
+async def ai_agent_async(student_complaint: str, *, model: str = "gpt-4o-mini", temperature: float = 0.0,
+                         max_tokens: int = 1000, use_cache: bool = True, priority: int = INTERACTIVE,
+                         cascade: bool | None = None, info: dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Same contract as ai_agent(), but awaits the call on AsyncOpenAI so one
+    ASGI process can hold many in-flight completions without a thread each.
+    """
+    cascade = AI_CASCADE_ENABLED if cascade is None else cascade
+    args = dict(model=model, max_tokens=max_tokens, use_cache=use_cache, priority=priority, cascade=cascade)
+    if not AI_SINGLEFLIGHT_ENABLED:
+        return await _ai_agent_async(student_complaint, info=info, **args)
+    key = _flight_key(student_complaint, model=model, max_tokens=max_tokens, use_cache=use_cache, cascade=cascade)
+    started = time.monotonic()
+
+    async def call() -> Tuple[dict[str, Any], dict[str, Any]]:
+        leader_info: dict[str, Any] = {}
+        if not use_cache:
+            return await _ai_agent_async(student_complaint, info=leader_info, **args), leader_info
+        async with aprocess_lock(key):
+            return await _ai_agent_async(student_complaint, info=leader_info, **args), leader_info
 
-    except OpenAIError as api_err:
-        return {"error": f"OpenAI API error: {str(api_err)}", "raw": ""}
+    try:
+        (result, leader_info), shared = await flights.ado(key, call)
+    except Abandoned:
+        return await _ai_agent_async(student_complaint, info=info, **args)
+    except TimeoutError as waited_too_long:
+        return _wait_expired(waited_too_long)
+    if shared:
+        return _shared_answer(result, leader_info, info, started)
+    if info is not None:
+        info.update(leader_info)
+    return result
+
+
+async def ai_agent_stream_async(student_complaint: str, *, model: str = "gpt-4o-mini", max_tokens: int = 1000,
+                                use_cache: bool = True, priority: int = INTERACTIVE,
+                                info: dict[str, Any] | None = None) -> AsyncIterator[Tuple[Any, ...]]:
+    """
+    Streams the completion and yields events as soon as they are syntactically complete:
+      ("field", key, value)   a finished top-level field (routing, summary, ...)
+      ("step", index, step)   a finished element of steps_to_apply
+      ("done", result)        the full dict, same shape as ai_agent() (may contain "error")
+    `info` is filled before the "done" event.
+    """
+    memo = _Memo(student_complaint, model=model, max_tokens=max_tokens, use_cache=use_cache)
+    with span("local_answer"):   # cache -> router -> similar
+        local, hint = await memo.alocal_answer()
+    if local is not None:
+        # cache hits and local answers are replayed as if they had been streamed
+        for event in replay_events(local):
+            yield event
+        memo.report(info)
+        yield ("done", local)
+        return
+
+    parser = StreamingResultParser()
+    try:
+        with span("build_prompt"):
+            kwargs = _request_kwargs(student_complaint, model=model, max_tokens=max_tokens, hint=hint)
+        with span("quota_wait"):
+            await _aacquire_quota(kwargs, priority)
+        aclient = get_async_client()
+        opened = time.perf_counter()
+        # only opening the stream is retried; a stream that breaks midway is reported as an error
+        stream = await acall_with_retries(
+            lambda timeout: aclient.chat.completions.create(
+                **{**kwargs, "timeout": timeout}, stream=True, stream_options={"include_usage": True},
+            )
+        )
+        usage = None
+        first = True
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage   # final chunk, no choices
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first:
+                    observe("llm_first_token", time.perf_counter() - opened)
+                    first = False
+                for event in parser.feed(delta):
+                    yield event
+        # includes the time the consumer spent on the yielded events
+        observe("llm", time.perf_counter() - opened)
+        memo.report(info, usage)
+        with span("parse_json"):
+            checked = check_output(parser.text)
+        # no re-ask here: the events are out already
+        result = await memo.astore(_answer(checked, info))
+    except (CircuitOpenError, RetryBudgetExhausted, RateLimited) as unavailable:
+        count_error("unavailable")
+        result = degraded_result(unavailable)
     except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}", "raw": ""}
+        result = _error_result(e)
+    yield ("done", result)
 
 
 # ---- 4) Main Shaping in UI
 
 
-def for_frontend(agent_result: dict[str, Any]) -> dict[str, Any]:
+def shape_step(step: Step | Dict[str, Any] | str) -> str:
+    """Merge a step's commands inline for the UI (also used per step when streaming)."""
+    step = as_step(step) or Step("")
+    text = step.text
+    cmds = [c.strip() for c in step.commands if c and c.strip()]
+    if not cmds:
+        return text
+    joined = "; ".join(f"`{c}`" for c in cmds)
+    if text.lower().startswith("run the following commands/code"):
+        # render as a separate final code block later (UI already supports CODE_PREFIX)
+        return "Run the following commands/code:\n" + "\n".join(cmds)
+    if text.endswith("."):
+        return text[:-1] + f" by running {joined}."
+    return text + f" by running {joined}."
+
+
+def for_frontend(agent_result: dict[str, Any], *, compact: bool = False) -> dict[str, Any]:
     """
     Shapes the model JSON for the UI:
       - Non-technical: hide details; UI will offer Open Ticket
       - Technical: inline each step's commands
         and, if the model dumped commands in solution.code, attach them to the most relevant step.
       - Verify stays separate. Unmatched commands (rare) go to a final code step.
+    Stored answers from before schema.py are repaired on the way (AgentResult.from_dict).
+    compact=True (what the views send unless ?debug=1) leaves out ticket_prefill, which only
+    repeats summary and steps, and every empty field; the page treats a missing field as empty.
     """
     if "error" in agent_result:
         return {"status": "error", "message": agent_result["error"]}
 
-    routing = agent_result.get("routing") or {}
-    is_technical = bool(routing.get("is_technical", True))
-    category = routing.get("category")
-    summary = agent_result.get("summary", "")
-    verify = list(agent_result.get("verification_checklist") or [])
-    ask_more = list(agent_result.get("requests_for_more_info") or [])
-    steps_in: List[Dict[str, Any]] = list(agent_result.get("steps_to_apply") or [])
-    sol = agent_result.get("solution") or {}
-    code_raw = (sol.get("code") or "").strip()
+    result = AgentResult.from_dict(agent_result)   # fresh objects: safe to extend below
+    routing = result.routing
+    is_technical = routing.is_technical
+    category = routing.category
+    summary = result.summary
+    steps_in = result.steps_to_apply
+    sol = result.solution
+    code_raw = sol.code.strip()
 
     # ---- fallback: if solution.code has commands and some steps lack commands, try to attach them
     if code_raw:
         cmds = _extract_commands_list(code_raw)
         if cmds:
-            steps_texts = [ (s.get("text") or "") for s in steps_in ]
-            for cmd in cmds:
-                idx = _best_step_idx_for_cmd(cmd, steps_texts)
+            matcher = StepMatcher([s.text for s in steps_in])
+            for cmd, idx in zip(cmds, matcher.match(cmds)):
                 if idx is not None:
-                    steps_in[idx].setdefault("commands", [])
                     # avoid duplicates
-                    if cmd not in steps_in[idx]["commands"]:
-                        steps_in[idx]["commands"].append(cmd)
+                    if cmd not in steps_in[idx].commands:
+                        steps_in[idx].commands.append(cmd)
                 else:
                     # if nothing matches, append as an extra step at the end
-                    steps_in.append({"text": "Run the following commands/code:", "commands": [cmd]})
-
-    # ---- merge commands inline for UI
-    def _merge_step(step: Dict[str, Any]) -> str:
-        text = (step.get("text") or "").strip()
-        cmds = [c.strip() for c in (step.get("commands") or []) if c and c.strip()]
-        if not cmds:
-            return text
-        joined = "; ".join(f"`{c}`" for c in cmds)
-        if text.lower().startswith("run the following commands/code"):
-            # render as a separate final code block later (UI already supports CODE_PREFIX)
-            return "Run the following commands/code:\n" + "\n".join(cmds)
-        if text.endswith("."):
-            return text[:-1] + f" by running {joined}."
-        return text + f" by running {joined}."
-
-    steps_out: List[str] = [_merge_step(s) for s in steps_in if (s.get("text") or "").strip()]
+                    steps_in.append(Step("Run the following commands/code:", [cmd]))
+
+    steps_out: List[str] = [shape_step(s) for s in steps_in if s.text.strip()]
 
     ui = {
         "status": "ok",
@@ -282,10 +733,10 @@ def for_frontend(agent_result: dict[str, Any]) -> dict[str, Any]:
         "category": category,
         "summary": summary,
         "steps": steps_out,
-        "verify": verify,
-        "ask_more": ask_more,
-        "code_language": sol.get("code_language"),
-        "code": code_raw or "",
+        "verify": result.verification_checklist,
+        "ask_more": result.requests_for_more_info,
+        "code_language": sol.code_language,
+        "code": code_raw,
         "ticket_prefill": (
             f"[AI Routing] type={'technical' if is_technical else 'non-technical'}; "
             f"category={category or 'unknown'}\n"
@@ -301,4 +752,12 @@ def for_frontend(agent_result: dict[str, Any]) -> dict[str, Any]:
         ui["code_language"] = None
         ui["code"] = None
 
+    if compact:
+        del ui["ticket_prefill"]
+        return {k: v for k, v in ui.items() if v not in (None, "", [])}
     return ui
+
+
+def for_frontend_many(agent_results: Iterable[dict[str, Any]], *, compact: bool = False) -> List[dict[str, Any]]:
+    """for_frontend() over many stored results, e.g. re-rendering archived answers after a UI change."""
+    return [for_frontend(r, compact=compact) for r in agent_results]
@@ -0,0 +1,175 @@
+# ==============================================
+# Golden complaint set for `manage.py eval_agent`
+# ==============================================
+# Hand-labelled complaints (technical and non-technical, English and Arabic)
+# with what a correct answer must get right: the routing and, for fixes that
+# need a terminal, at least one command. Any edit to GOLDEN (a new complaint,
+# a relabel) bumps GOLDEN_VERSION, so reports from different sets are never
+# compared by accident; the report also carries golden_fingerprint(), which
+# changes with the content even when the bump was forgotten.
+# A set kept elsewhere is read from JSONL with the same fields (load_golden).
+from __future__ import annotations
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from .prompt import CATEGORIES
+
+GOLDEN_VERSION = "v1"
+
+
+@dataclass(frozen=True)
+class GoldenComplaint:
+    id: str
+    lang: str                       # "en" / "ar"
+    text: str
+    is_technical: bool
+    categories: Tuple[str, ...]     # acceptable routing.category values
+    needs_commands: bool = False    # the fix is run in a terminal: the answer must carry a command
+
+
+def _g(id, lang, text, is_technical, categories, needs_commands=False):
+    return GoldenComplaint(id, lang, text, is_technical, tuple(categories), needs_commands)
+
+
+GOLDEN: List[GoldenComplaint] = [
+    # ---- English, technical
+    _g("en-env-module", "en",
+       "ModuleNotFoundError: No module named 'requests' when I run my script from VS Code, "
+       "but pip says it is already installed.",
+       True, ["dev_env_tooling", "coding_bug"], True),
+    _g("en-git-push", "en",
+       "git push says 'rejected: non-fast-forward' after my teammate pushed to main. How do I upload my work?",
+       True, ["dev_env_tooling"], True),
+    _g("en-pip-msvc", "en",
+       "pip install fails with 'error: Microsoft Visual C++ 14.0 or greater is required' on Windows 11.",
+       True, ["dev_env_tooling"], True),
+    _g("en-port-in-use", "en",
+       "python manage.py runserver prints 'Error: That port is already in use.' and exits.",
+       True, ["dev_env_tooling", "sys_networks"], True),
+    _g("en-ssh-publickey", "en",
+       "Cloning the course repo over SSH gives 'Permission denied (publickey). fatal: Could not read from "
+       "remote repository.'",
+       True, ["dev_env_tooling", "sys_networks"], True),
+    _g("en-returns-none", "en",
+       "My function returns None instead of the sum:\n\ndef add(a, b):\n    print(a + b)\n\ntotal = add(2, 3)",
+       True, ["coding_bug"]),
+    _g("en-csv-howto", "en",
+       "How do I read a CSV file into a list of dictionaries in Python without pandas?",
+       True, ["coding_how_to"]),
+    _g("en-index-error", "en",
+       "Traceback (most recent call last):\n  File \"grades.py\", line 7, in <module>\n    print(xs[i])\n"
+       "IndexError: list index out of range\n\nThe loop is `for i in range(len(xs) + 1):`",
+       True, ["coding_bug"]),
+    _g("en-cuda-oom", "en",
+       "RuntimeError: CUDA out of memory when training ResNet50 with batch size 128 on the lab GPU.",
+       True, ["data_ml_dl"]),
+    _g("en-tcp-udp", "en",
+       "What is the difference between TCP and UDP? I have the networks exam tomorrow.",
+       True, ["theory_concept", "sys_networks"]),
+    _g("en-docker-db", "en",
+       "From inside my Docker container the app can't reach Postgres: 'connection refused' on 127.0.0.1:5432, "
+       "but psql works on the host.",
+       True, ["sys_networks", "dev_env_tooling"], True),
+    _g("en-conda-powershell", "en",
+       "conda activate does nothing in PowerShell, the prompt never shows (base).",
+       True, ["dev_env_tooling"], True),
+    # ---- English, non-technical
+    _g("en-grade-missing", "en",
+       "I can't see my grade for assignment 2 on the portal, it was due two weeks ago.",
+       False, ["non_technical"]),
+    _g("en-switch-section", "en",
+       "Can I switch from the Tuesday lab section to the Thursday one?",
+       False, ["non_technical"]),
+    _g("en-makeup-exam", "en",
+       "I was sick and missed the midterm. How do I request a makeup exam?",
+       False, ["non_technical"]),
+    _g("en-office-hours", "en",
+       "Who is the TA for section 3 and when are their office hours?",
+       False, ["non_technical"]),
+    _g("en-extension", "en",
+       "Could I get a three-day extension on the final project? I have two other deadlines that week.",
+       False, ["non_technical"]),
+    # ---- Arabic, technical
+    _g("ar-env-module", "ar",
+       "عند تشغيل السكربت يظهر الخطأ ModuleNotFoundError: No module named 'numpy' رغم أنني ثبّتها باستخدام pip.",
+       True, ["dev_env_tooling", "coding_bug"], True),
+    _g("ar-git-push", "ar",
+       "لا أستطيع عمل git push، تظهر رسالة rejected non-fast-forward بعد أن رفع زميلي تعديلاته.",
+       True, ["dev_env_tooling"], True),
+    _g("ar-jupyter-kernel", "ar",
+       "الـ kernel في Jupyter يتوقف كل مرة أحمّل فيها ملف CSV كبيراً باستخدام pandas.",
+       True, ["data_ml_dl", "dev_env_tooling"]),
+    _g("ar-reverse-string", "ar",
+       "كيف أكتب دالة في بايثون تعكس سلسلة نصية دون استخدام [::-1]؟",
+       True, ["coding_how_to"]),
+    _g("ar-segfault", "ar",
+       "برنامجي بلغة C++ يعطي Segmentation fault عند الوصول إلى عناصر المصفوفة داخل الحلقة.",
+       True, ["coding_bug"]),
+    _g("ar-ssh-timeout", "ar",
+       "لا أستطيع الاتصال بخادم المختبر عبر SSH، تظهر رسالة Connection timed out.",
+       True, ["sys_networks", "dev_env_tooling"], True),
+    _g("ar-process-thread", "ar",
+       "ما الفرق بين العملية (process) والخيط (thread) في أنظمة التشغيل؟",
+       True, ["theory_concept"]),
+    _g("ar-overfitting", "ar",
+       "دقة نموذج الشبكة العصبية على بيانات التدريب 99% لكن على بيانات الاختبار 55%، ماذا أفعل؟",
+       True, ["data_ml_dl"]),
+    # ---- Arabic, non-technical
+    _g("ar-grade-missing", "ar",
+       "لم تظهر درجتي في الواجب الثالث على البوابة حتى الآن.",
+       False, ["non_technical"]),
+    _g("ar-deadline", "ar",
+       "أريد تأجيل موعد تسليم المشروع لأنني كنت مريضاً الأسبوع الماضي.",
+       False, ["non_technical"]),
+    _g("ar-recording", "ar",
+       "تسجيل محاضرة الأسبوع الخامس غير موجود على المنصة، متى سيتم رفعه؟",
+       False, ["non_technical"]),
+    _g("ar-change-section", "ar",
+       "كيف أغيّر الشعبة التي أنا مسجل فيها هذا الفصل؟",
+       False, ["non_technical"]),
+]
+
+
+def golden_fingerprint(items: List[GoldenComplaint]) -> str:
+    blob = json.dumps([asdict(g) for g in items], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:12]
+
+
+def load_golden(path: Optional[str] = None) -> Tuple[str, List[GoldenComplaint]]:
+    """
+    (version, complaints): GOLDEN, or a JSONL file of {"id", "lang", "text", "is_technical",
+    "categories", "needs_commands"} whose optional first line {"version": ...} names it
+    (default: the file name). Raises ValueError on a bad line or a duplicate id.
+    """
+    if path is None:
+        return GOLDEN_VERSION, list(GOLDEN)
+    version = os.path.splitext(os.path.basename(path))[0]
+    items: List[GoldenComplaint] = []
+    with open(path, encoding="utf-8") as fh:
+        for n, line in enumerate(fh, start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+                if not items and set(obj) == {"version"}:
+                    version = str(obj["version"])
+                    continue
+                categories = obj["categories"]
+                items.append(GoldenComplaint(
+                    id=str(obj["id"]), lang=str(obj.get("lang") or "en"), text=str(obj["text"]),
+                    is_technical=bool(obj["is_technical"]),
+                    categories=(categories,) if isinstance(categories, str) else tuple(categories),
+                    needs_commands=bool(obj.get("needs_commands", False)),
+                ))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path} line {n}: {e}") from e
+            unknown = [c for c in items[-1].categories if c not in CATEGORIES]
+            if unknown:
+                raise ValueError(f"{path} line {n}: unknown categories {unknown}")
+    ids = [g.id for g in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"{path}: duplicate complaint ids")
+    return version, items
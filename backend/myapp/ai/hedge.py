@@ -0,0 +1,258 @@
+# ==============================================
+# Hedged LLM calls: a second request when the first one is slow
+# ==============================================
+# A completion's p50 is a few seconds but its p99 runs into LLM_TIMEOUT. With
+# AI_HEDGE=true an interactive call that has not answered after `delay` sends
+# an identical request (to AI_HEDGE_MODEL / AI_HEDGE_BASE_URL when set),
+# returns whichever answers first and cancels the other:
+# - delay = the AI_HEDGE_PERCENTILE latency of that model's last AI_HEDGE_WINDOW
+#   calls, clamped to [AI_HEDGE_MIN_DELAY, AI_HEDGE_MAX_DELAY]; AI_HEDGE_DELAY
+#   until AI_HEDGE_MIN_SAMPLES calls have finished. A primary cancelled because
+#   its hedge won counts with the time it had run (a lower bound), so the slow
+#   tail does not vanish from the window once hedging starts cutting it;
+# - spend is capped by a budget: every call earns AI_HEDGE_MAX_RATE of a hedge
+#   (at most AI_HEDGE_BURST saved up), a hedge costs one, so hedges stay under
+#   that share of calls; the rate limiter (ratelimit.py) must also have room
+#   right away: a hedge never queues;
+# - this wraps one attempt of call_with_retries(): an error is not hedged
+#   (retries handle that), but when one of two racing requests fails the other
+#   can still win;
+# - ratelimit.BATCH calls (backfills) never hedge, nor do streamed answers;
+# - async losers are cancelled; a sync loser can't be interrupted (blocking
+#   HTTP in a thread): it runs out in the background and is discarded.
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from .metrics import annotate
+from .ratelimit import INTERACTIVE, RateLimited, estimate_tokens, get_scheduler
+from .resilience import LLM_TIMEOUT_S
+
+AI_HEDGE_ENABLED = os.getenv("AI_HEDGE", "false").strip().lower() in ("1", "true", "yes", "on")
+AI_HEDGE_PERCENTILE = float(os.getenv("AI_HEDGE_PERCENTILE", "0.95"))
+AI_HEDGE_DELAY_S = float(os.getenv("AI_HEDGE_DELAY", "8"))          # until the window has enough samples
+AI_HEDGE_MIN_DELAY_S = float(os.getenv("AI_HEDGE_MIN_DELAY", "1"))
+AI_HEDGE_MAX_DELAY_S = float(os.getenv("AI_HEDGE_MAX_DELAY", str(LLM_TIMEOUT_S / 2)))
+AI_HEDGE_WINDOW = int(os.getenv("AI_HEDGE_WINDOW", "200"))
+AI_HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+AI_HEDGE_MAX_RATE = float(os.getenv("AI_HEDGE_MAX_RATE", "0.05"))   # hedges per call, long-run
+AI_HEDGE_BURST = float(os.getenv("AI_HEDGE_BURST", "3"))
+AI_HEDGE_MODEL = os.getenv("AI_HEDGE_MODEL", "")                    # default: the primary's model
+AI_HEDGE_BASE_URL = os.getenv("AI_HEDGE_BASE_URL", "")              # default: the primary's client
+AI_HEDGE_API_KEY = os.getenv("AI_HEDGE_API_KEY", "")                # for AI_HEDGE_BASE_URL; default OPENAI_API_KEY
+
+# a hedge with less of the attempt's timeout left than this could not finish
+_MIN_HEDGE_S = 1.0
+
+Create = Callable[..., Any]
+
+
+def hedging(priority: int) -> bool:
+    """Whether calls at `priority` are hedged."""
+    return AI_HEDGE_ENABLED and priority <= INTERACTIVE
+
+
+def hedge_create(async_: bool = False) -> Optional[Create]:
+    """chat.completions.create for hedges, when AI_HEDGE_BASE_URL points them elsewhere."""
+    if not AI_HEDGE_BASE_URL:
+        return None
+    from .providers import get_async_client_at, get_client_at
+    at = get_async_client_at if async_ else get_client_at
+    client = at(AI_HEDGE_BASE_URL, api_key=AI_HEDGE_API_KEY or None)
+    return client.chat.completions.create
+
+
+class Hedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._budget = AI_HEDGE_BURST
+        self._stats = {
+            "calls": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "both_failed": 0,
+            "budget_denied": 0, "quota_denied": 0, "too_late": 0,
+        }
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    # ---- delay
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            window = self._latencies.get(model)
+            if window is None:
+                window = self._latencies[model] = deque(maxlen=AI_HEDGE_WINDOW)
+            window.append(seconds)
+
+    def delay(self, model: str) -> float:
+        """Seconds to wait for the primary before hedging."""
+        with self._lock:
+            window = self._latencies.get(model)
+            samples = sorted(window) if window is not None and len(window) >= AI_HEDGE_MIN_SAMPLES else None
+        if samples is None:
+            return AI_HEDGE_DELAY_S
+        value = samples[min(len(samples) - 1, int(AI_HEDGE_PERCENTILE * len(samples)))]
+        return min(AI_HEDGE_MAX_DELAY_S, max(AI_HEDGE_MIN_DELAY_S, value))
+
+    # ---- budget
+
+    def _start_call(self) -> None:
+        with self._lock:
+            self._stats["calls"] += 1
+            self._budget = min(AI_HEDGE_BURST, self._budget + AI_HEDGE_MAX_RATE)
+
+    def _spend(self, remaining: float) -> bool:
+        with self._lock:
+            if remaining < _MIN_HEDGE_S:
+                self._stats["too_late"] += 1
+                return False
+            if self._budget < 1:
+                self._stats["budget_denied"] += 1
+                return False
+            self._budget -= 1
+            return True
+
+    def _refund(self) -> None:
+        with self._lock:
+            self._budget += 1
+            self._stats["quota_denied"] += 1
+
+    def _hedge_kwargs(self, kwargs: Dict[str, Any], remaining: float) -> Dict[str, Any]:
+        return {**kwargs, "model": AI_HEDGE_MODEL or kwargs["model"], "timeout": remaining}
+
+    def _fired(self) -> None:
+        self._bump("hedged")
+        annotate(hedge="fired")
+
+    def _won(self, by_hedge: bool) -> None:
+        self._bump("hedge_wins" if by_hedge else "primary_wins")
+        annotate(hedge="won" if by_hedge else "lost")
+
+    def _both_failed(self) -> None:
+        self._bump("both_failed")
+        annotate(hedge="failed")
+
+    # ---- sync
+
+    def _may_hedge(self, kwargs: Dict[str, Any], remaining: float) -> Optional[Dict[str, Any]]:
+        if not self._spend(remaining):
+            return None
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            try:
+                scheduler.acquire(estimate_tokens(kwargs["messages"], kwargs["max_tokens"]), max_wait_s=0)
+            except RateLimited:
+                self._refund()
+                return None
+        self._fired()
+        return self._hedge_kwargs(kwargs, remaining)
+
+    def _start(self, create: Create, kwargs: Dict[str, Any]) -> concurrent.futures.Future:
+        fut: concurrent.futures.Future = concurrent.futures.Future()
+        ctx = contextvars.copy_context()
+
+        def run() -> None:
+            t0 = time.monotonic()
+            try:
+                resp = ctx.run(create, **kwargs)
+            except BaseException as e:
+                fut.set_exception(e)
+                return
+            self.record(kwargs["model"], time.monotonic() - t0)
+            fut.set_result(resp)
+
+        threading.Thread(target=run, name="ai-hedge", daemon=True).start()
+        return fut
+
+    def call(self, create: Create, kwargs: Dict[str, Any], timeout: float, *,
+             hedge_create: Optional[Create] = None) -> Any:
+        """create(**kwargs, timeout=timeout), hedged after delay(); one attempt of call_with_retries()."""
+        self._start_call()
+        started = time.monotonic()
+        primary = self._start(create, {**kwargs, "timeout": timeout})
+        done, _ = concurrent.futures.wait((primary,), timeout=self.delay(kwargs["model"]))
+        if done:
+            return primary.result()
+        hedge_kwargs = self._may_hedge(kwargs, timeout - (time.monotonic() - started))
+        if hedge_kwargs is None:
+            return primary.result()   # bounded by its own timeout
+        hedge = self._start(hedge_create or create, hedge_kwargs)
+        for fut in concurrent.futures.as_completed((primary, hedge)):
+            if fut.exception() is None:
+                self._won(fut is hedge)
+                return fut.result()
+        self._both_failed()
+        return primary.result()   # raises the primary's error
+
+    # ---- async
+
+    async def _amay_hedge(self, kwargs: Dict[str, Any], remaining: float) -> Optional[Dict[str, Any]]:
+        if not self._spend(remaining):
+            return None
+        scheduler = get_scheduler()
+        if scheduler is not None:
+            try:
+                await scheduler.aacquire(estimate_tokens(kwargs["messages"], kwargs["max_tokens"]), max_wait_s=0)
+            except RateLimited:
+                self._refund()
+                return None
+        self._fired()
+        return self._hedge_kwargs(kwargs, remaining)
+
+    async def _timed(self, create: Callable[..., Awaitable[Any]], kwargs: Dict[str, Any], censor: bool) -> Any:
+        t0 = time.monotonic()
+        try:
+            resp = await create(**kwargs)
+        except asyncio.CancelledError:
+            if censor:   # lost to its hedge: it took at least this long
+                self.record(kwargs["model"], time.monotonic() - t0)
+            raise
+        self.record(kwargs["model"], time.monotonic() - t0)
+        return resp
+
+    async def acall(self, create: Callable[..., Awaitable[Any]], kwargs: Dict[str, Any], timeout: float, *,
+                    hedge_create: Optional[Callable[..., Awaitable[Any]]] = None) -> Any:
+        """asyncio twin of call(); the losing request is cancelled."""
+        self._start_call()
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(create, {**kwargs, "timeout": timeout}, censor=True))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay(kwargs["model"]))
+            if done:
+                return primary.result()
+            hedge_kwargs = await self._amay_hedge(kwargs, timeout - (time.monotonic() - started))
+            if hedge_kwargs is None:
+                return await primary
+            hedge = asyncio.ensure_future(self._timed(hedge_create or create, hedge_kwargs, censor=False))
+            tasks.append(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.index):   # a tie goes to the primary
+                    if task.exception() is None:
+                        self._won(task is hedge)
+                        return task.result()
+            self._both_failed()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            models = list(self._latencies)
+        out["delay_s"] = {model: round(self.delay(model), 3) for model in models}
+        return out
+
+
+hedger = Hedger()
@@ -0,0 +1,264 @@
+# ==============================================
+# Per-stage latency metrics for the complaint pipeline
+# ==============================================
+# - span("llm") times a block into the ai_stage_seconds{stage} histogram and,
+#   while a request trace is active (new_trace / activate / finish_trace), into
+#   that request's per-stage breakdown; note() / annotate() add retries, the
+#   answer source and token usage to it.
+# - Histograms use fixed buckets: one bisect + a lock per observation (~1 us),
+#   so spans stay on the hot path. AI_METRICS=false turns them into no-ops.
+# - render_prometheus() is the text exposition format (0.0.4) of the histograms,
+#   the counters below and the existing stats() of resilience / cache / rate
+#   limiter / token usage / single-flight, read at scrape time.
+# - AI_METRICS_LOG=true logs one JSON line per traced request to the
+#   "myapp.ai.requests" logger.
+from __future__ import annotations
+import bisect
+import contextvars
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+AI_METRICS_ENABLED = os.getenv("AI_METRICS", "true").strip().lower() not in ("0", "false", "no", "off")
+AI_METRICS_LOG = os.getenv("AI_METRICS_LOG", "false").strip().lower() in ("1", "true", "yes", "on")
+
+# seconds: from a cache hit (sub-ms) to a slow completion with retries
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0)
+
+request_log = logging.getLogger("myapp.ai.requests")
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label tuple (Prometheus semantics)."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List[float]] = {}   # counts per bucket + [+Inf, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], List[float]]:
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def expose(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self.snapshot().items()):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for le, n in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += n
+                yield f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (_num(le),))} {int(cumulative)}"
+            yield f"{self.name}_sum{base} {series[-1]:.6f}"
+            yield f"{self.name}_count{base} {int(cumulative)}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, n: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def expose(self) -> Iterable[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, n in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {n}"
+
+
+STAGE_SECONDS = Histogram("ai_stage_seconds", "Time spent per complaint pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("ai_request_seconds", "End-to-end time of traced HTTP requests.", ("endpoint", "status"))
+ANSWERS = Counter("ai_answers_total", "Answers by the layer that produced them.", ("source",))
+ERRORS = Counter("ai_errors_total", "Agent calls that returned an error result.", ("kind",))
+TIER_CALLS = Counter("ai_cascade_calls_total", "Model cascade calls by tier and what followed.", ("tier", "outcome"))
+TIER_COST = Counter("ai_cascade_cost_usd_total", "Model cascade spend by tier, from AI_MODEL_PRICES.", ("tier",))
+SCHEMA_FIXES = Counter("ai_schema_fixes_total", "Model outputs fixed locally (repair) or by a partial re-ask.", ("kind",))
+
+_REGISTRY = (STAGE_SECONDS, REQUEST_SECONDS, ANSWERS, ERRORS, TIER_CALLS, TIER_COST, SCHEMA_FIXES)
+
+
+# ---- spans + per-request traces
+
+_trace: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("ai_trace", default=None)
+
+
+class span:
+    """`with span("llm"): ...` -> ai_stage_seconds{stage="llm"} (+ the current trace)."""
+    __slots__ = ("stage", "_t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "span":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        observe(self.stage, time.perf_counter() - self._t0)
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not AI_METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _trace.get()
+    if trace is not None:
+        stages = trace["stages"]
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def note(name: str, n: int = 1) -> None:
+    """Count something (retries, ...) on the current request's trace, if any."""
+    trace = _trace.get()
+    if trace is not None:
+        trace[name] = trace.get(name, 0) + n
+
+
+def annotate(**fields: Any) -> None:
+    """Attach fields (answer source, token usage) to the current request's trace, if any."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def new_trace(endpoint: str) -> Dict[str, Any]:
+    return {"endpoint": endpoint, "started": time.perf_counter(), "stages": {}}
+
+
+def activate(trace: Dict[str, Any]) -> contextvars.Token:
+    """Make `trace` the current one; spans in this context (and tasks it starts) report to it."""
+    return _trace.set(trace)
+
+
+def deactivate(token: contextvars.Token) -> None:
+    try:
+        _trace.reset(token)
+    except ValueError:   # resumed in another context (a streamed body iterated elsewhere)
+        _trace.set(None)
+
+
+_LOGGED_FIELDS = ("retries", "source", "tier", "hedge", "cost_usd", "prompt_tokens", "cached_prompt_tokens", "completion_tokens")
+
+
+def finish_trace(trace: Dict[str, Any], status: Any) -> None:
+    """Record the request histogram and (AI_METRICS_LOG) one structured log line."""
+    if not AI_METRICS_ENABLED:
+        return
+    elapsed = time.perf_counter() - trace["started"]
+    REQUEST_SECONDS.observe(elapsed, trace["endpoint"], str(status))
+    if AI_METRICS_LOG and request_log.isEnabledFor(logging.INFO):
+        line = {
+            "event": "ai_request",
+            "endpoint": trace["endpoint"],
+            "status": status,
+            "ms": round(elapsed * 1000, 1),
+            "stages_ms": {k: round(v * 1000, 2) for k, v in trace["stages"].items()},
+        }
+        line.update((k, trace[k]) for k in _LOGGED_FIELDS if trace.get(k) is not None)
+        request_log.info(json.dumps(line, separators=(",", ":")))
+
+
+def count_answer(source: str) -> None:
+    if AI_METRICS_ENABLED:
+        ANSWERS.inc(source)
+
+
+def count_error(kind: str) -> None:
+    if AI_METRICS_ENABLED:
+        ERRORS.inc(kind)
+
+
+def count_schema_fixes(kinds: Iterable[str]) -> None:
+    if AI_METRICS_ENABLED:
+        for kind in kinds:
+            SCHEMA_FIXES.inc(kind)
+
+
+def count_tier(tier: str, outcome: str, cost: Optional[float]) -> None:
+    if AI_METRICS_ENABLED:
+        TIER_CALLS.inc(tier, outcome)
+        if cost:
+            TIER_COST.inc(tier, n=cost)
+
+
+# ---- Prometheus text format
+
+def _num(v: float) -> str:
+    return "+Inf" if v == math.inf else repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _stats_lines(prefix: str, help: str, stats: Dict[str, Any], gauges: Tuple[str, ...] = ()) -> Iterable[str]:
+    """An existing stats() dict as counters (gauges for the names listed)."""
+    for key, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        gauge = key in gauges
+        name = f"{prefix}_{key}" if gauge else f"{prefix}_{key}_total"
+        yield f"# HELP {name} {help} ({key})."
+        yield f"# TYPE {name} {'gauge' if gauge else 'counter'}"
+        yield f"{name} {value}"
+
+
+def render_prometheus() -> str:
+    from . import cache, hedge, prompt, ratelimit, resilience, singleflight   # read at scrape time only
+
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.expose())
+    res = resilience.stats()
+    lines.extend(_stats_lines("ai_llm", "LLM call resilience", res))
+    lines += [
+        "# HELP ai_llm_breaker_open 1 while the circuit breaker rejects calls.",
+        "# TYPE ai_llm_breaker_open gauge",
+        f"ai_llm_breaker_open {int(res.get('breaker_state') == 'open')}",
+    ]
+    usage = prompt.usage_stats()
+    lines += ["# HELP ai_tokens_total Tokens reported in resp.usage.", "# TYPE ai_tokens_total counter"]
+    for kind in ("prompt", "cached_prompt", "completion"):
+        lines.append(f'ai_tokens_total{{kind="{kind}"}} {usage[f"{kind}_tokens"]}')
+    response_cache = cache.get_cache()
+    if response_cache is not None:
+        lines.extend(_stats_lines("ai_cache", "Response cache", response_cache.stats(), gauges=("local_size",)))
+    scheduler = ratelimit.get_scheduler()
+    if scheduler is not None:
+        lines.extend(_stats_lines("ai_ratelimit", "LLM rate limiter", scheduler.stats(), gauges=("queue_depth",)))
+    lines.extend(_stats_lines("ai_singleflight", "Identical in-flight complaints", singleflight.flights.stats(),
+                              gauges=("in_flight",)))
+    hedges = hedge.hedger.stats()
+    lines.extend(_stats_lines("ai_hedge", "Hedged LLM calls", hedges))
+    if hedges["delay_s"]:
+        lines += ["# HELP ai_hedge_delay_seconds Current wait before a hedge, per model.",
+                  "# TYPE ai_hedge_delay_seconds gauge"]
+        for model, delay in sorted(hedges["delay_s"].items()):
+            lines.append(f"ai_hedge_delay_seconds{_labels(('model',), (model,))} {_num(delay)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,34 @@
+# ==============================================
+# Runtime data files (router model, similar-answer index)
+# ==============================================
+# Files myapp.ai writes at runtime live in settings.AI_DATA_DIR (default
+# backend/var/, git-ignored), not next to the code: the similar-answer index
+# stores raw student complaints and must never end up in a commit.
+# Resolved on first use so importing myapp.ai does not need Django settings;
+# without them AI_DATA_DIR / the same backend/var/ default apply.
+from __future__ import annotations
+import os
+from pathlib import Path
+
+_DEFAULT_DATA_DIR = Path(__file__).resolve().parents[2] / "var"
+
+
+def data_path(setting: str, filename: str) -> str:
+    """settings.<setting> (or that environment variable), else <AI_DATA_DIR>/<filename>."""
+    try:
+        from django.conf import settings
+        if settings.configured and getattr(settings, setting, None):
+            return str(getattr(settings, setting))
+        if settings.configured and getattr(settings, "AI_DATA_DIR", None):
+            return str(Path(settings.AI_DATA_DIR) / filename)
+    except ImportError:
+        pass
+    return os.getenv(setting) or str(Path(os.getenv("AI_DATA_DIR") or _DEFAULT_DATA_DIR) / filename)
+
+
+def ensure_parent(path: str) -> str:
+    """Create the directory a data file goes into; returns `path`."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    return path
@@ -0,0 +1,281 @@
+# ==============================================
+# Prompt builder for ai_agent()
+# ==============================================
+# - Everything static (rules + schema) lives in one system message that is
+#   byte-identical on every call, so the provider's prompt-prefix cache hits;
+#   the user message carries only the routing hint and the complaint.
+# - AI_STRUCTURED_OUTPUTS=true sends the schema as response_format json_schema
+#   (strict) instead of prose, which also drops the prose schema from the prefix.
+# - Complaints (pasted logs, tracebacks) are fitted to AI_COMPLAINT_MAX_TOKENS:
+#   repeated lines are collapsed, then the middle is cut, keeping head and tail.
+# - usage_stats() totals prompt / cached / completion tokens across calls.
+# Token counts use tiktoken when installed, else a ~4 chars/token estimate.
+from __future__ import annotations
+import functools
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+AI_STRUCTURED_OUTPUTS = os.getenv("AI_STRUCTURED_OUTPUTS", "false").strip().lower() in ("1", "true", "yes", "on")
+AI_COMPLAINT_MAX_TOKENS = int(os.getenv("AI_COMPLAINT_MAX_TOKENS", "1500"))   # 0 = no limit
+
+# ==============================================
+# JSON schema (as text) + strict system rules
+# ==============================================
+SYSTEM_PROMPT = (
+    "You are an AI teaching assistant for a student helpdesk. "
+    "Return STRICT JSON ONLY (no markdown, no extra text). "
+    "Follow the JSON schema exactly (keys, types, names). "
+    "Guidelines:\n"
+    "- If the complaint is NON-TECHNICAL: set routing.is_technical=false and steps_to_apply must be []. "
+    "  Do NOT output any steps or commands.\n"
+    "- If the complaint is TECHNICAL: produce BETWEEN 3 AND 6 steps. "
+    "  Each step must be ONE clear action. "
+    "  If a step requires any terminal/CLI command, ALWAYS include those commands in step.commands "
+    "(one command per line, no numbering, no prose). "
+    "  If a step is GUI-only (e.g., menu clicks), leave step.commands as [].\n"
+    "- Put commands under the matching step; do not dump them all in solution.code. "
+    "  Use solution.code only if you must provide a full block and cannot map commands to steps.\n"
+    "- Keep 'summary' short and helpful. Keep 'verification_checklist' concrete.\n"
+    "- Use plain ASCII quotes. Return ONLY the JSON object—no fences or commentary."
+)
+
+# ===== JSON schema the model must follow =====
+RESPONSE_SCHEMA = r"""
+Return a SINGLE JSON object that matches EXACTLY this schema:
+
+{
+  "routing": {
+    "is_technical": true,
+    "category": "coding_bug | coding_how_to | dev_env_tooling | data_ml_dl | sys_networks | theory_concept | other_technical | non_technical",
+    "confidence": 0.0
+  },
+  "summary": "Short explanation for the student.",
+  "steps_to_apply": [
+    {
+      "text": "One clear action for this step.",
+      "commands": ["optional terminal/CLI commands for THIS step (0..N), one per line, no prose"]
+    }
+  ],
+  "verification_checklist": ["bullet checks the student can validate"],
+  "requests_for_more_info": ["0..3 questions for the student, or [] if not needed"],
+  "solution": {
+    "code_language": "bash | python | text | null",
+    "code": "OPTIONAL: full code/commands block ONLY IF absolutely needed (prefer step.commands)."
+  }
+}
+
+Rules:
+- Non-technical -> routing.is_technical=false AND steps_to_apply=[]
+- Technical -> 3..6 steps, one action per step. If a step needs a command, put it in step.commands.
+- No markdown, no backticks around the whole JSON, no commentary—JSON only.
+"""
+
+CATEGORIES = [
+    "coding_bug", "coding_how_to", "dev_env_tooling", "data_ml_dl", "sys_networks",
+    "theory_concept", "other_technical", "non_technical",
+]
+
+
+def _obj(properties: Dict[str, Any]) -> Dict[str, Any]:
+    # strict structured outputs: every key required, nothing extra
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+_STR_LIST = {"type": "array", "items": {"type": "string"}}
+
+# The same shape as RESPONSE_SCHEMA, for response_format={"type": "json_schema"}
+JSON_SCHEMA: Dict[str, Any] = _obj({
+    "routing": _obj({
+        "is_technical": {"type": "boolean"},
+        "category": {"type": "string", "enum": CATEGORIES},
+        "confidence": {"type": "number"},
+    }),
+    "summary": {"type": "string"},
+    "steps_to_apply": {"type": "array", "items": _obj({"text": {"type": "string"}, "commands": _STR_LIST})},
+    "verification_checklist": _STR_LIST,
+    "requests_for_more_info": _STR_LIST,
+    "solution": _obj({
+        "code_language": {"type": ["string", "null"], "enum": ["bash", "python", "text", None]},
+        "code": {"type": "string"},
+    }),
+})
+
+# The static prefix: identical bytes on every call
+SYSTEM_PREFIX = SYSTEM_PROMPT if AI_STRUCTURED_OUTPUTS else f"{SYSTEM_PROMPT}\n{RESPONSE_SCHEMA}"
+
+# Bumps automatically whenever the prompt, schema or budget changes, so cached
+# answers produced by an older prompt are never served.
+PROMPT_VERSION = hashlib.sha256(
+    "\x1f".join([SYSTEM_PREFIX, json.dumps(JSON_SCHEMA, sort_keys=True) if AI_STRUCTURED_OUTPUTS else "",
+                 str(AI_COMPLAINT_MAX_TOKENS)]).encode("utf-8")
+).hexdigest()[:12]
+
+
+def response_format() -> Dict[str, Any]:
+    if AI_STRUCTURED_OUTPUTS:
+        return {"type": "json_schema", "json_schema": {"name": "complaint_analysis", "strict": True, "schema": JSON_SCHEMA}}
+    # forces the model to emit a single JSON object (no prose)
+    return {"type": "json_object"}
+
+
+# ---- token counting
+
+@functools.lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def token_counter(model: str = "gpt-4o-mini") -> Callable[[str], int]:
+    """len-in-tokens for `model`: tiktoken when available, else ~4 chars per token."""
+    if tiktoken is not None:
+        try:
+            enc = _encoding(model)
+            return lambda s: len(enc.encode(s, disallowed_special=()))
+        except Exception:  # encoding files unavailable offline
+            pass
+    return lambda s: (len(s) + 3) // 4
+
+
+# ---- fitting a complaint to the budget
+
+def _collapse_repeats(lines: List[str]) -> List[str]:
+    """Runs of identical lines (retry loops, progress bars) become one line + a count."""
+    out: List[str] = []
+    i = 0
+    while i < len(lines):
+        j = i
+        while j + 1 < len(lines) and lines[j + 1] == lines[i]:
+            j += 1
+        out.append(lines[i])
+        if j > i:
+            out.append(f"[... previous line repeated {j - i} more times ...]")
+        i = j + 1
+    return out
+
+
+def fit_to_budget(text: str, budget: int, count: Callable[[str], int]) -> str:
+    """
+    Shrink `text` to at most ~`budget` tokens. Errors usually sit at the end of a
+    pasted traceback, so the tail keeps twice the share of the head.
+    """
+    if budget <= 0 or count(text) <= budget:
+        return text
+    lines = _collapse_repeats(text.splitlines())
+    collapsed = "\n".join(lines)
+    if count(collapsed) <= budget:
+        return collapsed
+
+    head_budget, tail_budget = budget // 3, budget - budget // 3 - 16   # 16 ~ the marker line
+    head: List[str] = []
+    used = 0
+    for ln in lines:
+        n = count(ln) + 1
+        if used + n > head_budget:
+            break
+        head.append(ln)
+        used += n
+    tail: List[str] = []
+    used = 0
+    for ln in reversed(lines[len(head):]):
+        n = count(ln) + 1
+        if used + n > tail_budget:
+            break
+        tail.append(ln)
+        used += n
+    tail.reverse()
+    omitted = len(lines) - len(head) - len(tail)
+    if not head and not tail:
+        # one enormous line (minified JSON, base64, ...): cut by characters
+        chars = max(1, len(collapsed) * budget // max(1, count(collapsed)))
+        return f"{collapsed[:chars // 3]}\n[... truncated ...]\n{collapsed[-(chars - chars // 3):]}"
+    return "\n".join(head + [f"[... {omitted} lines omitted ...]"] + tail)
+
+
+# ---- request messages
+
+def build_messages(student_complaint: str, *, model: str, hint: Any = None,
+                   max_complaint_tokens: Optional[int] = None) -> List[Dict[str, str]]:
+    budget = AI_COMPLAINT_MAX_TOKENS if max_complaint_tokens is None else max_complaint_tokens
+    complaint = fit_to_budget(student_complaint, budget, token_counter(model))
+    hint_text = ""
+    if hint is not None:
+        hint_text = (
+            f"Routing hint from a local classifier (may be wrong): category={hint.category}, "
+            f"is_technical={'true' if hint.is_technical else 'false'}, confidence={hint.confidence:.2f}\n\n"
+        )
+    return [
+        {"role": "system", "content": SYSTEM_PREFIX},
+        {"role": "user", "content": f"{hint_text}Student complaint:\n{complaint}"},
+    ]
+
+
+# Routing-only request for the first tier of the model cascade (cascade.py):
+# a few output tokens instead of a full answer.
+ROUTE_PROMPT = (
+    "You classify student helpdesk complaints. "
+    "Return STRICT JSON ONLY with exactly these keys: "
+    '{"is_technical": true, "category": "<one of: ' + " | ".join(CATEGORIES) + '>", "confidence": 0.0}. '
+    "confidence is your probability (0..1) that the category is right. No other keys, no commentary."
+)
+
+
+def build_route_messages(student_complaint: str, *, model: str, max_complaint_tokens: int) -> List[Dict[str, str]]:
+    complaint = fit_to_budget(student_complaint, max_complaint_tokens, token_counter(model))
+    return [
+        {"role": "system", "content": ROUTE_PROMPT},
+        {"role": "user", "content": f"Student complaint:\n{complaint}"},
+    ]
+
+
+# ---- usage accounting
+
+_usage_lock = threading.Lock()
+_usage: Dict[str, int] = {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+
+
+def cached_tokens(usage: Any) -> Optional[int]:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None)
+
+
+def record_usage(usage: Any) -> None:
+    if usage is None:
+        return
+    with _usage_lock:
+        _usage["calls"] += 1
+        _usage["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+        _usage["cached_prompt_tokens"] += cached_tokens(usage) or 0
+        _usage["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+
+
+def add_usage(*usages: Any) -> Any:
+    """Several responses' resp.usage as one (e.g. an answer plus its re-ask)."""
+    present = [u for u in usages if u is not None]
+    if len(present) < 2:
+        return present[0] if present else None
+    return SimpleNamespace(
+        prompt_tokens=sum(getattr(u, "prompt_tokens", 0) or 0 for u in present),
+        completion_tokens=sum(getattr(u, "completion_tokens", 0) or 0 for u in present),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=sum(cached_tokens(u) or 0 for u in present)),
+    )
+
+
+def usage_stats() -> Dict[str, Any]:
+    with _usage_lock:
+        out: Dict[str, Any] = dict(_usage)
+    out["prefix_cache_hit_ratio"] = (
+        round(out["cached_prompt_tokens"] / out["prompt_tokens"], 3) if out["prompt_tokens"] else None
+    )
+    return out
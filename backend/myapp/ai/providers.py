@@ -0,0 +1,370 @@
+# ==============================================
+# LLM client providers (created lazily, once per process)
+# ==============================================
+# Nothing here touches the network, the environment file or the openai SDK at
+# import time; the first get_client() / get_async_client() call builds the
+# client for the configured provider (settings.AI_PROVIDER, else env):
+#   openai         the real API (OPENAI_API_KEY; AI_PROVIDER_BASE_URL points it
+#                  at any OpenAI-compatible server, e.g. a local stub)
+#   fake           in-process canned answers: offline dev, CI, load tests
+#   replay         answers recorded in AI_REPLAY_FIXTURES (JSONL); with
+#                  AI_REPLAY_RECORD=true misses go to the real API and are recorded
+#   pkg.mod:func   any factory returning an OpenAI-compatible client;
+#                  called as func(async_=False|True)
+# set_client_factory() swaps the provider at runtime (tests, benchmarks).
+from __future__ import annotations
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import threading
+import weakref
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "200"))
+AI_HTTP_MAX_KEEPALIVE = int(os.getenv("AI_HTTP_MAX_KEEPALIVE", "50"))
+AI_HTTP_KEEPALIVE_EXPIRY_S = float(os.getenv("AI_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+
+class ProviderConfigError(RuntimeError):
+    """The configured provider can't be built (missing key, unknown name, ...)."""
+
+
+def _setting(name: str, default: str = "") -> str:
+    """Django setting when settings are configured, else the environment variable."""
+    try:
+        from django.conf import settings
+        if settings.configured and hasattr(settings, name):
+            return str(getattr(settings, name) or "")
+    except ImportError:
+        pass
+    return os.getenv(name, default)
+
+
+def _truthy(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ---- openai
+
+def _http2_enabled() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx needs it for http2=True)
+    except ImportError:
+        return False
+    return _truthy(os.getenv("AI_HTTP2", "true"))
+
+
+def _http_options() -> Dict[str, Any]:
+    import httpx
+    from .resilience import LLM_TIMEOUT_S
+    return dict(
+        http2=_http2_enabled(),
+        limits=httpx.Limits(
+            max_connections=AI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=AI_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=AI_HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0),
+    )
+
+
+def _openai_client(async_: bool = False, *, base_url: Optional[str] = None, api_key: Optional[str] = None) -> Any:
+    import httpx
+    import openai
+
+    api_key = api_key or _setting("OPENAI_API_KEY")
+    if not api_key:
+        from dotenv import load_dotenv   # plain-python use outside Django
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ProviderConfigError("OPENAI_API_KEY is not set (or use AI_PROVIDER=fake for offline runs)")
+    base_url = base_url or _setting("AI_PROVIDER_BASE_URL") or None
+    # max_retries=0: retries/backoff are owned by resilience.py
+    if async_:
+        return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                                  http_client=httpx.AsyncClient(**_http_options()))
+    return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                         http_client=httpx.Client(**_http_options()))
+
+
+# ---- OpenAI-shaped responses for the offline providers
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                           total_tokens=prompt_tokens + completion_tokens, prompt_tokens_details=None)
+
+
+def _completion(content: str, usage: SimpleNamespace) -> SimpleNamespace:
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage)
+
+
+def _chunks(content: str, usage: SimpleNamespace, size: int = 24) -> List[SimpleNamespace]:
+    out = [
+        SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=content[i:i + size]))], usage=None)
+        for i in range(0, len(content), size)
+    ]
+    out.append(SimpleNamespace(choices=[], usage=usage))   # like stream_options={"include_usage": True}
+    return out
+
+
+class _AsyncStream:
+    def __init__(self, chunks: List[SimpleNamespace]):
+        self._it = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _Completions:
+    """chat.completions facade over `answer(kwargs) -> (content, usage)`."""
+
+    def __init__(self, answer: Callable[[Dict[str, Any]], Any], async_: bool):
+        self._answer = answer
+        self._async = async_
+
+    def _respond(self, kwargs: Dict[str, Any]) -> Any:
+        content, usage = self._answer(kwargs)
+        if kwargs.get("stream"):
+            chunks = _chunks(content, usage)
+            return _AsyncStream(chunks) if self._async else iter(chunks)
+        return _completion(content, usage)
+
+    def create(self, **kwargs: Any) -> Any:
+        if self._async:
+            async def run():
+                await asyncio.sleep(0)
+                return self._respond(kwargs)
+            return run()
+        return self._respond(kwargs)
+
+
+class _Client:
+    def __init__(self, answer: Callable[[Dict[str, Any]], Any], async_: bool):
+        self.chat = SimpleNamespace(completions=_Completions(answer, async_))
+
+
+# ---- fake
+
+def _last_user_message(kwargs: Dict[str, Any]) -> str:
+    for m in reversed(kwargs.get("messages") or []):
+        if m.get("role") == "user":
+            return m.get("content") or ""
+    return ""
+
+
+def _count(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def fake_answer(kwargs: Dict[str, Any]) -> Any:
+    """A deterministic, schema-valid technical answer echoing the complaint."""
+    complaint = _last_user_message(kwargs).rpartition("Student complaint:\n")[2].strip()
+    result = {
+        "routing": {"is_technical": True, "category": "other_technical", "confidence": 0.5},
+        "summary": f"Offline answer (AI_PROVIDER=fake) for: {complaint[:80]}",
+        "steps_to_apply": [
+            {"text": "Check which Python interpreter is active.", "commands": ["python --version"]},
+            {"text": "Install the missing package.", "commands": ["pip install requests"]},
+            {"text": "Run your program again.", "commands": []},
+        ],
+        "verification_checklist": ["The program starts without the error."],
+        "requests_for_more_info": [],
+        "solution": {"code_language": None, "code": ""},
+    }
+    content = json.dumps(result, ensure_ascii=False)
+    prompt = sum(_count(m.get("content") or "") for m in kwargs.get("messages") or [])
+    return content, _usage(prompt, _count(content))
+
+
+def _fake_client(async_: bool = False) -> Any:
+    return _Client(fake_answer, async_)
+
+
+# ---- replay (recorded fixtures)
+
+class ReplayMiss(LookupError):
+    """No recorded response for this request (and recording is off)."""
+
+
+def request_fingerprint(kwargs: Dict[str, Any]) -> str:
+    """Stable hash of what determines the answer (not timeout/stream flags)."""
+    keyed = {k: kwargs.get(k) for k in ("model", "messages", "response_format", "max_tokens", "temperature")}
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ReplayStore:
+    def __init__(self, path: str, record: bool):
+        self.path = path
+        self.record = record
+        self._lock = threading.Lock()
+        self._fixtures: Dict[str, Dict[str, Any]] = {}
+        self._upstream: Any = None
+        try:
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        obj = json.loads(line)
+                        self._fixtures[obj["key"]] = obj
+        except FileNotFoundError:
+            pass
+
+    def answer(self, kwargs: Dict[str, Any]) -> Any:
+        key = request_fingerprint(kwargs)
+        hit = self._fixtures.get(key)
+        if hit is None:
+            if not self.record:
+                raise ReplayMiss(f"no recorded response for request {key[:12]} in {self.path}")
+            hit = self._record(key, kwargs)
+        usage = hit.get("usage") or {}
+        return hit["content"], _usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+
+    def _record(self, key: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if self._upstream is None:
+                self._upstream = _openai_client()
+        body = {k: v for k, v in kwargs.items() if k not in ("stream", "stream_options")}
+        resp = self._upstream.chat.completions.create(**body)
+        entry = {
+            "key": key,
+            "content": resp.choices[0].message.content,
+            "usage": {"prompt_tokens": resp.usage.prompt_tokens, "completion_tokens": resp.usage.completion_tokens},
+            "complaint": _last_user_message(kwargs)[-200:],   # for humans reading the fixture file
+        }
+        with self._lock:
+            self._fixtures[key] = entry
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+
+_replay_store: Optional[ReplayStore] = None
+
+
+def replay_factory(path: str, record: bool = False) -> Callable[..., Any]:
+    """A client factory for set_client_factory() answering from the fixtures at `path` (eval_agent, tests)."""
+    store = ReplayStore(path, record)
+    return lambda async_=False: _Client(store.answer, async_)
+
+
+def _replay_client(async_: bool = False) -> Any:
+    global _replay_store
+    if _replay_store is None:
+        path = _setting("AI_REPLAY_FIXTURES")
+        if not path:
+            raise ProviderConfigError("AI_PROVIDER=replay needs AI_REPLAY_FIXTURES=<path to .jsonl>")
+        _replay_store = ReplayStore(path, record=_truthy(_setting("AI_REPLAY_RECORD", "false")))
+    return _Client(_replay_store.answer, async_)
+
+
+# ---- registry + process-wide clients
+
+PROVIDERS: Dict[str, Callable[..., Any]] = {
+    "openai": _openai_client,
+    "fake": _fake_client,
+    "replay": _replay_client,
+}
+
+
+def _resolve_factory(name: str) -> Callable[..., Any]:
+    if name in PROVIDERS:
+        return PROVIDERS[name]
+    if ":" in name:
+        module, _, attr = name.partition(":")
+        try:
+            return getattr(importlib.import_module(module), attr)
+        except (ImportError, AttributeError) as e:
+            raise ProviderConfigError(f"AI_PROVIDER={name!r}: {e}") from e
+    raise ProviderConfigError(f"Unknown AI_PROVIDER {name!r} (expected one of {', '.join(PROVIDERS)} or module:factory)")
+
+
+_factory: Optional[Callable[..., Any]] = None
+_client: Any = None
+_lock = threading.Lock()
+# httpx.AsyncClient pools are bound to the event loop that opened them. Under
+# ASGI there is one loop per process, so this is a single shared pool; under
+# WSGI each async view gets its own short-lived loop and its own client.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+def provider_name() -> str:
+    return _setting("AI_PROVIDER", "openai").strip() or "openai"
+
+
+def _get_factory() -> Callable[..., Any]:
+    global _factory
+    if _factory is None:
+        _factory = _resolve_factory(provider_name())
+    return _factory
+
+
+def get_client() -> Any:
+    """The process-wide sync client, built on first use."""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _get_factory()(async_=False)
+    return _client
+
+
+def get_async_client() -> Any:
+    """The async client for the running event loop, built on first use in that loop."""
+    loop = asyncio.get_running_loop()
+    aclient = _async_clients.get(loop)
+    if aclient is None:
+        with _lock:
+            aclient = _async_clients.get(loop)
+            if aclient is None:
+                aclient = _get_factory()(async_=True)
+                _async_clients[loop] = aclient
+    return aclient
+
+
+# OpenAI clients for other OpenAI-compatible endpoints (hedge.py's AI_HEDGE_BASE_URL)
+_clients_at: Dict[str, Any] = {}
+_async_clients_at: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def get_client_at(base_url: str, api_key: Optional[str] = None) -> Any:
+    """A sync OpenAI client for `base_url` (default key: OPENAI_API_KEY), built on first use whatever AI_PROVIDER is."""
+    client = _clients_at.get(base_url)
+    if client is None:
+        with _lock:
+            client = _clients_at.get(base_url)
+            if client is None:
+                client = _clients_at[base_url] = _openai_client(base_url=base_url, api_key=api_key)
+    return client
+
+
+def get_async_client_at(base_url: str, api_key: Optional[str] = None) -> Any:
+    """get_client_at() for the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients_at.setdefault(loop, {})
+        client = clients.get(base_url)
+        if client is None:
+            client = clients[base_url] = _openai_client(True, base_url=base_url, api_key=api_key)
+    return client
+
+
+def set_client_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """Use `factory(async_=...)` for new clients (None = back to settings) and drop existing ones."""
+    global _factory, _client, _replay_store
+    with _lock:
+        _factory = factory
+        _client = None
+        _replay_store = None
+        _async_clients.clear()
+        _clients_at.clear()
+        _async_clients_at.clear()
@@ -0,0 +1,335 @@
+# ==============================================
+# Client-side rate limiting for the LLM tier
+# ==============================================
+# Token buckets for requests-per-minute and tokens-per-minute, plus a priority
+# queue in front of them: interactive requests (ai_analyze) are served before
+# batch backfills. When the estimated queue wait would blow the caller's
+# deadline we shed immediately with RateLimited (views answer 503 + Retry-After).
+#
+# Bucket state is per process by default. To share one quota between workers:
+#   AI_RATE_LIMIT_BACKEND=sqlite:/path/to/ratelimit.db   (token buckets in SQLite)
+#   AI_RATE_LIMIT_BACKEND=django[:alias]                  (per-minute counters via cache.incr)
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+AI_RATE_LIMIT_RPM = int(os.getenv("AI_RATE_LIMIT_RPM", "0"))          # 0 = unlimited
+AI_RATE_LIMIT_TPM = int(os.getenv("AI_RATE_LIMIT_TPM", "0"))          # 0 = unlimited
+AI_RATE_LIMIT_MAX_WAIT_S = float(os.getenv("AI_RATE_LIMIT_MAX_WAIT", "10"))             # interactive
+AI_RATE_LIMIT_BATCH_MAX_WAIT_S = float(os.getenv("AI_RATE_LIMIT_BATCH_MAX_WAIT", "300"))  # backfills can wait
+AI_RATE_LIMIT_BACKEND = os.getenv("AI_RATE_LIMIT_BACKEND", "").strip()
+
+INTERACTIVE = 0
+BATCH = 10
+
+_POLL_S = 0.05
+
+
+class RateLimited(Exception):
+    """Shed by the scheduler: the queue wait would exceed the caller's deadline."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM quota busy, try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """Rough prompt size (~4 chars per token) plus the completion allowance."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + 4 * len(messages) + max_tokens
+
+
+# ---- bucket state backends: take(requests, tokens) -> 0.0 when granted, else seconds to wait
+# `blocking` backends do I/O in take(), so the scheduler calls them outside its lock.
+
+class LocalBuckets:
+    blocking = False   # in-memory: take() runs under the scheduler lock, which also guards this state
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self._req = float(rpm)
+        self._tok = float(tpm)
+        self._at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed, self._at = now - self._at, now
+        if self.rpm:
+            self._req = min(self.rpm, self._req + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tok = min(self.tpm, self._tok + elapsed * self.tpm / 60.0)
+
+    def take(self, requests: int, tokens: int) -> float:
+        self._refill()
+        tokens = min(tokens, self.tpm) if self.tpm else tokens  # one huge prompt must not wait forever
+        wait = 0.0
+        if self.rpm and self._req < requests:
+            wait = max(wait, (requests - self._req) * 60.0 / self.rpm)
+        if self.tpm and self._tok < tokens:
+            wait = max(wait, (tokens - self._tok) * 60.0 / self.tpm)
+        if wait == 0.0:
+            self._req -= requests
+            self._tok -= tokens
+        return wait
+
+
+class SQLiteBuckets:
+    """Same token buckets, stored in a SQLite file so every worker on the host shares them."""
+
+    blocking = True
+
+    def __init__(self, path: str, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self._conn_lock = threading.Lock()   # one connection; take() runs outside the scheduler lock
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_rate_buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, at REAL NOT NULL)"
+        )
+
+    def take(self, requests: int, tokens: int) -> float:
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        with self._conn_lock:
+            return self._take(requests, tokens)
+
+    def _take(self, requests: int, tokens: int) -> float:
+        now = time.time()
+        c = self._conn
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            levels = {}
+            for name, cap in (("rpm", self.rpm), ("tpm", self.tpm)):
+                row = c.execute("SELECT level, at FROM ai_rate_buckets WHERE name = ?", (name,)).fetchone()
+                level = float(cap) if row is None else min(cap, row[0] + (now - row[1]) * cap / 60.0)
+                levels[name] = level
+            wait = 0.0
+            if self.rpm and levels["rpm"] < requests:
+                wait = max(wait, (requests - levels["rpm"]) * 60.0 / self.rpm)
+            if self.tpm and levels["tpm"] < tokens:
+                wait = max(wait, (tokens - levels["tpm"]) * 60.0 / self.tpm)
+            if wait == 0.0:
+                levels["rpm"] -= requests
+                levels["tpm"] -= tokens
+            c.executemany(
+                "INSERT OR REPLACE INTO ai_rate_buckets(name, level, at) VALUES (?, ?, ?)",
+                [("rpm", levels["rpm"], now), ("tpm", levels["tpm"], now)],
+            )
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class DjangoCacheWindows:
+    """
+    Fixed one-minute windows counted with cache.incr (atomic on redis/memcached).
+    Coarser than a token bucket, but works across hosts.
+    """
+
+    blocking = True
+
+    def __init__(self, alias: str, rpm: int, tpm: int):
+        from django.core.cache import caches
+        self._cache = caches[alias]
+        self.rpm, self.tpm = rpm, tpm
+
+    def _incr(self, key: str, n: int) -> int:
+        self._cache.add(key, 0, timeout=120)
+        return self._cache.incr(key, n)
+
+    def take(self, requests: int, tokens: int) -> float:
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        now = time.time()
+        window = int(now // 60)
+        until_next = 60.0 - (now % 60)
+        taken: List[Tuple[str, int]] = []
+        for name, cap, n in (("rpm", self.rpm, requests), ("tpm", self.tpm, tokens)):
+            if not cap:
+                continue
+            key = f"ai_rl:{name}:{window}"
+            taken.append((key, n))
+            if self._incr(key, n) > cap:
+                for k, m in taken:   # give back what this attempt took
+                    self._cache.decr(k, m)
+                return until_next
+        return 0.0
+
+
+# ---- priority scheduler
+
+def _default_max_wait(priority: int) -> float:
+    return AI_RATE_LIMIT_MAX_WAIT_S if priority <= INTERACTIVE else AI_RATE_LIMIT_BATCH_MAX_WAIT_S
+
+
+class LLMScheduler:
+    def __init__(self, buckets: Any, rpm: int, tpm: int):
+        self._buckets = buckets
+        self.rpm, self.tpm = rpm, tpm
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._queue: List[Tuple[int, int, int]] = []   # (priority, seq, tokens) heap
+        self._seq = itertools.count()
+        self._stats = {"granted": 0, "queued": 0, "shed": 0, "wait_ms_total": 0}
+
+    def _estimated_wait(self, priority: int, tokens: int) -> float:
+        """
+        Seconds until a new request at `priority` would be served: the work queued
+        ahead of it beyond one full bucket, drained at the refill rate.
+        """
+        ahead = [t for p, _, t in self._queue if p <= priority]
+        wait = 0.0
+        if self.rpm:
+            wait = max(wait, (len(ahead) + 1 - self.rpm) * 60.0 / self.rpm)
+        if self.tpm:
+            wait = max(wait, (sum(ahead) + tokens - self.tpm) * 60.0 / self.tpm)
+        return wait
+
+    def _enqueue(self, priority: int, tokens: int, max_wait_s: float) -> Tuple[int, int, int]:
+        with self._lock:
+            estimate = self._estimated_wait(priority, tokens)
+            if estimate > max_wait_s:
+                self._stats["shed"] += 1
+                raise RateLimited(estimate)
+            ticket = (priority, next(self._seq), tokens)
+            heapq.heappush(self._queue, ticket)
+            if len(self._queue) > 1:
+                self._stats["queued"] += 1
+            return ticket
+
+    def _head_take(self, ticket: Tuple[int, int, int], started: float) -> Optional[float]:
+        """
+        Under the lock: _POLL_S while another ticket is ahead, the local bucket's
+        answer (granting on 0.0), or None when the head must ask a shared backend.
+        """
+        with self._lock:
+            if self._queue[0] != ticket:
+                return _POLL_S
+            if self._buckets.blocking:
+                return None
+            wait = self._buckets.take(1, ticket[2])
+            if wait == 0.0:
+                self._grant(ticket, started)
+            return wait
+
+    def _grant(self, ticket: Tuple[int, int, int], started: float) -> None:
+        """Caller holds the lock. A higher priority may have jumped ahead during take(), so remove by value."""
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._stats["granted"] += 1
+        self._stats["wait_ms_total"] += int((time.monotonic() - started) * 1000)
+        self._cond.notify_all()
+
+    def _poll(self, ticket: Tuple[int, int, int], started: float) -> float:
+        """0.0 = granted (ticket removed), else seconds to wait. Shared-backend I/O runs outside the lock."""
+        wait = self._head_take(ticket, started)
+        if wait is None:
+            wait = self._buckets.take(1, ticket[2])
+            if wait == 0.0:
+                with self._lock:
+                    self._grant(ticket, started)
+        return wait
+
+    async def _apoll(self, ticket: Tuple[int, int, int], started: float) -> float:
+        """_poll() for the event loop: shared-backend take() runs in a worker thread."""
+        wait = self._head_take(ticket, started)
+        if wait is None:
+            wait = await asyncio.to_thread(self._buckets.take, 1, ticket[2])
+            if wait == 0.0:
+                with self._lock:
+                    self._grant(ticket, started)
+        return wait
+
+    def _drop(self, ticket: Tuple[int, int, int]) -> None:
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+
+    def _shed(self, ticket: Tuple[int, int, int], wait: float) -> RateLimited:
+        self._drop(ticket)
+        self._stats["shed"] += 1
+        return RateLimited(max(1.0, wait))
+
+    def acquire(self, tokens: int, *, priority: int = INTERACTIVE, max_wait_s: Optional[float] = None) -> None:
+        """Block until the request may go upstream, or raise RateLimited."""
+        max_wait_s = _default_max_wait(priority) if max_wait_s is None else max_wait_s
+        started = time.monotonic()
+        deadline = started + max_wait_s
+        ticket = self._enqueue(priority, tokens, max_wait_s)
+        try:
+            while True:
+                wait = self._poll(ticket, started)
+                if wait == 0.0:
+                    return
+                with self._cond:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (wait > remaining and self._queue and self._queue[0] == ticket):
+                        raise self._shed(ticket, wait)
+                    self._cond.wait(min(wait, remaining))
+        except BaseException:
+            with self._lock:
+                self._drop(ticket)
+            raise
+
+    async def aacquire(self, tokens: int, *, priority: int = INTERACTIVE, max_wait_s: Optional[float] = None) -> None:
+        """asyncio twin of acquire(); polls instead of blocking the event loop."""
+        max_wait_s = _default_max_wait(priority) if max_wait_s is None else max_wait_s
+        started = time.monotonic()
+        deadline = started + max_wait_s
+        ticket = self._enqueue(priority, tokens, max_wait_s)
+        try:
+            while True:
+                wait = await self._apoll(ticket, started)
+                if wait == 0.0:
+                    return
+                with self._lock:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or (wait > remaining and self._queue and self._queue[0] == ticket):
+                        raise self._shed(ticket, wait)
+                await asyncio.sleep(min(wait, remaining, _POLL_S * 4))
+        except BaseException:
+            with self._lock:
+                self._drop(ticket)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out["queue_depth"] = len(self._queue)
+        return out
+
+
+def _build_buckets(spec: str, rpm: int, tpm: int) -> Any:
+    if not spec:
+        return LocalBuckets(rpm, tpm)
+    if spec == "django" or spec.startswith("django:"):
+        return DjangoCacheWindows(spec.partition(":")[2] or "default", rpm, tpm)
+    if spec.startswith("sqlite:"):
+        return SQLiteBuckets(spec.partition(":")[2], rpm, tpm)
+    raise ValueError(f"Unknown AI_RATE_LIMIT_BACKEND: {spec!r}")
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """Process-wide scheduler, or None when no RPM/TPM limit is configured."""
+    global _scheduler
+    if not (AI_RATE_LIMIT_RPM or AI_RATE_LIMIT_TPM):
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = LLMScheduler(
+                    _build_buckets(AI_RATE_LIMIT_BACKEND, AI_RATE_LIMIT_RPM, AI_RATE_LIMIT_TPM),
+                    AI_RATE_LIMIT_RPM, AI_RATE_LIMIT_TPM,
+                )
+    return _scheduler
@@ -0,0 +1,254 @@
+# ==============================================
+# Resilience layer for LLM calls
+# ==============================================
+# - jittered exponential backoff that honors Retry-After / retry-after-ms
+# - one overall deadline per call (LLM_TIMEOUT), shared by every attempt
+# - a process-wide circuit breaker that fails fast while upstream is unhealthy
+# - counters for retries and breaker state (stats())
+# The OpenAI clients are built with max_retries=0 so retries only happen here.
+from __future__ import annotations
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .metrics import note
+
+LLM_TIMEOUT_S = int(os.getenv("LLM_TIMEOUT", "25"))
+AI_RETRY_MAX_ATTEMPTS = int(os.getenv("AI_RETRY_MAX_ATTEMPTS", "4"))
+AI_RETRY_BASE_DELAY_S = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+AI_RETRY_MAX_DELAY_S = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))     # consecutive failures to open
+AI_BREAKER_RESET_S = float(os.getenv("AI_BREAKER_RESET", "30"))      # open -> half-open after this
+
+# don't start an attempt with less budget than this; it would only time out
+_MIN_ATTEMPT_S = 1.0
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM upstream unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class RetryBudgetExhausted(Exception):
+    """Attempts or the LLM_TIMEOUT budget ran out while upstream kept failing."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ---- metrics
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, int] = {
+    "calls": 0, "attempts": 0, "retries": 0, "retry_after_honored": 0, "successes": 0,
+    "failures": 0, "exhausted": 0, "breaker_opened": 0, "breaker_rejected": 0,
+}
+
+
+def _bump(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        out: Dict[str, Any] = dict(_stats)
+    out["breaker_state"] = breaker.state
+    return out
+
+
+# ---- circuit breaker
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go upstream now."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True   # let exactly one probe through
+                return
+            retry_after = max(1.0, self.reset_timeout_s - (time.monotonic() - self._opened_at))
+        _bump("breaker_rejected")
+        raise CircuitOpenError(retry_after)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                _bump("breaker_opened")
+
+    def abort_probe(self) -> None:
+        """A half-open probe was cancelled before it produced a verdict."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reset(self) -> None:
+        self.record_success()
+
+
+breaker = CircuitBreaker(AI_BREAKER_FAILURES, AI_BREAKER_RESET_S)
+
+
+# ---- retry policy
+
+def is_retryable(exc: BaseException) -> bool:
+    # imported lazily so `import resilience` doesn't load the SDK; cached after the first failure
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+    if isinstance(exc, (APIConnectionError, RateLimitError)):  # APITimeoutError is a connection error
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in (408, 409) or exc.status_code >= 500
+    return False
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Parse retry-after-ms / Retry-After (seconds or HTTP date) from an API error."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return max(0.0, float(ms) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (1-based) retry number."""
+    cap = min(AI_RETRY_MAX_DELAY_S, AI_RETRY_BASE_DELAY_S * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+def _next_delay(exc: BaseException, attempt: int, deadline: float) -> float:
+    """Delay before the next attempt, or raise if retrying can't fit in the budget."""
+    remaining = deadline - time.monotonic()
+    hint = retry_after_seconds(exc)
+    delay = hint if hint is not None else backoff_delay(attempt)
+    if attempt >= AI_RETRY_MAX_ATTEMPTS or delay + _MIN_ATTEMPT_S > remaining:
+        _bump("exhausted")
+        raise RetryBudgetExhausted(f"LLM call failed after {attempt} attempt(s): {exc}", retry_after=hint) from exc
+    if hint is not None:
+        _bump("retry_after_honored")
+    _bump("retries")
+    note("retries")   # per-request count for the structured request log
+    return delay
+
+
+def call_with_retries(fn: Callable[[float], Any], *, budget_s: Optional[float] = None) -> Any:
+    """
+    Call fn(timeout) until it succeeds, a non-retryable error occurs or the budget
+    (default LLM_TIMEOUT) runs out. Each attempt gets the remaining budget as its timeout.
+    """
+    deadline = time.monotonic() + (LLM_TIMEOUT_S if budget_s is None else budget_s)
+    _bump("calls")
+    attempt = 0
+    while True:
+        breaker.before_call()
+        attempt += 1
+        _bump("attempts")
+        try:
+            result = fn(max(_MIN_ATTEMPT_S, deadline - time.monotonic()))
+        except Exception as exc:
+            if not is_retryable(exc):
+                breaker.record_success()  # upstream answered; the request itself was bad
+                raise
+            breaker.record_failure()
+            _bump("failures")
+            time.sleep(_next_delay(exc, attempt, deadline))
+            continue
+        breaker.record_success()
+        _bump("successes")
+        return result
+
+
+async def acall_with_retries(fn: Callable[[float], Awaitable[Any]], *, budget_s: Optional[float] = None) -> Any:
+    """asyncio twin of call_with_retries()."""
+    deadline = time.monotonic() + (LLM_TIMEOUT_S if budget_s is None else budget_s)
+    _bump("calls")
+    attempt = 0
+    while True:
+        breaker.before_call()
+        attempt += 1
+        _bump("attempts")
+        try:
+            result = await fn(max(_MIN_ATTEMPT_S, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            breaker.abort_probe()
+            raise
+        except Exception as exc:
+            if not is_retryable(exc):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            _bump("failures")
+            await asyncio.sleep(_next_delay(exc, attempt, deadline))
+            continue
+        breaker.record_success()
+        _bump("successes")
+        return result
+
+
+def degraded_result(exc: BaseException) -> Dict[str, Any]:
+    """Error dict for an unavailable upstream; views turn retry_after into a 503 + Retry-After."""
+    retry_after = getattr(exc, "retry_after", None)
+    return {
+        "error": str(exc),
+        "raw": "",
+        "degraded": True,
+        "retry_after": int(retry_after + 0.999) if retry_after is not None else 5,
+    }
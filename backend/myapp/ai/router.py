@@ -0,0 +1,249 @@
+# ==============================================
+# Local pre-router (first stage before the LLM)
+# ==============================================
+# A small multinomial logistic regression over hashed word/char n-grams,
+# trained from stored Ticket labels (manage.py train_router). It predicts
+# routing.category (and so routing.is_technical) with a confidence score:
+#   - confident non-technical -> ai_agent answers locally, no LLM call
+#   - otherwise the predicted category is passed to the prompt as a hint
+# The router is inactive until a model file exists. Pure Python, no deps.
+from __future__ import annotations
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .paths import data_path, ensure_parent
+
+NON_TECHNICAL = "non_technical"
+
+AI_ROUTER_ENABLED = os.getenv("AI_ROUTER", "true").strip().lower() not in ("0", "false", "no", "off")
+AI_ROUTER_MODEL = os.getenv("AI_ROUTER_MODEL", "")   # "" -> settings.AI_ROUTER_MODEL (<AI_DATA_DIR>/router_model.json)
+AI_ROUTER_SKIP_THRESHOLD = float(os.getenv("AI_ROUTER_SKIP_THRESHOLD", "0.9"))   # answer locally above this
+AI_ROUTER_HINT_THRESHOLD = float(os.getenv("AI_ROUTER_HINT_THRESHOLD", "0.6"))   # pass a hint above this
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def featurize(text: str, dim: int) -> Dict[int, float]:
+    """L2-normalized counts of hashed word uni/bigrams and char 3-grams."""
+    words = _WORD_RE.findall((text or "").lower())
+    feats: Dict[int, float] = {}
+
+    def add(token: str) -> None:
+        i = zlib.crc32(token.encode("utf-8")) % dim
+        feats[i] = feats.get(i, 0.0) + 1.0
+
+    for j, w in enumerate(words):
+        add("w:" + w)
+        if j:
+            add("b:" + words[j - 1] + " " + w)
+        padded = f"<{w}>"
+        for k in range(len(padded) - 2):
+            add("c:" + padded[k:k + 3])
+    norm = math.sqrt(sum(v * v for v in feats.values())) or 1.0
+    return {i: v / norm for i, v in feats.items()}
+
+
+class RoutePrediction:
+    __slots__ = ("category", "is_technical", "confidence")
+
+    def __init__(self, category: str, is_technical: bool, confidence: float):
+        self.category = category
+        self.is_technical = is_technical
+        self.confidence = confidence
+
+    def __repr__(self) -> str:
+        return f"RoutePrediction({self.category!r}, is_technical={self.is_technical}, confidence={self.confidence:.2f})"
+
+
+class LocalRouter:
+    def __init__(self, classes: Sequence[str], dim: int = 1 << 18):
+        self.classes = list(classes)
+        self.dim = dim
+        self.weights: Dict[str, Dict[int, float]] = {c: {} for c in self.classes}
+        self.bias: Dict[str, float] = {c: 0.0 for c in self.classes}
+        self.meta: Dict[str, Any] = {}
+
+    # ---- inference
+
+    def _probs(self, feats: Dict[int, float]) -> Dict[str, float]:
+        scores = {}
+        for c in self.classes:
+            w = self.weights[c]
+            scores[c] = self.bias[c] + sum(w.get(i, 0.0) * v for i, v in feats.items())
+        top = max(scores.values())
+        exp = {c: math.exp(s - top) for c, s in scores.items()}
+        total = sum(exp.values())
+        return {c: e / total for c, e in exp.items()}
+
+    def predict(self, text: str) -> RoutePrediction:
+        probs = self._probs(featurize(text, self.dim))
+        category = max(probs, key=probs.get)
+        p_non_tech = probs.get(NON_TECHNICAL, 0.0)
+        is_technical = p_non_tech < 0.5
+        # confidence in the routing decision (technical vs not) drives the skip
+        confidence = (1.0 - p_non_tech) if is_technical else p_non_tech
+        if is_technical and category == NON_TECHNICAL:
+            category = max((c for c in probs if c != NON_TECHNICAL), key=probs.get)
+        return RoutePrediction(category, is_technical, confidence)
+
+    # ---- training (multinomial logistic regression, plain SGD + L2)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], *, epochs: int = 8, lr: float = 0.5,
+            l2: float = 1e-5, seed: int = 13) -> "LocalRouter":
+        data = [(featurize(t, self.dim), y) for t, y in zip(texts, labels)]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            step = lr / (1.0 + epoch)
+            for feats, y in data:
+                probs = self._probs(feats)
+                for c in self.classes:
+                    g = probs[c] - (1.0 if c == y else 0.0)
+                    if abs(g) < 1e-4:
+                        continue
+                    w = self.weights[c]
+                    for i, v in feats.items():
+                        old = w.get(i, 0.0)
+                        w[i] = old - step * (g * v + l2 * old)
+                    self.bias[c] -= step * g
+        for c in self.classes:   # drop near-zero weights to keep the file small
+            self.weights[c] = {i: w for i, w in self.weights[c].items() if abs(w) > 1e-4}
+        return self
+
+    # ---- persistence
+
+    def save(self, path: str) -> None:
+        payload = {
+            "version": 1, "dim": self.dim, "classes": self.classes, "meta": self.meta,
+            "bias": self.bias,
+            "weights": {c: {str(i): round(w, 5) for i, w in ws.items()} for c, ws in self.weights.items()},
+        }
+        tmp = f"{ensure_parent(path)}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(payload, fh, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalRouter":
+        with open(path, encoding="utf-8") as fh:
+            payload = json.load(fh)
+        router = cls(payload["classes"], payload["dim"])
+        router.bias = {c: float(b) for c, b in payload["bias"].items()}
+        router.weights = {c: {int(i): w for i, w in ws.items()} for c, ws in payload["weights"].items()}
+        router.meta = payload.get("meta") or {}
+        return router
+
+
+def label_for(category: str, is_technical: bool) -> str:
+    """Training label from stored ticket fields."""
+    if not is_technical:
+        return NON_TECHNICAL
+    return (category or "other_technical").strip() or "other_technical"
+
+
+def evaluate(router: LocalRouter, texts: Sequence[str], labels: Sequence[str]) -> Dict[str, Any]:
+    """Offline accuracy/latency report on a held-out set."""
+    n = len(texts)
+    cat_ok = tech_ok = skipped = skipped_ok = 0
+    latencies: List[float] = []
+    for text, y in zip(texts, labels):
+        t0 = time.perf_counter()
+        pred = router.predict(text)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+        cat_ok += pred.category == y or (not pred.is_technical and y == NON_TECHNICAL)
+        tech_ok += pred.is_technical == (y != NON_TECHNICAL)
+        if not pred.is_technical and pred.confidence >= AI_ROUTER_SKIP_THRESHOLD:
+            skipped += 1
+            skipped_ok += y == NON_TECHNICAL
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+    return {
+        "n": n,
+        "category_accuracy": cat_ok / n if n else 0.0,
+        "is_technical_accuracy": tech_ok / n if n else 0.0,
+        "skip_rate": skipped / n if n else 0.0,
+        "skip_precision": skipped_ok / skipped if skipped else None,
+        "latency_us_p50": pct(0.50),
+        "latency_us_p95": pct(0.95),
+    }
+
+
+# ---- process-wide router used by ai_agent()
+
+_router: Optional[LocalRouter] = None
+_router_mtime: Optional[float] = None
+_router_lock = threading.Lock()
+
+
+def model_path() -> str:
+    return AI_ROUTER_MODEL or data_path("AI_ROUTER_MODEL", "router_model.json")
+
+
+def get_router() -> Optional[LocalRouter]:
+    """The trained router, reloaded when the model file changes; None when absent/disabled."""
+    global _router, _router_mtime
+    if not AI_ROUTER_ENABLED:
+        return None
+    path = model_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if mtime != _router_mtime:
+        with _router_lock:
+            if mtime != _router_mtime:
+                try:
+                    _router = LocalRouter.load(path)
+                except (OSError, ValueError, KeyError):
+                    _router = None
+                _router_mtime = mtime
+    return _router
+
+
+def preroute(text: str) -> Tuple[Optional[Dict[str, Any]], Optional[RoutePrediction]]:
+    """
+    Returns (local_result, hint):
+      local_result -- a complete ai_agent-shaped answer when confidently non-technical
+      hint         -- a prediction worth passing to the prompt, otherwise None
+    """
+    router = get_router()
+    if router is None:
+        return None, None
+    pred = router.predict(text)
+    if not pred.is_technical and pred.confidence >= AI_ROUTER_SKIP_THRESHOLD:
+        return non_technical_result(pred), None
+    if pred.confidence >= AI_ROUTER_HINT_THRESHOLD:
+        return None, pred
+    return None, None
+
+
+def non_technical_result(pred: RoutePrediction) -> Dict[str, Any]:
+    return {
+        "routing": {
+            "is_technical": False,
+            "category": NON_TECHNICAL,
+            "confidence": round(pred.confidence, 3),
+            "source": "local_router",
+        },
+        "summary": "",
+        "steps_to_apply": [],
+        "verification_checklist": [],
+        "requests_for_more_info": [],
+        "solution": {"code_language": None, "code": ""},
+    }
+
+
+def training_rows(rows: Iterable[Tuple[str, str, bool]]) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for text, category, is_technical in rows:
+        if (text or "").strip():
+            texts.append(text)
+            labels.append(label_for(category, is_technical))
+    return texts, labels
@@ -0,0 +1,453 @@
+# ==============================================
+# Model output: lenient parsing, local repair, typed result
+# ==============================================
+# check_output(text) replaces the bare json.loads() of the agent:
+#   1. parse leniently: ``` fences and prose around the object are dropped, and
+#      JSON cut off by max_tokens is closed at the last complete value (an open
+#      string value is kept, closed);
+#   2. run the field checkers: one plain function per top-level key, no generic
+#      schema walk per call. They coerce the usual defects (commands as one
+#      string, steps as strings, "0.8" or 80 as confidence, more than 6 steps,
+#      unknown code_language, extra keys, ...) and name every repair;
+#   3. list what could not be repaired (no routing, no summary, fewer than 3
+#      steps for a technical answer): the agent re-asks the model for those
+#      fields only (reask_messages + merge) instead of regenerating everything.
+# The result is an AgentResult of slotted dataclasses; to_dict() is the plain
+# shape stored in the cache / AIRecord.result and read by for_frontend().
+from __future__ import annotations
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .prompt import CATEGORIES
+from .router import NON_TECHNICAL
+
+AI_SCHEMA_REASK = os.getenv("AI_SCHEMA_REASK", "true").strip().lower() not in ("0", "false", "no", "off")
+
+MIN_STEPS, MAX_STEPS = 3, 6
+MAX_QUESTIONS = 3
+CODE_LANGUAGES = ("bash", "python", "text")
+FIELDS = ("routing", "summary", "steps_to_apply", "verification_checklist", "requests_for_more_info", "solution")
+
+_LANGUAGE_ALIASES = {
+    "sh": "bash", "shell": "bash", "zsh": "bash", "console": "bash", "terminal": "bash", "cmd": "text",
+    "powershell": "text", "py": "python", "python3": "python", "plaintext": "text", "txt": "text",
+    "none": None, "null": None, "": None,
+}
+_BOOL_WORDS = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+_FENCE_LINE_RE = re.compile(r"^\s*```")
+
+
+@dataclass(slots=True)
+class Routing:
+    is_technical: bool = True
+    category: str = "other_technical"
+    confidence: float = 0.0
+    source: Optional[str] = None   # set by local answers (router, cascade route), never by the model
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"is_technical": self.is_technical, "category": self.category, "confidence": self.confidence}
+        if self.source:
+            out["source"] = self.source
+        return out
+
+
+@dataclass(slots=True)
+class Step:
+    text: str
+    commands: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"text": self.text, "commands": list(self.commands)}
+
+
+@dataclass(slots=True)
+class Solution:
+    code_language: Optional[str] = None
+    code: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"code_language": self.code_language, "code": self.code}
+
+
+@dataclass(slots=True)
+class AgentResult:
+    routing: Routing = field(default_factory=Routing)
+    summary: str = ""
+    steps_to_apply: List[Step] = field(default_factory=list)
+    verification_checklist: List[str] = field(default_factory=list)
+    requests_for_more_info: List[str] = field(default_factory=list)
+    solution: Solution = field(default_factory=Solution)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "routing": self.routing.to_dict(),
+            "summary": self.summary,
+            "steps_to_apply": [s.to_dict() for s in self.steps_to_apply],
+            "verification_checklist": list(self.verification_checklist),
+            "requests_for_more_info": list(self.requests_for_more_info),
+            "solution": self.solution.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "AgentResult":
+        """A typed view of a stored / cached answer, repaired the same way as a fresh one."""
+        return validate(data).result or cls()
+
+
+@dataclass(slots=True)
+class Checked:
+    result: Optional[AgentResult]                         # None: nothing usable was parsed
+    repairs: List[str] = field(default_factory=list)      # "path:what" for every local fix
+    failed: Dict[str, str] = field(default_factory=dict)  # top-level field -> problem, to re-ask
+
+
+class _Invalid(ValueError):
+    pass
+
+
+# ---- 1) lenient parsing
+
+def _closers(stack: List[str]) -> str:
+    return "".join(reversed(stack))
+
+
+def _complete_prefix(body: str) -> tuple:
+    """
+    (complete_object, candidates): the first balanced object in `body` (which
+    starts with "{"), or, when it is cut off, texts that close it.
+    """
+    stack: List[str] = []
+    in_str = esc = False
+    cut: Optional[tuple] = None   # (end, closers) after the last complete value
+    for i, ch in enumerate(body):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cut = (i + 1, _closers(stack))
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return body[:i + 1], []
+            cut = (i + 1, _closers(stack))
+        elif ch == ",":
+            cut = (i, _closers(stack))
+    candidates = []
+    if in_str:   # keep a half-written string value (summary, step text), closed
+        candidates.append((body[:-1] if esc else body) + '"' + _closers(stack))
+    if cut is not None:
+        candidates.append(body[:cut[0]].rstrip().rstrip(",") + cut[1])
+    return None, candidates
+
+
+def loads_lenient(text: Any, repairs: List[str]) -> Optional[Dict[str, Any]]:
+    """The JSON object in `text`, repairing fences / prose / truncation; None when there is none."""
+    if not isinstance(text, str):
+        return None
+    try:
+        data = json.loads(text)
+        return data if isinstance(data, dict) else None
+    except ValueError:
+        pass
+    start = text.find("{")
+    if start < 0:
+        return None
+    body = text[start:]
+    complete, candidates = _complete_prefix(body)
+    if complete is not None:
+        repairs.append("json:fences" if "```" in text else "json:extra_text")
+        candidates = [complete]
+    else:
+        repairs.append("json:truncated")
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+# ---- 2) field checkers
+
+def _text(v: Any, path: str, repairs: List[str]) -> str:
+    if isinstance(v, str):
+        return v.strip()
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        repairs.append(f"{path}:type")
+        return str(v)
+    if isinstance(v, list) and all(isinstance(x, str) for x in v):
+        repairs.append(f"{path}:type")
+        return " ".join(x.strip() for x in v if x.strip())
+    raise _Invalid("missing" if v is None else f"expected a string, got {type(v).__name__}")
+
+
+def _lines(v: str) -> List[str]:
+    return [ln.strip().lstrip("-*• ").strip() for ln in v.splitlines() if ln.strip() and not _FENCE_LINE_RE.match(ln)]
+
+
+def _text_list(v: Any, path: str, repairs: List[str]) -> List[str]:
+    if v is None:
+        return []
+    if isinstance(v, str):
+        repairs.append(f"{path}:split")
+        return _lines(v)
+    if not isinstance(v, list):
+        raise _Invalid(f"expected a list of strings, got {type(v).__name__}")
+    out = []
+    for x in v:
+        if isinstance(x, str):
+            if x.strip():
+                out.append(x.strip())
+        elif isinstance(x, (int, float)) and not isinstance(x, bool):
+            repairs.append(f"{path}:type")
+            out.append(str(x))
+        else:
+            repairs.append(f"{path}:dropped")
+    return out
+
+
+def _command(c: str) -> str:
+    c = c.strip()
+    if len(c) > 1 and c[0] == c[-1] == "`":
+        c = c.strip("`").strip()
+    return c
+
+
+def _commands(v: Any, path: str, repairs: List[str]) -> List[str]:
+    if isinstance(v, str):   # "pip install x\npip install y"
+        repairs.append(f"{path}:split")
+        return [_command(c) for c in _lines(v)]
+    return [c for c in (_command(c) for c in _text_list(v, path, repairs)) if c]
+
+
+def _bool(v: Any) -> Optional[bool]:
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, str):
+        return _BOOL_WORDS.get(v.strip().lower())
+    return None
+
+
+def _routing(v: Any, repairs: List[str]) -> Routing:
+    if not isinstance(v, dict):
+        raise _Invalid("missing" if v is None else "expected an object")
+    is_technical = _bool(v.get("is_technical"))
+    if is_technical is not None and not isinstance(v.get("is_technical"), bool):
+        repairs.append("routing.is_technical:type")
+    category = v.get("category")
+    if isinstance(category, str) and category not in CATEGORIES:
+        normalized = re.sub(r"[\s\-/]+", "_", category.strip().lower())
+        category = normalized if normalized in CATEGORIES else None
+        if category is not None:
+            repairs.append("routing.category:normalized")
+    elif not isinstance(category, str):
+        category = None
+    if is_technical is None and category is None:
+        raise _Invalid("is_technical and category are missing or invalid")
+    if is_technical is None:
+        is_technical = category != NON_TECHNICAL
+        repairs.append("routing.is_technical:inferred")
+    if category is None or (category == NON_TECHNICAL) == is_technical:
+        category = "other_technical" if is_technical else NON_TECHNICAL
+        repairs.append("routing.category:inferred")
+
+    confidence = v.get("confidence")
+    if isinstance(confidence, str):
+        try:
+            confidence = float(confidence.strip().rstrip("%")) / (100 if confidence.strip().endswith("%") else 1)
+            repairs.append("routing.confidence:type")
+        except ValueError:
+            confidence = None
+    if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+        repairs.append("routing.confidence:missing")
+        confidence = 0.0
+    elif not 0.0 <= confidence <= 1.0:
+        repairs.append("routing.confidence:range")
+        confidence = confidence / 100 if 1.0 < confidence <= 100.0 else min(1.0, max(0.0, confidence))
+    source = v.get("source") if isinstance(v.get("source"), str) else None
+    return Routing(is_technical, category, float(confidence), source)
+
+
+def as_step(item: Any, repairs: Optional[List[str]] = None, path: str = "steps_to_apply") -> Optional[Step]:
+    """One element of steps_to_apply as a Step (a bare string is a step without commands); None if empty."""
+    repairs = [] if repairs is None else repairs
+    if isinstance(item, Step):
+        return item
+    if isinstance(item, str):
+        repairs.append(f"{path}:strings")
+        return Step(item.strip()) if item.strip() else None
+    if not isinstance(item, dict):
+        repairs.append(f"{path}:dropped")
+        return None
+    raw = item.get("text")
+    if raw is None:
+        raw = item.get("step") or item.get("action") or item.get("description")
+        if raw is not None:
+            repairs.append(f"{path}.text:renamed")
+    try:
+        text = _text(raw, f"{path}.text", repairs) if raw is not None else ""
+    except _Invalid:
+        text = ""
+    try:
+        commands = _commands(item.get("commands"), f"{path}.commands", repairs)
+    except _Invalid:
+        repairs.append(f"{path}.commands:dropped")
+        commands = []
+    if not text and commands:
+        text = "Run the following commands/code:"
+    if not text:
+        repairs.append(f"{path}:dropped")
+        return None
+    return Step(text, commands)
+
+
+def _steps(v: Any, is_technical: bool, repairs: List[str]) -> List[Step]:
+    if v is None:
+        items: List[Any] = []
+    elif isinstance(v, str):
+        repairs.append("steps_to_apply:split")
+        items = _lines(v)
+    elif isinstance(v, list):
+        items = v
+    else:
+        raise _Invalid(f"expected a list of steps, got {type(v).__name__}")
+    steps = [s for s in (as_step(item, repairs) for item in items) if s is not None]
+    if not is_technical:
+        if steps:
+            repairs.append("steps_to_apply:non_technical")
+        return []
+    if len(steps) > MAX_STEPS:
+        # fold the overflow into the last allowed step rather than dropping it
+        rest = steps[MAX_STEPS - 1:]
+        steps = steps[:MAX_STEPS - 1] + [Step("; ".join(s.text.rstrip(".") for s in rest) + ".",
+                                              [c for s in rest for c in s.commands])]
+        repairs.append("steps_to_apply:merged")
+    return steps
+
+
+def _solution(v: Any, repairs: List[str]) -> Solution:
+    if v is None:
+        return Solution()
+    if isinstance(v, str):   # the code itself
+        repairs.append("solution:type")
+        v = {"code": v}
+    if not isinstance(v, dict):
+        repairs.append("solution:dropped")
+        return Solution()
+    code = v.get("code")
+    if code is None:
+        code = ""
+    elif not isinstance(code, str):
+        code = "\n".join(code) if isinstance(code, list) and all(isinstance(c, str) for c in code) else ""
+        repairs.append("solution.code:type")
+    code = "\n".join(ln for ln in code.strip().splitlines() if not _FENCE_LINE_RE.match(ln))
+    lang = v.get("code_language")
+    if lang is not None and lang not in CODE_LANGUAGES:
+        key = str(lang).strip().lower()
+        lang = _LANGUAGE_ALIASES.get(key, "text") if key in _LANGUAGE_ALIASES or code else None
+        repairs.append("solution.code_language:normalized")
+    if lang is not None and not code:
+        lang = None
+    return Solution(lang, code)
+
+
+def validate(data: Any) -> Checked:
+    """Check and repair a parsed answer; failed lists what only the model can fix."""
+    if not isinstance(data, dict):
+        return Checked(None, [], {name: "missing" for name in FIELDS})
+    repairs: List[str] = []
+    failed: Dict[str, str] = {}
+    result = AgentResult()
+
+    try:
+        result.routing = _routing(data.get("routing"), repairs)
+    except _Invalid as e:
+        failed["routing"] = str(e)
+    is_technical = result.routing.is_technical
+
+    try:
+        result.summary = _text(data.get("summary"), "summary", repairs)
+    except _Invalid as e:
+        if is_technical:
+            failed["summary"] = str(e)
+    try:
+        # too few steps still fail, but are kept: the best answer if the re-ask is off or fails
+        result.steps_to_apply = _steps(data.get("steps_to_apply"), is_technical, repairs)
+        if is_technical and len(result.steps_to_apply) < MIN_STEPS:
+            failed["steps_to_apply"] = (
+                f"{len(result.steps_to_apply)} steps; a technical answer needs {MIN_STEPS} to {MAX_STEPS}"
+            )
+    except _Invalid as e:
+        failed["steps_to_apply"] = str(e)
+    for name in ("verification_checklist", "requests_for_more_info"):
+        try:
+            setattr(result, name, _text_list(data.get(name), name, repairs))
+        except _Invalid:
+            repairs.append(f"{name}:dropped")
+    if len(result.requests_for_more_info) > MAX_QUESTIONS:
+        result.requests_for_more_info = result.requests_for_more_info[:MAX_QUESTIONS]
+        repairs.append("requests_for_more_info:truncated")
+    result.solution = _solution(data.get("solution"), repairs)
+    if any(k not in FIELDS for k in data):
+        repairs.append("extra_keys:dropped")
+    return Checked(result, list(dict.fromkeys(repairs)), failed)
+
+
+def check_output(text: Any) -> Checked:
+    """Parse + validate one model reply."""
+    repairs: List[str] = []
+    checked = validate(loads_lenient(text, repairs))
+    checked.repairs[:0] = repairs
+    return checked
+
+
+# ---- 3) partial re-ask
+
+def reask_messages(messages: List[Dict[str, str]], checked: Checked, reply: Any) -> List[Dict[str, str]]:
+    """The original conversation + the (repaired) reply + a request for the failed fields only."""
+    if checked.result is None:
+        previous = reply if isinstance(reply, str) else ""
+        ask = "Your reply was not a valid JSON object. Return the complete JSON object following the schema."
+    else:
+        previous = json.dumps(checked.result.to_dict(), ensure_ascii=False)
+        problems = "; ".join(f"{k}: {v}" for k, v in checked.failed.items())
+        ask = (
+            f"These fields of your JSON are missing or invalid: {problems}. "
+            f"Return a JSON object with ONLY these keys: {', '.join(checked.failed)}, following the schema and "
+            "rules above and consistent with the rest of your answer."
+        )
+    return messages + [{"role": "assistant", "content": previous[:4000]}, {"role": "user", "content": ask}]
+
+
+def merge(checked: Checked, reply: Any) -> Checked:
+    """`checked` with the failed fields taken from the re-ask `reply` (and validated again)."""
+    repairs: List[str] = []
+    patch = loads_lenient(reply, repairs)
+    if patch is None:
+        return checked
+    if checked.result is None:
+        data = patch
+    else:
+        data = checked.result.to_dict()
+        for k in checked.failed:   # a field the reply left out stays failed (partial steps are kept)
+            data[k] = patch.get(k, data[k] if k == "steps_to_apply" else None)
+    merged = validate(data)
+    if merged.result is None:
+        return checked
+    merged.repairs = list(dict.fromkeys(checked.repairs + repairs + merged.repairs))
+    return merged
@@ -0,0 +1,194 @@
+# ==============================================
+# Near-duplicate answer reuse (local vector index)
+# ==============================================
+# The exact-match cache misses paraphrases ("pip is not recognized as a
+# command" vs "pip command not found windows"). Every answered complaint is
+# embedded with signed, hashed char 3..5-grams (log-TF, L2-normalized) and
+# kept in a float32 matrix; a new complaint whose cosine similarity to a stored
+# one reaches AI_SIMILAR_THRESHOLD gets the stored answer back.
+#
+# Persistence is append-only, in AI_DATA_DIR (paths.py; never in the source
+# tree or in git: the rows hold raw student complaints):
+#   <AI_SIMILAR_INDEX>.f32    raw float32 rows (dim floats per answer)
+#   <AI_SIMILAR_INDEX>.jsonl  one {"tag", "text", "result"} line per answer
+# Every worker appends under a file lock and picks up the other workers'
+# rows on its next lookup. Needs numpy; without it the index is disabled.
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from .paths import data_path, ensure_parent
+
+# numpy (optional) is imported by get_index() on first use: it is most of this
+# module's import cost and workers that never look anything up shouldn't pay it
+np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process dev servers don't need the lock
+    fcntl = None
+
+AI_SIMILAR_ENABLED = os.getenv("AI_SIMILAR", "true").strip().lower() not in ("0", "false", "no", "off")
+AI_SIMILAR_INDEX = os.getenv("AI_SIMILAR_INDEX", "")   # "" -> settings.AI_SIMILAR_INDEX (<AI_DATA_DIR>/similar_index)
+AI_SIMILAR_THRESHOLD = float(os.getenv("AI_SIMILAR_THRESHOLD", "0.92"))
+AI_SIMILAR_DIM = int(os.getenv("AI_SIMILAR_DIM", "1024"))
+AI_SIMILAR_MAX_ROWS = int(os.getenv("AI_SIMILAR_MAX_ROWS", "50000"))
+
+_WS_RE = re.compile(r"\s+")
+
+
+def embed(text: str, dim: int = AI_SIMILAR_DIM):
+    """Signed feature-hashed char 3..5-grams -> unit float32 vector."""
+    norm = _WS_RE.sub(" ", (text or "").strip()).casefold()
+    padded = f" {norm} "
+    buckets: List[int] = []
+    signs: List[float] = []
+    for n in (3, 4, 5):
+        for i in range(len(padded) - n + 1):
+            h = zlib.crc32(padded[i:i + n].encode("utf-8"))
+            buckets.append(h % dim)
+            signs.append(1.0 if (h >> 31) & 1 else -1.0)
+    vec = np.bincount(np.asarray(buckets, dtype=np.int64), weights=signs, minlength=dim)[:dim] if buckets \
+        else np.zeros(dim)
+    vec = np.sign(vec) * np.log1p(np.abs(vec))
+    length = float(np.linalg.norm(vec))
+    return (vec / length if length else vec).astype(np.float32)
+
+
+class SimilarityIndex:
+    def __init__(self, base_path: str, dim: int = AI_SIMILAR_DIM, max_rows: int = AI_SIMILAR_MAX_ROWS):
+        ensure_parent(base_path)
+        self.vec_path = base_path + ".f32"
+        self.meta_path = base_path + ".jsonl"
+        self.lock_path = base_path + ".lock"
+        self.dim = dim
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._n = 0
+        self._tags: List[str] = []
+        self._results: List[str] = []     # JSON text, decoded on hit so callers get a fresh copy
+        self._vec_offset = 0
+        self._meta_offset = 0
+        self.stats = {"lookups": 0, "hits": 0, "adds": 0}
+        self._sync()
+
+    # ---- storage
+
+    def _file_lock(self):
+        fh = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        return fh
+
+    def _ensure_capacity(self, rows: int) -> None:
+        if rows <= self._matrix.shape[0]:
+            return
+        grown = np.zeros((max(rows, 2 * self._matrix.shape[0], 64), self.dim), dtype=np.float32)
+        grown[:self._n] = self._matrix[:self._n]
+        self._matrix = grown
+
+    def _sync(self) -> None:
+        """Load rows appended (by any process) since the last sync. Caller need not hold the lock."""
+        try:
+            vec_size = os.path.getsize(self.vec_path)
+            meta_size = os.path.getsize(self.meta_path)
+        except OSError:
+            return
+        if vec_size == self._vec_offset and meta_size == self._meta_offset:
+            return
+        with self._lock:
+            with open(self.meta_path, "rb") as fh:
+                fh.seek(self._meta_offset)
+                chunk = fh.read(meta_size - self._meta_offset)
+            # ignore a trailing partial line (another process mid-append)
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+            new_meta = [json.loads(line) for line in complete.splitlines() if line.strip()]
+            row_bytes = self.dim * 4
+            vec_rows = (vec_size - self._vec_offset) // row_bytes
+            rows = min(len(new_meta), vec_rows)
+            if rows <= 0:
+                return
+            new_vecs = np.fromfile(self.vec_path, dtype=np.float32, count=rows * self.dim,
+                                   offset=self._vec_offset).reshape(rows, self.dim)
+            self._ensure_capacity(self._n + rows)
+            self._matrix[self._n:self._n + rows] = new_vecs
+            for meta in new_meta[:rows]:
+                self._tags.append(meta["tag"])
+                self._results.append(json.dumps(meta["result"], ensure_ascii=False))
+            self._n += rows
+            self._vec_offset += rows * row_bytes
+            consumed = b"".join(line + b"\n" for line in complete.splitlines()[:rows])
+            self._meta_offset += len(consumed)
+
+    # ---- API
+
+    def lookup(self, text: str, tag: str, threshold: float = AI_SIMILAR_THRESHOLD) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Best stored answer for `text` under the same tag (model/prompt), if similar enough."""
+        self._sync()
+        with self._lock:
+            matrix, n, tags = self._matrix, self._n, self._tags
+            self.stats["lookups"] += 1
+        if n == 0:
+            return None
+        scores = matrix[:n] @ embed(text, self.dim)
+        for i in np.argsort(scores)[::-1][:8]:
+            if scores[i] < threshold:
+                break
+            if tags[i] == tag:
+                with self._lock:
+                    self.stats["hits"] += 1
+                return json.loads(self._results[i]), float(scores[i])
+        return None
+
+    def add(self, text: str, tag: str, result: Dict[str, Any]) -> None:
+        """Append one answered complaint (persisted, then visible to every worker)."""
+        if self._n >= self.max_rows:
+            return
+        vec = embed(text, self.dim)
+        line = json.dumps({"tag": tag, "text": text, "result": result}, ensure_ascii=False) + "\n"
+        lock = self._file_lock()
+        try:
+            with open(self.vec_path, "ab") as fh:
+                fh.write(vec.tobytes())
+            with open(self.meta_path, "a", encoding="utf-8") as fh:
+                fh.write(line)
+        finally:
+            lock.close()
+        with self._lock:
+            self.stats["adds"] += 1
+        self._sync()
+
+    def __len__(self) -> int:
+        return self._n
+
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+
+def _import_numpy() -> bool:
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # optional dependency
+            return False
+        np = numpy
+    return True
+
+
+def get_index() -> Optional[SimilarityIndex]:
+    """Process-wide index; None when disabled or numpy is missing."""
+    global _index
+    if not AI_SIMILAR_ENABLED or not _import_numpy():
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarityIndex(AI_SIMILAR_INDEX or data_path("AI_SIMILAR_INDEX", "similar_index"))
+    return _index
@@ -0,0 +1,209 @@
+# ==============================================
+# Single-flight: one upstream call per identical in-flight complaint
+# ==============================================
+# During an outage dozens of students paste the same error within seconds.
+# ai_agent() / ai_agent_async() run through flights.do() / flights.ado(): the
+# first caller for a key (normalized complaint + model + max_tokens + prompt
+# version, i.e. the cache key) makes the call, everyone who arrives while it is
+# in flight waits for that result instead of calling upstream again.
+# - shared across threads and event loops of one process (a concurrent Future);
+# - each waiter has its own timeout; the leader's exception reaches every waiter;
+#   a cancelled leader releases its waiters to make the call themselves;
+# - AI_SINGLEFLIGHT_LOCK_DIR=<dir> adds a per-key file lock across processes:
+#   the second process waits for the first one's call and then answers from
+#   the shared cache tier (AI_CACHE_BACKEND), so it is only useful with one.
+#   A lock file only exists while its call is in flight.
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from .resilience import LLM_TIMEOUT_S
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+AI_SINGLEFLIGHT_ENABLED = os.getenv("AI_SINGLEFLIGHT", "true").strip().lower() not in ("0", "false", "no", "off")
+AI_SINGLEFLIGHT_LOCK_DIR = os.getenv("AI_SINGLEFLIGHT_LOCK_DIR", "")
+# a waiter gives up after this long (the leader's own call is bounded by LLM_TIMEOUT)
+AI_SINGLEFLIGHT_WAIT_S = float(os.getenv("AI_SINGLEFLIGHT_WAIT", str(LLM_TIMEOUT_S + 5)))
+
+_LOCK_POLL_S = 0.05
+
+
+class Abandoned(Exception):
+    """The leader was cancelled before finishing; waiters should make the call themselves."""
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, concurrent.futures.Future] = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "abandoned": 0, "cross_process_waits": 0}
+
+    def _bump(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _join(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """(future, True) for the caller that must make the call, (future, False) for waiters."""
+        with self._lock:
+            fut = self._calls.get(key)
+            if fut is not None:
+                self._stats["coalesced"] += 1
+                return fut, False
+            fut = self._calls[key] = concurrent.futures.Future()
+            self._stats["leaders"] += 1
+            return fut, True
+
+    def _settle(self, key: str, fut: concurrent.futures.Future, value: Any = None,
+                exc: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._calls.get(key) is fut:
+                del self._calls[key]
+        if exc is not None:
+            fut.set_exception(exc)
+        else:
+            fut.set_result(value)
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float = AI_SINGLEFLIGHT_WAIT_S) -> Tuple[Any, bool]:
+        """Returns (value, shared). Raises the leader's exception, TimeoutError or Abandoned."""
+        fut, leader = self._join(key)
+        if not leader:
+            try:
+                return fut.result(timeout), True
+            except concurrent.futures.TimeoutError:
+                self._bump("timeouts")
+                raise TimeoutError(f"identical request still in flight after {timeout:g}s") from None
+        try:
+            value = fn()
+        except Exception as e:
+            self._settle(key, fut, exc=e)
+            raise
+        except BaseException:
+            self._bump("abandoned")
+            self._settle(key, fut, exc=Abandoned())
+            raise
+        self._settle(key, fut, value)
+        return value, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]],
+                  timeout: float = AI_SINGLEFLIGHT_WAIT_S) -> Tuple[Any, bool]:
+        """asyncio twin of do(); waiters in other threads or loops share the same call."""
+        fut, leader = self._join(key)
+        if not leader:
+            try:
+                # shield: a waiter timing out or being cancelled must not cancel the shared call
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), timeout), True
+            except asyncio.TimeoutError:
+                self._bump("timeouts")
+                raise TimeoutError(f"identical request still in flight after {timeout:g}s") from None
+        try:
+            value = await fn()
+        except Exception as e:
+            self._settle(key, fut, exc=e)
+            raise
+        except BaseException:   # CancelledError: the client went away
+            self._bump("abandoned")
+            self._settle(key, fut, exc=Abandoned())
+            raise
+        self._settle(key, fut, value)
+        return value, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self._stats)
+            out["in_flight"] = len(self._calls)
+        return out
+
+
+flights = SingleFlight()
+
+
+# ---- across processes (optional)
+
+def _try_lock(path: str) -> Optional[int]:
+    """
+    The locked fd, or None if another process holds the lock. The holder unlinks the file
+    before releasing it (so the directory doesn't keep one file per complaint ever seen);
+    a lock taken on a file that was unlinked meanwhile is stale, so retry on the new one.
+    """
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        try:
+            st, current = os.fstat(fd), os.stat(path)
+            if (st.st_dev, st.st_ino) == (current.st_dev, current.st_ino):
+                return fd
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _lock_path(key: str) -> Optional[str]:
+    if not AI_SINGLEFLIGHT_LOCK_DIR or fcntl is None:
+        return None
+    os.makedirs(AI_SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    return os.path.join(AI_SINGLEFLIGHT_LOCK_DIR, f"{key[:40]}.lock")
+
+
+def _unlock(fd: Optional[int], path: Optional[str]) -> None:
+    if fd is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)   # while still holding it: see _try_lock()
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def process_lock(key: str, timeout: float = AI_SINGLEFLIGHT_WAIT_S):
+    """Hold the per-key file lock (no-op unless AI_SINGLEFLIGHT_LOCK_DIR is set)."""
+    path = _lock_path(key)
+    fd = None
+    if path is not None:
+        deadline = time.monotonic() + timeout
+        fd = _try_lock(path)
+        if fd is None:
+            flights._bump("cross_process_waits")
+        # on timeout, go ahead without the lock: a duplicate call beats a failed one
+        while fd is None and time.monotonic() < deadline:
+            time.sleep(_LOCK_POLL_S)
+            fd = _try_lock(path)
+    try:
+        yield
+    finally:
+        _unlock(fd, path)
+
+
+@contextlib.asynccontextmanager
+async def aprocess_lock(key: str, timeout: float = AI_SINGLEFLIGHT_WAIT_S):
+    """process_lock() that waits with asyncio.sleep instead of blocking the loop."""
+    path = _lock_path(key)
+    fd = None
+    if path is not None:
+        deadline = time.monotonic() + timeout
+        fd = _try_lock(path)
+        if fd is None:
+            flights._bump("cross_process_waits")
+        while fd is None and time.monotonic() < deadline:
+            await asyncio.sleep(_LOCK_POLL_S)
+            fd = _try_lock(path)
+    try:
+        yield
+    finally:
+        _unlock(fd, path)
@@ -0,0 +1,130 @@
+# ==============================================
+# Incremental parser for a streamed agent result
+# ==============================================
+# The model streams ONE JSON object (see RESPONSE_SCHEMA). We don't need a
+# general streaming JSON parser: only the top-level fields and the elements of
+# steps_to_apply matter, so this scanner tracks string/escape state and nesting
+# depth over the new characters of each chunk and emits
+#   ("field", key, value)   when a top-level value is syntactically complete
+#   ("step", index, value)  when an element of steps_to_apply is complete
+# Every character is scanned exactly once.
+from __future__ import annotations
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+STEPS_KEY = "steps_to_apply"
+
+Event = Tuple[Any, ...]
+
+
+class StreamingResultParser:
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._state = "key"              # top level: key -> colon -> value -> comma
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._elem_start: Optional[int] = None
+        self._step_index = 0
+
+    def feed(self, chunk: str) -> List[Event]:
+        self.text += chunk
+        events: List[Event] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                    self._end_string(i, events)
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                self._str_start = i
+                self._begin_value(i)
+            elif ch in "{[":
+                self._begin_value(i)
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit_field(self._value_start, i, events)   # primitive closed by '}'
+                self._depth -= 1
+                if self._depth == 2 and self._elem_start is not None:
+                    self._emit_step(self._elem_start, i + 1, events)
+                elif self._depth == 1 and self._value_start is not None:
+                    self._emit_field(self._value_start, i + 1, events)
+            elif ch == ":" and self._depth == 1:
+                self._state = "value"
+            elif ch == ",":
+                if self._depth == 1:
+                    if self._value_start is not None:
+                        self._emit_field(self._value_start, i, events)
+                    self._state = "key"
+                elif self._depth == 2 and self._elem_start is not None:
+                    self._emit_step(self._elem_start, i, events)  # primitive step element
+            elif not ch.isspace():
+                self._begin_value(i)  # number / true / false / null
+        self._pos = len(text)
+        return events
+
+    # ---- helpers
+
+    def _in_steps_array(self) -> bool:
+        return self._depth == 2 and self._key == STEPS_KEY and self._value_start is not None
+
+    def _begin_value(self, i: int) -> None:
+        if self._depth == 1 and self._state == "value" and self._value_start is None:
+            self._value_start = i
+        elif self._in_steps_array() and self._elem_start is None:
+            self._elem_start = i
+
+    def _end_string(self, i: int, events: List[Event]) -> None:
+        if self._depth != 1:
+            if self._in_steps_array() and self._elem_start == self._str_start:
+                self._emit_step(self._elem_start, i + 1, events)
+            return
+        if self._state == "key":
+            try:
+                self._key = json.loads(self.text[self._str_start:i + 1])
+            except ValueError:
+                self._key = None
+            self._state = "colon"
+        elif self._value_start is not None:
+            self._emit_field(self._value_start, i + 1, events)
+
+    def _emit_field(self, start: int, end: int, events: List[Event]) -> None:
+        self._value_start = None
+        self._state = "comma"
+        try:
+            value = json.loads(self.text[start:end])
+        except ValueError:
+            return
+        if self._key is not None:
+            events.append(("field", self._key, value))
+
+    def _emit_step(self, start: int, end: int, events: List[Event]) -> None:
+        self._elem_start = None
+        try:
+            value = json.loads(self.text[start:end])
+        except ValueError:
+            return
+        events.append(("step", self._step_index, value))
+        self._step_index += 1
+
+
+def replay_events(result: Dict[str, Any]) -> Iterator[Event]:
+    """The events a stream of `result` would have produced (used for cache hits)."""
+    for key, value in result.items():
+        if key == STEPS_KEY and isinstance(value, list):
+            for i, step in enumerate(value):
+                yield ("step", i, step)
+        yield ("field", key, value)
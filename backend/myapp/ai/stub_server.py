@@ -0,0 +1,220 @@
+# ==============================================
+# Local OpenAI-compatible stub server (offline benchmarking)
+# ==============================================
+# Serves POST /v1/chat/completions (plain and stream=true) from
+#   - recorded answers (the AI_REPLAY_FIXTURES JSONL format, same request
+#     fingerprint as the replay provider), falling back to
+#   - the fake provider's canned answer (or a 404 with strict=True),
+# after a sampled latency, and answers a configurable share of requests with
+# 429 + Retry-After so retries, the breaker and the rate limiter get exercised.
+# GET /stats returns counters. stdlib only: runs anywhere the app runs.
+#
+#   python manage.py llm_stub --port 8900 --latency lognormal:800:0.4 --rate-429 0.02
+#   AI_PROVIDER_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=stub ...
+from __future__ import annotations
+import functools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+from .providers import ReplayMiss, ReplayStore, _openai_client, fake_answer
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency distribution in ms -> sampler returning seconds:
+      "0" | "fixed:MS" | "uniform:LO:HI" | "lognormal:MEDIAN:SIGMA"
+    lognormal is the realistic one: most calls near MEDIAN, a long right tail.
+    """
+    kind, _, rest = spec.strip().partition(":")
+    try:
+        args = [float(a) for a in rest.split(":")] if rest else []
+        if kind in ("0", "none") and not args:
+            return lambda rng: 0.0
+        if kind == "fixed" and len(args) == 1:
+            return lambda rng: args[0] / 1000
+        if kind == "uniform" and len(args) == 2:
+            return lambda rng: rng.uniform(args[0], args[1]) / 1000
+        if kind == "lognormal" and len(args) == 2:
+            mu = math.log(max(args[0], 1e-3))
+            return lambda rng: rng.lognormvariate(mu, args[1]) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"bad latency spec {spec!r} (0 | fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA)")
+
+
+@dataclass
+class StubConfig:
+    latency: str = "lognormal:600:0.4"
+    ttft_share: float = 0.3          # streaming: share of the latency before the first chunk
+    rate_429: float = 0.0
+    retry_after_s: float = 1.0
+    fixtures: str = ""
+    strict: bool = False             # fixture miss -> 404 instead of the fake answer
+    chunk_chars: int = 24
+    seed: Optional[int] = None
+
+
+@dataclass
+class StubStats:
+    requests: int = 0
+    streamed: int = 0
+    replay_hits: int = 0
+    fake_answers: int = 0
+    rate_limited: int = 0
+    misses: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def bump(self, **counts: int) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {k: v for k, v in vars(self).items() if not k.startswith("_")}
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: StubConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.stats = StubStats()
+        self.sample_latency = parse_latency(config.latency)
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self.store = ReplayStore(config.fixtures, record=False) if config.fixtures else None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def draw(self) -> tuple:
+        """(latency seconds, rate-limited?) for one request."""
+        with self._rng_lock:
+            return self.sample_latency(self._rng), self._rng.random() < self.config.rate_429
+
+    def answer(self, body: Dict[str, Any]) -> Optional[tuple]:
+        if self.store is not None:
+            try:
+                content, usage = self.store.answer(body)
+                self.stats.bump(replay_hits=1)
+                return content, usage
+            except ReplayMiss:
+                if self.config.strict:
+                    self.stats.bump(misses=1)
+                    return None
+        self.stats.bump(fake_answers=1)
+        return fake_answer(body)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StubServer
+    protocol_version = "HTTP/1.1"    # keep-alive, like the real API
+
+    def log_message(self, format, *args):   # quiet: thousands of requests per run
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._json(200, self.server.stats.as_dict())
+        else:
+            self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self._json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        stats, config = self.server.stats, self.server.config
+        stats.bump(requests=1)
+        latency, limited = self.server.draw()
+
+        if limited:
+            stats.bump(rate_limited=1)
+            time.sleep(min(latency, 0.05))
+            self._json(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}},
+                       headers={"Retry-After": f"{config.retry_after_s:g}",
+                                "retry-after-ms": str(int(config.retry_after_s * 1000))})
+            return
+        answered = self.server.answer(body)
+        if answered is None:
+            time.sleep(latency)
+            self._json(404, {"error": {"message": "no recorded response (stub --strict)", "type": "invalid_request_error"}})
+            return
+        content, usage = answered
+        usage_obj = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens,
+                     "total_tokens": usage.total_tokens}
+        base = {"id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": body.get("model") or "stub"}
+
+        if not body.get("stream"):
+            time.sleep(latency)
+            self._json(200, {**base, "object": "chat.completion", "usage": usage_obj, "choices": [{
+                "index": 0, "finish_reason": "stop", "logprobs": None,
+                "message": {"role": "assistant", "content": content},
+            }]})
+            return
+
+        stats.bump(streamed=1)
+        pieces = [content[i:i + config.chunk_chars] for i in range(0, len(content), config.chunk_chars)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(latency * config.ttft_share)
+        gap = latency * (1 - config.ttft_share) / len(pieces)
+        chunk = {**base, "object": "chat.completion.chunk"}
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(gap)
+            self._event({**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({**chunk, "choices": [], "usage": usage_obj})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _event(self, obj: Dict[str, Any]) -> None:
+        self._write_chunk(f"data: {json.dumps(obj, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_stub(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> StubServer:
+    """Start the stub on a daemon thread (port 0 = any free port); stop with .shutdown()."""
+    server = StubServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+def stub_client_factory(base_url: str) -> Callable[..., Any]:
+    """A providers.set_client_factory() factory: the real openai SDK, pointed at the stub."""
+    return functools.partial(_openai_client, base_url=base_url, api_key="stub")
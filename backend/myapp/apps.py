@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+
+
+class MyappConfig(AppConfig):
+    name = "myapp"
+
+    def ready(self):
+        from . import ticket_stats
+        from .models import Ticket
+
+        # keeps TicketDailyStats current (see ticket_stats.py)
+        post_init.connect(ticket_stats.remember, sender=Ticket, dispatch_uid="ticket_stats_init")
+        pre_save.connect(ticket_stats.before_save, sender=Ticket, dispatch_uid="ticket_stats_pre_save")
+        post_save.connect(ticket_stats.after_save, sender=Ticket, dispatch_uid="ticket_stats_save")
+        post_delete.connect(ticket_stats.after_delete, sender=Ticket, dispatch_uid="ticket_stats_delete")
@@ -0,0 +1,83 @@
+# ==============================================
+# JSON encoding for myapp's responses
+# ==============================================
+# Every JSON view, SSE event and JSONL line goes through dumps() here instead of
+# stdlib json. JSON_ENCODER picks the encoder:
+#   auto          orjson when installed (pip install orjson), else stdlib
+#   orjson        orjson, failing at startup when it is missing
+#   stdlib        json.dumps with DjangoJSONEncoder (what JsonResponse does)
+#   pkg.mod:func  any callable obj -> bytes
+# orjson writes datetimes with microseconds (DjangoJSONEncoder cuts them to
+# milliseconds); both are ISO 8601 with a "Z" for UTC. Types neither handles
+# natively (Decimal, lazy translations, ...) fall back to DjangoJSONEncoder.
+# Compression of large responses is CompressionMiddleware's job (middleware.py).
+from __future__ import annotations
+import importlib
+import json
+import os
+from typing import Any, Callable
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback
+    orjson = None
+
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto").strip() or "auto"
+
+_django_default = DjangoJSONEncoder().default
+
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_django_default, option=orjson.OPT_UTC_Z)
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _resolve(name: str) -> Callable[[Any], bytes]:
+    if name == "auto":
+        return _orjson_dumps if orjson is not None else _stdlib_dumps
+    if name == "orjson":
+        if orjson is None:
+            raise ImproperlyConfigured("JSON_ENCODER=orjson but orjson is not installed (pip install orjson)")
+        return _orjson_dumps
+    if name == "stdlib":
+        return _stdlib_dumps
+    if ":" in name:
+        module, _, attr = name.partition(":")
+        try:
+            return getattr(importlib.import_module(module), attr)
+        except (ImportError, AttributeError) as e:
+            raise ImproperlyConfigured(f"JSON_ENCODER={name!r}: {e}") from e
+    raise ImproperlyConfigured(f"Unknown JSON_ENCODER {name!r} (expected auto, orjson, stdlib or module:func)")
+
+
+ENCODERS = {"orjson": _orjson_dumps, "stdlib": _stdlib_dumps} if orjson is not None else {"stdlib": _stdlib_dumps}
+dumps: Callable[[Any], bytes] = _resolve(JSON_ENCODER)
+
+
+def encoder_name() -> str:
+    for name, fn in ENCODERS.items():
+        if fn is dumps:
+            return name
+    return JSON_ENCODER
+
+
+def dumps_str(obj: Any) -> str:
+    """dumps() as text (SSE data lines, JSONL)."""
+    return dumps(obj).decode("utf-8")
+
+
+class JsonResponse(HttpResponse):
+    """django.http.JsonResponse, encoded with dumps()."""
+
+    def __init__(self, data: Any, safe: bool = True, **kwargs: Any):
+        if safe and not isinstance(data, dict):
+            raise TypeError("In order to allow non-dict objects to be serialized set the safe parameter to False.")
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
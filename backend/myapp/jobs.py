@@ -0,0 +1,193 @@
+# ==============================================
+# Durable analysis queue (AnalysisJob rows)
+# ==============================================
+# POST /student/ai/analyze/?async=1 enqueues and returns a job id at once;
+# `manage.py ai_workers` processes jobs, clients poll /student/ai/jobs/<id>/ or
+# subscribe to .../events/ (SSE). Works on any database backend:
+# - claiming is a conditional UPDATE (only one worker's UPDATE matches), no
+#   SELECT ... FOR UPDATE needed, so SQLite is fine;
+# - a claim is a lease of AI_JOB_VISIBILITY_TIMEOUT seconds, longer than one
+#   ai_agent() call can take (LLM_TIMEOUT covers all its retries); a worker that
+#   dies mid-job loses the lease and the job is picked up again;
+# - upstream outages (degraded results) and unexpected errors are retried with
+#   backoff up to AI_JOB_MAX_ATTEMPTS; bad requests fail at once;
+# - an identical complaint (same prompt hash) submitted while a job is in flight
+#   becomes a follower of it and gets a copy of its answer (source "coalesced").
+from __future__ import annotations
+import os
+import random
+import socket
+import threading
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .ai.cache import cache_key
+from .ai.complaint_agent import ai_agent, for_frontend
+from .ai.metrics import count_answer, span
+from .ai.prompt import PROMPT_VERSION
+from .ai.resilience import LLM_TIMEOUT_S
+from .models import AIRecord, AnalysisJob
+
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_VISIBILITY_TIMEOUT_S = float(os.getenv("AI_JOB_VISIBILITY_TIMEOUT", str(LLM_TIMEOUT_S * 2 + 30)))
+AI_JOB_RETRY_DELAY_S = float(os.getenv("AI_JOB_RETRY_DELAY", "5"))
+AI_JOB_POLL_S = float(os.getenv("AI_JOB_POLL", "0.5"))
+AI_JOB_EVENTS_MAX_S = float(os.getenv("AI_JOB_EVENTS_MAX", "300"))   # SSE subscription lifetime
+
+# a follower whose leader finished (or vanished) before it could be fanned out
+# is simply processed itself: usually a cache hit
+_ORPHANED = Q(status="coalesced") & (Q(leader__isnull=True) | Q(leader__status__in=AnalysisJob.FINISHED))
+
+
+def _claimable(now):
+    return (
+        Q(status="queued", available_at__lte=now)
+        | Q(status="running", lease_expires_at__lt=now)
+        | _ORPHANED
+    )
+
+
+# ---- web side
+
+async def aenqueue(text: str, *, model: str, max_tokens: int, use_cache: bool = True, user=None) -> AnalysisJob:
+    """New job for `text`, or a follower of the in-flight job for the same complaint."""
+    key = cache_key(text, model=model, max_tokens=max_tokens, prompt_version=PROMPT_VERSION)
+    leader = None
+    if use_cache:
+        leader = await (
+            AnalysisJob.objects.filter(dedupe_key=key, status__in=AnalysisJob.IN_FLIGHT, leader__isnull=True)
+            .order_by("created_at").only("id").afirst()
+        )
+    return await AnalysisJob.objects.acreate(
+        student=user if user is not None and user.is_authenticated else None,
+        complaint=text,
+        model=model,
+        max_tokens=max_tokens,
+        use_cache=use_cache,
+        dedupe_key=key,
+        leader=leader,
+        status="coalesced" if leader is not None else "queued",
+    )
+
+
+def job_payload(job: AnalysisJob, *, compact: bool = True, raw: bool = False) -> Dict[str, Any]:
+    """What the status endpoint / SSE stream report for a job (raw=True adds the stored model answer)."""
+    out: Dict[str, Any] = {"job_id": str(job.pk), "status": job.status, "attempts": job.attempts}
+    if job.status == "done" and job.record is not None:
+        out.update(ai_record_id=job.record.pk, ai_record_token=job.record.link_token,
+                   ui=for_frontend(job.record.result, compact=compact))
+        if raw:
+            out["raw"] = job.record.result
+    elif job.status == "failed":
+        out["error"] = job.error
+    return out
+
+
+# ---- worker side
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim(owner: str) -> Optional[AnalysisJob]:
+    """Lease the next due job for `owner`, or None when there is nothing to do."""
+    for _ in range(5):   # lost races against other workers
+        now = timezone.now()
+        job_id = (
+            AnalysisJob.objects.filter(_claimable(now)).order_by("available_at").values_list("id", flat=True).first()
+        )
+        if job_id is None:
+            return None
+        won = AnalysisJob.objects.filter(_claimable(now), pk=job_id).update(
+            status="running",
+            leader=None,
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=AI_JOB_VISIBILITY_TIMEOUT_S),
+            attempts=F("attempts") + 1,
+        )
+        if won:
+            return AnalysisJob.objects.select_related("student").get(pk=job_id)
+    return None
+
+
+def _mine(job: AnalysisJob) -> Any:
+    """The job's row, only while `job`'s worker still holds the lease."""
+    return AnalysisJob.objects.filter(pk=job.pk, status="running", lease_owner=job.lease_owner)
+
+
+def process(job: AnalysisJob) -> str:
+    """Run one claimed job to done / failed / queued-for-retry; returns the new status."""
+    if job.attempts > AI_JOB_MAX_ATTEMPTS:   # its last lease expired (worker died)
+        return _fail(job, "worker lost the job too many times")
+    info: Dict[str, Any] = {}
+    result = ai_agent(job.complaint, model=job.model, max_tokens=job.max_tokens, use_cache=job.use_cache, info=info)
+    if isinstance(result, dict) and "error" in result:
+        retryable = result.get("degraded") or result["error"].startswith("Unexpected error")
+        if retryable and job.attempts < AI_JOB_MAX_ATTEMPTS:
+            delay = result.get("retry_after") or AI_JOB_RETRY_DELAY_S * 2 ** (job.attempts - 1)
+            _mine(job).update(
+                status="queued", lease_owner="", lease_expires_at=None, error=result["error"],
+                available_at=timezone.now() + timedelta(seconds=delay * random.uniform(1.0, 1.2)),
+            )
+            return "queued"
+        return _fail(job, result["error"])
+
+    with span("record_write"), transaction.atomic():
+        record = AIRecord.from_result(result, complaint=job.complaint, model=job.model, info=info, student=job.student)
+        record.save()
+        now = timezone.now()
+        if not _mine(job).update(status="done", record=record, error="", lease_expires_at=None, finished_at=now):
+            # lease lost to another worker mid-call: its answer wins
+            transaction.set_rollback(True)
+            return "lost"
+        for follower in job.followers.filter(status="coalesced").select_related("student"):
+            copy = AIRecord.from_result(
+                result, complaint=follower.complaint, model=job.model, student=follower.student,
+                info={**info, "source": "coalesced", "prompt_tokens": None, "completion_tokens": None},
+            )
+            copy.save()
+            AnalysisJob.objects.filter(pk=follower.pk, status="coalesced").update(
+                status="done", record=copy, finished_at=now,
+            )
+            count_answer("coalesced")
+    return "done"
+
+
+def _fail(job: AnalysisJob, error: str) -> str:
+    now = timezone.now()
+    with transaction.atomic():
+        _mine(job).update(status="failed", error=error, lease_expires_at=None, finished_at=now)
+        job.followers.filter(status="coalesced").update(status="failed", error=error, finished_at=now)
+    return "failed"
+
+
+def work(stop: threading.Event, *, owner: Optional[str] = None, drain: bool = False) -> int:
+    """
+    Worker loop: claim, process, repeat until `stop` is set (or, with drain=True,
+    until nothing is due). Returns the number of jobs processed.
+    """
+    owner = owner or new_worker_id()
+    done = 0
+    try:
+        while not stop.is_set():
+            close_old_connections()   # what the request cycle does: honors CONN_MAX_AGE / health checks
+            job = claim(owner)
+            if job is None:
+                if drain:
+                    break
+                stop.wait(AI_JOB_POLL_S * random.uniform(0.5, 1.5))
+                continue
+            try:
+                process(job)
+            except Exception as e:   # keep the worker alive; the lease expiry retries the job
+                job.error = f"Unexpected error: {e}"
+                _mine(job).update(error=job.error)
+            done += 1
+    finally:
+        connection.close()   # this thread's connection
+    return done
@@ -0,0 +1,44 @@
+import os
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued complaint analyses (POST /student/ai/analyze/?async=1). Run as many of these "
+        "processes, with as many threads each, as the LLM quota allows; web workers are sized separately."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", "-c", type=int, default=int(os.getenv("AI_JOB_WORKERS", "4")),
+                            help="Worker threads in this process (default: AI_JOB_WORKERS or 4)")
+        parser.add_argument("--drain", action="store_true", help="Exit once no job is due instead of polling")
+
+    def handle(self, *args, **opts):
+        if opts["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            # finish the jobs in hand, then exit (an unfinished lease would only delay them)
+            signal.signal(sig, lambda *_: stop.set())
+
+        counts = []
+        prefix = jobs.new_worker_id()
+
+        def run(n):
+            counts.append(jobs.work(stop, owner=f"{prefix}/{n}", drain=opts["drain"]))
+
+        threads = [threading.Thread(target=run, args=(n,), name=f"ai-worker-{n}") for n in range(opts["concurrency"])]
+        started = time.perf_counter()
+        self.stdout.write(f"{len(threads)} AI workers started ({prefix}); Ctrl-C to stop")
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=0.5)   # short joins keep the main thread responsive to signals
+        self.stdout.write(f"processed {sum(counts)} jobs in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,99 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai.batch import (
+    DEFAULT_CONCURRENCY, ai_agent_many, iter_jsonl_items, parse_batch_output, to_batch_requests,
+)
+from myapp.ai.prompt import usage_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Analyze complaints from a JSONL file ({\"id\": ..., \"text\": ...} per line). "
+        "Results stream out as JSONL in completion order; per-item errors go to a separate file. "
+        "Use --to-batch-file / --from-batch-output to go through the OpenAI Batch API instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Input JSONL path, or '-' for stdin")
+        parser.add_argument("--output", "-o", help="Results JSONL (default: stdout)")
+        parser.add_argument("--errors", "-e", help="Errors JSONL (default: stderr)")
+        parser.add_argument("--concurrency", "-c", type=int, default=DEFAULT_CONCURRENCY)
+        parser.add_argument("--model", default="gpt-4o-mini")
+        parser.add_argument("--max-tokens", type=int, default=1200)
+        parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache")
+        parser.add_argument(
+            "--to-batch-file", metavar="PATH",
+            help="Don't call the API: write an OpenAI Batch API input file for these complaints",
+        )
+        parser.add_argument(
+            "--from-batch-output", action="store_true",
+            help="Treat INPUT as a Batch API output file and convert it to results/errors",
+        )
+
+    def handle(self, *args, **opts):
+        src = sys.stdin if opts["input"] == "-" else self._open(opts["input"], "r")
+        out = self._open(opts["output"], "w") if opts["output"] else self.stdout
+        err = self._open(opts["errors"], "w") if opts["errors"] else self.stderr
+        started = time.perf_counter()
+        n_ok = n_err = 0
+        try:
+            if opts["to_batch_file"]:
+                with self._open(opts["to_batch_file"], "w") as fh:
+                    for line in to_batch_requests(
+                        self._valid_items(src, err), model=opts["model"], max_tokens=opts["max_tokens"]
+                    ):
+                        fh.write(json.dumps(line, ensure_ascii=False) + "\n")
+                        n_ok += 1
+                self.stderr.write(f"Wrote {n_ok} requests to {opts['to_batch_file']}")
+                return
+
+            if opts["from_batch_output"]:
+                records = parse_batch_output(src)
+            else:
+                records = ai_agent_many(
+                    iter_jsonl_items(src),
+                    concurrency=opts["concurrency"],
+                    model=opts["model"],
+                    max_tokens=opts["max_tokens"],
+                    use_cache=not opts["no_cache"],
+                )
+            for rec in records:
+                line = json.dumps(rec, ensure_ascii=False)
+                if "error" in rec:
+                    err.write(line + "\n")
+                    n_err += 1
+                else:
+                    out.write(line + "\n")
+                    n_ok += 1
+        finally:
+            for fh in (src, out, err):
+                if fh not in (sys.stdin, self.stdout, self.stderr):
+                    fh.close()
+
+        elapsed = time.perf_counter() - started
+        rate = (n_ok + n_err) / elapsed if elapsed else 0.0
+        self.stderr.write(f"Done: {n_ok} ok, {n_err} errors in {elapsed:.1f}s ({rate:.1f} items/s)")
+        usage = usage_stats()
+        if usage["calls"]:
+            self.stderr.write(
+                f"Tokens: {usage['prompt_tokens']} prompt ({usage['cached_prompt_tokens']} from prefix cache), "
+                f"{usage['completion_tokens']} completion over {usage['calls']} LLM calls"
+            )
+
+    def _valid_items(self, src, err):
+        for item in iter_jsonl_items(src):
+            if "error" in item:
+                err.write(json.dumps(item, ensure_ascii=False) + "\n")
+            else:
+                yield item
+
+    @staticmethod
+    def _open(path, mode):
+        try:
+            return open(path, mode, encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
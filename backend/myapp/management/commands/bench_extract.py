@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai import complaint_agent as agent
+from myapp.tests.extract_oracle import GOLDEN, fuzz_corpus, matcher_corpus, reference_best_step, reference_extract
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the command extractor and step matcher used by for_frontend() against the original "
+        "implementations. Their equivalence is checked by `manage.py test myapp`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--repeat", type=int, default=200, help="Timing passes over the benchmark corpus")
+
+    def handle(self, *args, **opts):
+        if opts["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        # model output is mostly prose with a command or two; the fuzz corpus is the
+        # keyword-dense worst case
+        prose = (
+            "The error means the interpreter cannot find the module in the active environment. "
+            "Check which environment your editor uses and make sure it matches the terminal. "
+        ) * 6
+        corpora = {
+            "model-like": [prose + g + "\n" + prose for g in GOLDEN],
+            "keyword-dense": [prose + t for t in fuzz_corpus(100, opts["seed"] + 1)],
+        }
+        for label, bench in corpora.items():
+            timings = {}
+            for name, fn in (("reference", reference_extract), ("anchored", agent._extract_commands_list)):
+                t0 = time.perf_counter()
+                for _ in range(opts["repeat"]):
+                    for text in bench:
+                        fn(text)
+                timings[name] = (time.perf_counter() - t0) / (opts["repeat"] * len(bench)) * 1e6
+            self.stdout.write(
+                f"{label:>14}: reference {timings['reference']:8.1f} us/call, "
+                f"anchored {timings['anchored']:8.1f} us/call, "
+                f"speedup x{timings['reference'] / timings['anchored']:.2f}"
+            )
+
+        bench = list(matcher_corpus(500, opts["seed"]))
+        timings = {}
+        for name, fn in (
+            ("reference", lambda steps, cmds: [reference_best_step(c, steps) for c in cmds]),
+            ("matcher", lambda steps, cmds: agent.StepMatcher(steps).match(cmds)),
+        ):
+            t0 = time.perf_counter()
+            for _ in range(max(1, opts["repeat"] // 10)):
+                for steps, cmds in bench:
+                    fn(steps, cmds)
+            timings[name] = (time.perf_counter() - t0) / (max(1, opts["repeat"] // 10) * len(bench)) * 1e6
+        self.stdout.write(
+            f"{'step matching':>14}: reference {timings['reference']:8.1f} us/answer, "
+            f"matcher {timings['matcher']:8.1f} us/answer, "
+            f"speedup x{timings['reference'] / timings['matcher']:.2f}"
+        )
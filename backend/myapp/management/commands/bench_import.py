@@ -0,0 +1,74 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a cold worker pays before serving its first request
+TARGETS = {
+    "agent": "import myapp.ai.complaint_agent",
+    "views": (
+        "import os, django; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings'); "
+        "django.setup(); import myapp.views"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold import time of the AI agent and the views module in fresh interpreters "
+        "(no network, no API key needed). --max-ms makes it fail on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=7, help="Fresh interpreters per target (median is reported)")
+        parser.add_argument("--target", choices=sorted(TARGETS), action="append", help="Default: all")
+        parser.add_argument("--top", type=int, default=8, help="Slowest imported packages to list")
+        parser.add_argument("--max-ms", type=float, help="Fail if any target's median exceeds this")
+
+    def handle(self, *args, **opts):
+        env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+        env.pop("OPENAI_API_KEY", None)   # importing must not need it
+        failures = []
+        for name in opts["target"] or sorted(TARGETS):
+            samples = []
+            stderr = ""
+            for _ in range(opts["runs"]):
+                t0 = time.perf_counter()
+                proc = subprocess.run(
+                    [sys.executable, "-X", "importtime", "-c", TARGETS[name]],
+                    cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+                )
+                samples.append((time.perf_counter() - t0) * 1000)
+                if proc.returncode != 0:
+                    raise CommandError(f"{name}: import failed\n{proc.stderr[-2000:]}")
+                stderr = proc.stderr
+            median = statistics.median(samples)
+            self.stdout.write(f"{name}: median {median:.0f} ms over {len(samples)} runs "
+                              f"(min {min(samples):.0f}, max {max(samples):.0f})")
+            for module, ms in _slowest(stderr, opts["top"]):
+                self.stdout.write(f"    {ms:7.1f} ms  {module}")
+            if opts["max_ms"] is not None and median > opts["max_ms"]:
+                failures.append(f"{name} {median:.0f} ms > {opts['max_ms']:.0f} ms")
+        if failures:
+            raise CommandError("Import time regression: " + "; ".join(failures))
+
+
+def _slowest(stderr, n):
+    """Top-level packages by cumulative import time, from `python -X importtime` output."""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        if name.startswith("  "):   # nested import: counted in its parent's cumulative time
+            continue
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(parts[1]) / 1000
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:n]
@@ -0,0 +1,160 @@
+import gzip
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from myapp import fastjson, middleware
+from myapp.ai.complaint_agent import for_frontend
+
+TECHNICAL = {
+    "routing": {"is_technical": True, "category": "python_env", "confidence": 0.92},
+    "summary": "Python cannot import `requests` because the package is installed for a different "
+               "interpreter than the one VS Code runs.",
+    "steps_to_apply": [
+        {"text": "Check which interpreter VS Code uses (bottom-right of the status bar).", "commands": []},
+        {"text": "Activate the project's virtual environment.", "commands": ["source .venv/bin/activate"]},
+        {"text": "Install the package into that environment.", "commands": ["python -m pip install requests"]},
+        {"text": "Confirm the interpreter and the package match.",
+         "commands": ["python -c \"import sys, requests; print(sys.executable, requests.__version__)\""]},
+        {"text": "Select the same interpreter in VS Code (Python: Select Interpreter) and rerun.", "commands": []},
+    ],
+    "verification_checklist": [
+        "`python -c \"import requests\"` prints nothing.",
+        "VS Code shows .venv as the selected interpreter.",
+        "The script runs without ModuleNotFoundError.",
+    ],
+    "requests_for_more_info": [],
+    "solution": {"code_language": "bash", "code": "```bash\npython -m pip install requests\n```"},
+}
+NON_TECHNICAL = {
+    "routing": {"is_technical": False, "category": "grading", "confidence": 0.88},
+    "summary": "The student asks why their assignment 3 grade has not been released yet.",
+    "steps_to_apply": [],
+    "verification_checklist": [],
+    "requests_for_more_info": ["Which course section are you enrolled in?"],
+    "solution": {"code_language": None, "code": ""},
+}
+ARABIC = {
+    **TECHNICAL,
+    "summary": "لا يستطيع بايثون استيراد الحزمة requests لأنها مثبتة لمفسّر مختلف عن الذي يستخدمه VS Code.",
+    "steps_to_apply": [
+        {"text": "فعّل البيئة الافتراضية الخاصة بالمشروع.", "commands": ["source .venv/bin/activate"]},
+        {"text": "ثبّت الحزمة داخل هذه البيئة.", "commands": ["python -m pip install requests"]},
+        {"text": "اختر نفس المفسّر في VS Code ثم أعد التشغيل.", "commands": []},
+    ],
+    "verification_checklist": ["يعمل البرنامج دون ظهور ModuleNotFoundError."],
+}
+
+
+def analyze_payloads(name, result):
+    """ai_analyze's body before this change, compact (the default) and ?debug=1 for staff."""
+    return {
+        f"{name} / before": {"ai_record_id": 4821, "ui": for_frontend(result)},
+        f"{name} / compact": {"ai_record_id": 4821, "ui": for_frontend(result, compact=True)},
+        f"{name} / debug": {"ai_record_id": 4821, "ui": for_frontend(result), "raw": result},
+    }
+
+
+def ticket_page(rows, seed):
+    """A ticket_list page: datetimes, nulls and 200-character previews."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    words = "python pip venv error module import jupyter kernel git push permission denied grade".split()
+    results = []
+    for i in range(rows):
+        technical = rng.random() < 0.7
+        results.append({
+            "id": 90000 - i,
+            "type": "technical" if technical else "non-technical",
+            "status": rng.choice(("open", "in_progress", "closed")),
+            "ai_category": rng.choice(("python_env", "git", "jupyter", "grading")) if rng.random() < 0.9 else None,
+            "ai_is_technical": technical,
+            "ai_record_id": rng.randint(1, 50000) if rng.random() < 0.8 else None,
+            "created_at": now - timedelta(seconds=rng.randint(0, 30 * 86400), microseconds=rng.randint(0, 999999)),
+            "preview": " ".join(rng.choice(words) for _ in range(40))[:200],
+        })
+    return {"results": results, "next_cursor": "MTcyOTE3MjgwMDAwMDAwMHw4OTk1MA"}
+
+
+def django_dumps(obj):
+    """What django.http.JsonResponse sent before: stdlib json, ASCII-escaped, spaced separators."""
+    return json.dumps(obj, cls=DjangoJSONEncoder).encode("utf-8")
+
+
+def timed_us(fn, obj, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(obj)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Bytes on the wire and serialization time per response for the myapp JSON views: Django's "
+        "JsonResponse vs the fastjson encoders, full vs compact payloads, identity vs gzip/brotli."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=2000, help="Serializations per payload and encoder (median)")
+        parser.add_argument("--seed", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+
+    def handle(self, *args, **opts):
+        if opts["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+        payloads = {}
+        payloads.update(analyze_payloads("analyze technical", TECHNICAL))
+        payloads.update(analyze_payloads("analyze non-technical", NON_TECHNICAL))
+        payloads.update(analyze_payloads("analyze arabic", ARABIC))
+        payloads["ticket page 50"] = ticket_page(50, opts["seed"])
+        payloads["ticket page 200"] = ticket_page(200, opts["seed"])
+
+        encoders = {"django": django_dumps, **fastjson.ENCODERS}
+        report = []
+        for name, payload in payloads.items():
+            body = fastjson.dumps(payload)
+            sent, coding = middleware.compressed_body(body, "gzip, deflate, br")
+            row = {
+                "payload": name,
+                "django_bytes": len(django_dumps(payload)),
+                "bytes": len(body),
+                "gzip_bytes": len(gzip.compress(body, compresslevel=middleware.RESPONSE_GZIP_LEVEL, mtime=0)),
+                "br_bytes": len(middleware.compress(body, "br")) if middleware.brotli is not None else None,
+                "sent_bytes": len(sent),
+                "sent_encoding": coding or "identity",
+                "serialize_us": {enc: round(timed_us(fn, payload, opts["repeat"]), 2) for enc, fn in encoders.items()},
+            }
+            report.append(row)
+
+        if opts["json"]:
+            self.stdout.write(json.dumps({
+                "encoder": fastjson.encoder_name(),
+                "min_bytes": middleware.RESPONSE_COMPRESS_MIN_BYTES,
+                "brotli": middleware.brotli is not None,
+                "results": report,
+            }, indent=2))
+            return
+
+        self.stdout.write(
+            f"encoder={fastjson.encoder_name()}  compress from {middleware.RESPONSE_COMPRESS_MIN_BYTES} B  "
+            f"brotli={'yes' if middleware.brotli is not None else 'not installed'}  "
+            f"(client sends Accept-Encoding: gzip, deflate, br)"
+        )
+        names = list(encoders)
+        header = (f"{'payload':<30} {'django B':>9} {'json B':>8} {'gzip B':>7} {'br B':>7} {'sent B':>12}  "
+                  + "  ".join(f"{n + ' us':>10}" for n in names))
+        self.stdout.write(header)
+        for row in report:
+            br = "-" if row["br_bytes"] is None else str(row["br_bytes"])
+            sent = f"{row['sent_bytes']} {row['sent_encoding'][:4]}"
+            self.stdout.write(
+                f"{row['payload']:<30} {row['django_bytes']:>9} {row['bytes']:>8} {row['gzip_bytes']:>7} {br:>7} "
+                f"{sent:>12}  " + "  ".join(f"{row['serialize_us'][n]:>10.1f}" for n in names)
+            )
@@ -0,0 +1,156 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from myapp.models import Ticket, User, encode_cursor
+
+ALIAS = "bench_tickets"
+
+CATEGORIES = [
+    "python_env", "package_install", "git", "jupyter", "path_config", "permissions", "network",
+    "ide_setup", "database", "grading", "course_content", "account_access",
+]
+STATUSES = [("closed", 85), ("open", 10), ("in_progress", 5)]
+
+
+def dashboard_queries(qs, cursor):
+    """The staff dashboard access patterns (same shapes as views.ticket_list)."""
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+    return {
+        "newest page": lambda: list(qs.newest_first().values_list("id")[:50]),
+        "status=open page": lambda: list(qs.filter(status="open").newest_first().values_list("id")[:50]),
+        "type+status page": lambda: list(
+            qs.filter(type="technical", status="in_progress").newest_first().values_list("id")[:50]
+        ),
+        "category page": lambda: list(qs.filter(ai_category="jupyter").newest_first().values_list("id")[:50]),
+        "open, deep keyset page": lambda: list(
+            qs.filter(status="open").before_cursor(cursor).newest_first().values_list("id")[:50]
+        ),
+        "last 7 days count": lambda: qs.filter(created_at__gte=week_ago).count(),
+        "category last 7 days count": lambda: qs.filter(ai_category="git", created_at__gte=week_ago).count(),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway SQLite DB with N tickets and time the dashboard queries "
+        "without and with Ticket.Meta.indexes (never touches the real database)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=7, help="Runs per query (median is reported)")
+        parser.add_argument("--seed", type=int, default=11)
+        parser.add_argument("--tuned", action="store_true", help="Use the DB_SQLITE_TUNED pragmas (WAL, mmap, ...)")
+        parser.add_argument("--keep", metavar="PATH", help="Write the seeded DB here and keep it")
+
+    def handle(self, *args, **opts):
+        path = opts["keep"] or os.path.join(tempfile.mkdtemp(prefix="bench_tickets_"), "bench.sqlite3")
+        connections.settings[ALIAS] = {
+            **connections.settings["default"],
+            "NAME": path,
+            "OPTIONS": dict(settings.SQLITE_TUNED_OPTIONS) if opts["tuned"] else {},
+        }
+        conn = connections[ALIAS]
+        try:
+            with conn.schema_editor() as editor:
+                editor.create_model(User)   # Ticket.student's FK target
+                editor.create_model(Ticket)
+            with conn.schema_editor() as editor:
+                for index in Ticket._meta.indexes:   # "before" = the 0001 schema
+                    editor.remove_index(Ticket, index)
+            self._seed(conn, opts["rows"], opts["seed"])
+
+            qs = Ticket.objects.using(ALIAS)
+            deep = qs.filter(status="open").newest_first().values_list("created_at", "id")[5000:5001]
+            cursor = encode_cursor(*deep[0]) if deep else None
+            queries = dashboard_queries(qs, cursor)
+
+            before = self._run(queries, opts["repeat"])
+            t0 = time.perf_counter()
+            with conn.schema_editor() as editor:
+                for index in Ticket._meta.indexes:
+                    editor.add_index(Ticket, index)
+            with conn.cursor() as c:
+                c.execute("ANALYZE")
+            self.stdout.write(f"built {len(Ticket._meta.indexes)} indexes in {time.perf_counter() - t0:.1f}s")
+            after = self._run(queries, opts["repeat"])
+
+            self.stdout.write(f"\n{'query':<28}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+            for name in queries:
+                b, a = before[name], after[name]
+                self.stdout.write(f"{name:<28}{b:>12.2f}{a:>12.2f}{b / a if a else float('inf'):>9.1f}x")
+            self.stdout.write("\nquery plans with indexes:")
+            for name, sql in self._plans(qs, cursor).items():
+                self.stdout.write(f"  {name}: {sql}")
+        finally:
+            conn.close()
+            del connections[ALIAS]
+            connections.settings.pop(ALIAS, None)
+            if not opts["keep"]:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                os.rmdir(os.path.dirname(path))
+
+    def _seed(self, conn, rows, seed):
+        rng = random.Random(seed)
+        statuses = [s for s, _ in STATUSES]
+        weights = [w for _, w in STATUSES]
+        now = datetime.now(timezone.utc)
+        span = 2 * 365 * 86400
+        table = Ticket._meta.db_table
+        adapt = conn.ops.adapt_datetimefield_value
+
+        def gen():
+            for _ in range(rows):
+                technical = rng.random() < 0.7
+                yield (
+                    "technical" if technical else "non-technical",
+                    "seeded complaint text",
+                    rng.choice(CATEGORIES[:9]) if technical else rng.choice(CATEGORIES[9:]),
+                    technical,
+                    "",
+                    rng.choices(statuses, weights)[0],
+                    adapt(now - timedelta(seconds=rng.randrange(span))),
+                )
+
+        t0 = time.perf_counter()
+        with transaction.atomic(using=ALIAS), conn.cursor() as c:
+            c.executemany(
+                f"INSERT INTO {table} (type, text, ai_category, ai_is_technical, ai_record_id, status, created_at) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                gen(),
+            )
+        with conn.cursor() as c:
+            c.execute("ANALYZE")
+        self.stdout.write(f"seeded {rows:,} tickets in {time.perf_counter() - t0:.1f}s")
+
+    def _run(self, queries, repeat):
+        out = {}
+        for name, fn in queries.items():
+            fn()   # warm the page cache
+            samples = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn()
+                samples.append((time.perf_counter() - t0) * 1000)
+            out[name] = statistics.median(samples)
+        return out
+
+    def _plans(self, qs, cursor):
+        plans = {}
+        for name, q in (
+            ("status=open page", qs.filter(status="open").newest_first()[:50]),
+            ("open, deep keyset page", qs.filter(status="open").before_cursor(cursor).newest_first()[:50]),
+            ("category page", qs.filter(ai_category="jupyter").newest_first()[:50]),
+        ):
+            plans[name] = q.explain().replace("\n", " | ")
+        return plans
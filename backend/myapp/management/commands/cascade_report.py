@@ -0,0 +1,163 @@
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai import cascade, schema
+from myapp.ai.complaint_agent import ai_agent
+from myapp.ai.ratelimit import BATCH
+from myapp.models import Ticket
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a sample of stored complaints through the model cascade (AI_CASCADE_*) and report, per tier, "
+        "how often it ran and answered, its latency and its cost; --baseline also runs the strong model "
+        "alone for comparison. Makes real LLM calls unless AI_PROVIDER is fake/replay."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-jsonl", metavar="PATH", help="Complaints from a JSONL file of {text} instead of tickets")
+        parser.add_argument("--limit", type=int, default=100, help="Complaints to sample (default 100)")
+        parser.add_argument("--concurrency", "-c", type=int, default=4)
+        parser.add_argument("--baseline", action="store_true", help="Also answer each complaint with the strong model only")
+        parser.add_argument("--seed", type=int, default=13)
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    def handle(self, *args, **opts):
+        texts = self._sample(opts)
+        if not texts:
+            raise CommandError("No complaints to run.")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, opts["concurrency"])) as pool:
+            runs = list(pool.map(lambda t: self._run(t, opts["baseline"]), texts))
+        report = self._report(runs, time.perf_counter() - started)
+        if opts["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self._print(report)
+
+    def _sample(self, opts):
+        if opts["from_jsonl"]:
+            try:
+                with open(opts["from_jsonl"], encoding="utf-8") as fh:
+                    texts = [json.loads(line).get("text", "") for line in fh if line.strip()]
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+        else:
+            texts = list(Ticket.objects.exclude(text="").order_by("-created_at").values_list("text", flat=True)[:5000])
+        texts = [t for t in texts if t.strip()]
+        random.Random(opts["seed"]).shuffle(texts)
+        return texts[:opts["limit"]]
+
+    @staticmethod
+    def _run(text, baseline):
+        run = {}
+        info = {}
+        t0 = time.perf_counter()
+        result = ai_agent(text, use_cache=False, cascade=True, priority=BATCH, info=info)
+        run["cascade"] = dict(info, ms=(time.perf_counter() - t0) * 1000, error=result.get("error"))
+        if baseline:
+            info = {}
+            t0 = time.perf_counter()
+            result = ai_agent(text, model=cascade.STRONG.model, max_tokens=cascade.STRONG.max_tokens,
+                              use_cache=False, cascade=False, priority=BATCH, info=info)
+            usage = SimpleNamespace(prompt_tokens=info.get("prompt_tokens"), completion_tokens=info.get("completion_tokens"),
+                                    prompt_tokens_details=SimpleNamespace(cached_tokens=info.get("cached_prompt_tokens")))
+            run["baseline"] = {"ms": (time.perf_counter() - t0) * 1000, "error": result.get("error"),
+                               "source": info.get("source"),
+                               "cost_usd": cascade.cost_usd(cascade.STRONG.model, usage)}
+        return run
+
+    @staticmethod
+    def _report(runs, elapsed):
+        tiers = defaultdict(lambda: {"calls": 0, "ms": [], "cost_usd": 0.0, "outcomes": Counter()})
+        answered_by, escalations, errors, totals, costs = Counter(), Counter(), 0, [], []
+        for run in runs:
+            c = run["cascade"]
+            if c["error"]:
+                errors += 1
+                continue
+            totals.append(c["ms"])
+            costs.append(c.get("cost_usd") or 0.0)
+            answered_by[c.get("tier") or c.get("source") or "?"] += 1
+            if c.get("escalation"):
+                escalations[c["escalation"]] += 1
+            for t in c.get("tiers") or ():
+                row = tiers[t["tier"]]
+                row["calls"] += 1
+                row["ms"].append(t["ms"])
+                row["cost_usd"] += t["cost_usd"] or 0.0
+                row["outcomes"][t["outcome"]] += 1
+        n = len(runs)
+        report = {
+            "complaints": n,
+            "errors": errors,
+            "seconds": round(elapsed, 1),
+            "thresholds": {
+                "answer_confidence": cascade.AI_CASCADE_ANSWER_CONFIDENCE,
+                "escalate_below": cascade.AI_CASCADE_ESCALATE_BELOW,
+                "steps": [schema.MIN_STEPS, schema.MAX_STEPS],
+            },
+            "tiers": {
+                name: {
+                    "model": getattr(cascade, name.upper()).model,
+                    "calls": row["calls"],
+                    "share_of_complaints": round(row["calls"] / n, 3),
+                    "p50_ms": _pct(row["ms"], 0.5),
+                    "p95_ms": _pct(row["ms"], 0.95),
+                    "cost_usd": round(row["cost_usd"], 6),
+                    "outcomes": dict(row["outcomes"]),
+                }
+                for name, row in sorted(tiers.items(), key=lambda kv: ("route", "cheap", "strong").index(kv[0]))
+            },
+            "answered_by": dict(answered_by),
+            "escalations": dict(escalations),
+            "cascade": {
+                "p50_ms": _pct(totals, 0.5),
+                "p95_ms": _pct(totals, 0.95),
+                "cost_usd": round(sum(costs), 6),
+                "mean_cost_usd": round(statistics.fmean(costs), 8) if costs else None,
+            },
+        }
+        baseline = [r["baseline"] for r in runs if "baseline" in r and not r["baseline"]["error"]]
+        if baseline:
+            base_costs = [b["cost_usd"] or 0.0 for b in baseline]
+            report["baseline"] = {
+                "model": cascade.STRONG.model,
+                "p50_ms": _pct([b["ms"] for b in baseline], 0.5),
+                "p95_ms": _pct([b["ms"] for b in baseline], 0.95),
+                "cost_usd": round(sum(base_costs), 6),
+                "mean_cost_usd": round(statistics.fmean(base_costs), 8),
+            }
+        return report
+
+    def _print(self, report):
+        self.stdout.write(
+            f"{report['complaints']} complaints in {report['seconds']}s, {report['errors']} errors; "
+            f"thresholds {report['thresholds']}"
+        )
+        self.stdout.write(f"{'tier':<8}{'model':<16}{'calls':>7}{'share':>8}{'p50 ms':>9}{'p95 ms':>9}{'USD':>11}  outcomes")
+        for name, row in report["tiers"].items():
+            self.stdout.write(
+                f"{name:<8}{row['model']:<16}{row['calls']:>7}{row['share_of_complaints']:>8.0%}"
+                f"{row['p50_ms'] or 0:>9.1f}{row['p95_ms'] or 0:>9.1f}{row['cost_usd']:>11.6f}  {row['outcomes']}"
+            )
+        c = report["cascade"]
+        self.stdout.write(f"answered by {report['answered_by']}, escalations {report['escalations']}")
+        self.stdout.write(f"cascade:  p50 {c['p50_ms']} ms, p95 {c['p95_ms']} ms, ${c['cost_usd']:.6f} total")
+        b = report.get("baseline")
+        if b:
+            self.stdout.write(f"baseline: p50 {b['p50_ms']} ms, p95 {b['p95_ms']} ms, ${b['cost_usd']:.6f} total ({b['model']} only)")
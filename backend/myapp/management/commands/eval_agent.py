@@ -0,0 +1,336 @@
+import json
+import os
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai import cascade, prompt, providers, schema
+from myapp.ai.complaint_agent import _best_step_idx_for_cmd, _extract_commands_list, ai_agent, for_frontend
+from myapp.ai.golden import golden_fingerprint, load_golden
+from myapp.ai.ratelimit import BATCH
+from myapp.views import AI_MAX_TOKENS, AI_MODEL
+
+BACKENDS = ("replay", "live", "fake")
+REPORT_VERSION = 1
+# higher is better; a drop of more than --tolerance against the baseline is a regression
+QUALITY = ("routing_accuracy", "category_accuracy", "step_compliance", "json_valid", "command_coverage",
+           "command_attachment")
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+def _share(flags):
+    flags = list(flags)
+    return round(sum(1 for f in flags if f) / len(flags), 4) if flags else None
+
+
+def config_key(model, max_tokens, use_cascade):
+    return f"{model}:{max_tokens}" + (":cascade" if use_cascade else "")
+
+
+def score(golden, result, info):
+    """One report row: what the answer got right, as plain JSON values."""
+    row = {"id": golden.id, "lang": golden.lang, "source": info.get("source")}
+    if not isinstance(result, dict) or "error" in result:
+        row["error"] = str((result or {}).get("error") if isinstance(result, dict) else result)[:200]
+        return row
+    routing = result.get("routing") or {}
+    is_technical = bool(routing.get("is_technical", True))
+    repairs = info.get("schema_repairs") or []
+    reasked = info.get("reasked") or []
+    row.update(
+        is_technical=is_technical,
+        category=routing.get("category"),
+        routing_ok=is_technical == golden.is_technical,
+        category_ok=routing.get("category") in golden.categories,
+        json="repaired" if any(r.startswith("json:") for r in repairs) else "valid",
+        prompt_tokens=info.get("prompt_tokens"),
+        completion_tokens=info.get("completion_tokens"),
+    )
+    if reasked:
+        row["reasked"] = reasked
+    ui = for_frontend(result)
+    row["ui_ok"] = ui.get("status") == "ok"
+    if is_technical:
+        steps = result.get("steps_to_apply") or []
+        texts = [s.get("text") or "" for s in steps]
+        # what the model wrote, not what check_output() repaired: merged overflow / re-asked steps don't comply
+        row["steps"] = len(steps)
+        row["steps_ok"] = (schema.MIN_STEPS <= len(steps) <= schema.MAX_STEPS
+                           and "steps_to_apply:merged" not in repairs and "steps_to_apply" not in reasked)
+        code_commands = _extract_commands_list(((result.get("solution") or {}).get("code") or "").strip())
+        row["code_commands"] = len(code_commands)
+        row["attached"] = sum(1 for c in code_commands if _best_step_idx_for_cmd(c, texts) is not None)
+        if golden.needs_commands:
+            row["commands_ok"] = bool(code_commands) or any(s.get("commands") for s in steps)
+    elif golden.needs_commands:
+        row["commands_ok"] = False
+    return row
+
+
+def summarize(rows, costs, latencies):
+    """One configuration's scores; errors count as wrong answers."""
+    answered = [r for r in rows if "error" not in r]
+    technical = [r for r in answered if r["is_technical"]]
+    code_commands = sum(r["code_commands"] for r in technical)
+    by_lang = defaultdict(list)
+    for r in rows:
+        by_lang[r["lang"]].append(r)
+    prompt_tokens = [r["prompt_tokens"] for r in answered if r.get("prompt_tokens") is not None]
+    completion_tokens = [r["completion_tokens"] for r in answered if r.get("completion_tokens") is not None]
+    return {
+        "complaints": len(rows),
+        "errors": len(rows) - len(answered),
+        "routing_accuracy": _share(r.get("routing_ok") for r in rows),
+        "category_accuracy": _share(r.get("category_ok") for r in rows),
+        "by_lang": {
+            lang: {
+                "complaints": len(lang_rows),
+                "routing_accuracy": _share(r.get("routing_ok") for r in lang_rows),
+                "category_accuracy": _share(r.get("category_ok") for r in lang_rows),
+            }
+            for lang, lang_rows in sorted(by_lang.items())
+        },
+        "step_compliance": _share(r["steps_ok"] for r in technical),
+        "mean_steps": round(statistics.fmean(r["steps"] for r in technical), 2) if technical else None,
+        "command_coverage": _share(r["commands_ok"] for r in rows if "commands_ok" in r),
+        "command_attachment": round(sum(r["attached"] for r in technical) / code_commands, 4) if code_commands else None,
+        "json_valid": _share(r.get("json") == "valid" for r in rows),
+        "json_repaired": _share(r.get("json") == "repaired" for r in rows),
+        "reasked": _share("reasked" in r for r in rows),
+        "sources": dict(sorted(Counter(r.get("source") or "?" for r in rows).items())),
+        "tokens": {
+            "prompt": sum(prompt_tokens),
+            "completion": sum(completion_tokens),
+            "mean_prompt": round(statistics.fmean(prompt_tokens), 1) if prompt_tokens else None,
+            "mean_completion": round(statistics.fmean(completion_tokens), 1) if completion_tokens else None,
+        },
+        "cost_usd": round(sum(c for c in costs if c), 6),
+        "latency_ms": {
+            "p50": _pct(latencies, 0.5), "p95": _pct(latencies, 0.95), "p99": _pct(latencies, 0.99),
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+    }
+
+
+def regressions(summary, baseline, tolerance):
+    """[(metric, baseline, now)] for quality metrics that dropped by more than `tolerance`."""
+    out = []
+    for metric in QUALITY:
+        old, new = baseline.get(metric), summary.get(metric)
+        if old is not None and (new is None or new < old - tolerance):
+            out.append((metric, old, new))
+    return out
+
+
+def render_report(report):
+    """JSON with sorted keys and one complaint per line, so two reports diff line by line."""
+    body = {k: v for k, v in report.items() if k != "complaints"}
+    head = json.dumps(body, indent=2, sort_keys=True, ensure_ascii=False)
+    rows = ",\n".join("    " + json.dumps(r, sort_keys=True, ensure_ascii=False) for r in report["complaints"])
+    return head[:-2] + f',\n  "complaints": [\n{rows}\n  ]\n}}\n'
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the golden complaint set (myapp/ai/golden.py, English + Arabic) through ai_agent + for_frontend "
+        "for each --model x --max-tokens configuration and score routing, step-count compliance, command "
+        "attachment, JSON validity, tokens, cost and latency. --backend replay answers from recorded fixtures "
+        "(--record fills them from the live API); live and fake are what they say."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", choices=BACKENDS, default="replay")
+        parser.add_argument("--fixtures", metavar="PATH", help="Replay fixtures (default AI_REPLAY_FIXTURES)")
+        parser.add_argument("--record", action="store_true", help="Replay: call the live API on a miss and record it")
+        parser.add_argument("--golden", metavar="PATH", help="A JSONL golden set instead of the built-in one")
+        parser.add_argument("--model", action="append", help=f"Repeatable (default {AI_MODEL})")
+        parser.add_argument("--max-tokens", type=int, action="append", help=f"Repeatable (default {AI_MAX_TOKENS})")
+        parser.add_argument("--cascade", action="store_true", help="Answer through the model cascade (AI_CASCADE_*)")
+        parser.add_argument("--concurrency", "-c", type=int, default=4)
+        parser.add_argument("--output", "-o", metavar="PATH", help="Write the full report (JSON) here")
+        parser.add_argument("--compare", metavar="PATH", help="An earlier report: show deltas and regressions")
+        parser.add_argument("--tolerance", type=float, default=0.0,
+                            help="Quality drop (0-1) still not counted as a regression (live runs are noisy)")
+        parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error on a regression")
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+
+    def handle(self, *args, **opts):
+        try:
+            version, golden = load_golden(opts["golden"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if not golden:
+            raise CommandError("The golden set is empty.")
+        previous = self._load_report(opts["compare"]) if opts["compare"] else None
+        configs = [
+            (model, max_tokens)
+            for model in dict.fromkeys(opts["model"] or [AI_MODEL])
+            for max_tokens in dict.fromkeys(opts["max_tokens"] or [AI_MAX_TOKENS])
+        ]
+
+        self._install_backend(opts)
+        try:
+            started = time.perf_counter()
+            jobs = [(model, max_tokens, g) for model, max_tokens in configs for g in golden]
+            with ThreadPoolExecutor(max_workers=max(1, opts["concurrency"])) as pool:
+                runs = list(pool.map(lambda job: self._run(*job, opts["cascade"]), jobs))
+            elapsed = time.perf_counter() - started
+        finally:
+            providers.set_client_factory(None)
+
+        report = self._report(version, golden, configs, runs, opts)
+        report["seconds"] = round(elapsed, 1)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(render_report(report))
+        if opts["json"]:
+            self.stdout.write(render_report(report), ending="")
+        else:
+            self._print(report)
+        regressed = self._compare(report, previous, opts["tolerance"])
+        if regressed and opts["fail_on_regression"]:
+            raise CommandError(f"Regressions in {', '.join(regressed)}")
+
+    # ---- running
+
+    @staticmethod
+    def _install_backend(opts):
+        backend = opts["backend"]
+        if backend == "replay":
+            path = opts["fixtures"] or getattr(settings, "AI_REPLAY_FIXTURES", "")
+            if not path:
+                raise CommandError("--backend replay needs --fixtures PATH (or AI_REPLAY_FIXTURES)")
+            if not opts["record"] and not os.path.exists(path):
+                raise CommandError(f"{path} does not exist: record it first with --record (live API calls)")
+            try:
+                factory = providers.replay_factory(path, record=opts["record"])
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"{path}: {e}")
+        else:
+            factory = providers.PROVIDERS["openai" if backend == "live" else "fake"]
+        providers.set_client_factory(factory)
+
+    @staticmethod
+    def _run(model, max_tokens, golden, use_cascade):
+        info = {}
+        t0 = time.perf_counter()
+        # no response cache / similar-answer index: every configuration answers for itself
+        result = ai_agent(golden.text, model=model, max_tokens=max_tokens, use_cache=False, cascade=use_cascade,
+                          priority=BATCH, info=info)
+        ms = (time.perf_counter() - t0) * 1000
+        if "cost_usd" in info:   # the cascade priced its tiers
+            cost = info["cost_usd"]
+        else:
+            cost = cascade.cost_usd(model, SimpleNamespace(
+                prompt_tokens=info.get("prompt_tokens"), completion_tokens=info.get("completion_tokens"),
+                prompt_tokens_details=SimpleNamespace(cached_tokens=info.get("cached_prompt_tokens")),
+            ))
+        row = score(golden, result, info)
+        row["config"] = config_key(model, max_tokens, use_cascade)
+        return row, cost, ms
+
+    # ---- report
+
+    def _report(self, version, golden, configs, runs, opts):
+        per_config = defaultdict(lambda: ([], [], []))
+        for row, cost, ms in runs:
+            rows, costs, latencies = per_config[row["config"]]
+            rows.append(row)
+            costs.append(cost)
+            if "error" not in row:
+                latencies.append(ms)
+        keys = [config_key(m, t, opts["cascade"]) for m, t in configs]
+        return {
+            "report_version": REPORT_VERSION,
+            "golden": {"version": version, "fingerprint": golden_fingerprint(golden), "complaints": len(golden)},
+            "backend": opts["backend"],
+            "prompt_version": prompt.PROMPT_VERSION,
+            "structured_outputs": prompt.AI_STRUCTURED_OUTPUTS,
+            "schema": {"steps": [schema.MIN_STEPS, schema.MAX_STEPS], "reask": schema.AI_SCHEMA_REASK},
+            "configs": {key: summarize(*per_config[key]) for key in keys},
+            "complaints": sorted((row for row, _, _ in runs), key=lambda r: (r["id"], r["config"])),
+        }
+
+    @staticmethod
+    def _load_report(path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"--compare {path}: {e}")
+
+    def _print(self, report):
+        g = report["golden"]
+        self.stdout.write(
+            f"golden {g['version']} ({g['complaints']} complaints, {g['fingerprint']}), backend {report['backend']}, "
+            f"prompt {report['prompt_version']}, {report['seconds']}s"
+        )
+        self.stdout.write(
+            f"{'config':<28}{'route':>7}{'categ':>7}{'steps':>7}{'cmds':>7}{'attach':>8}{'json':>7}{'err':>5}"
+            f"{'tok in':>9}{'tok out':>9}{'USD':>11}{'p50 ms':>9}{'p95 ms':>9}"
+        )
+        fmt = lambda v: "-" if v is None else f"{v:.0%}"
+        for key, s in report["configs"].items():
+            self.stdout.write(
+                f"{key:<28}{fmt(s['routing_accuracy']):>7}{fmt(s['category_accuracy']):>7}"
+                f"{fmt(s['step_compliance']):>7}{fmt(s['command_coverage']):>7}{fmt(s['command_attachment']):>8}"
+                f"{fmt(s['json_valid']):>7}{s['errors']:>5}{s['tokens']['mean_prompt'] or 0:>9.0f}"
+                f"{s['tokens']['mean_completion'] or 0:>9.0f}{s['cost_usd']:>11.6f}"
+                f"{s['latency_ms']['p50'] or 0:>9.1f}{s['latency_ms']['p95'] or 0:>9.1f}"
+            )
+            langs = ", ".join(f"{lang} route {fmt(v['routing_accuracy'])} categ {fmt(v['category_accuracy'])}"
+                              for lang, v in s["by_lang"].items())
+            self.stdout.write(f"{'':<28}{langs}; sources {s['sources']}")
+        misses = sum(1 for r in report["complaints"] if "no recorded response" in r.get("error", ""))
+        if misses:
+            self.stdout.write(f"{misses} answers were not recorded in the fixtures: rerun with --record (live API calls)")
+
+    def _compare(self, report, previous, tolerance):
+        """Print deltas against `previous` (else against this run's first config); the configs that regressed."""
+        configs = report["configs"]
+        if previous is not None:
+            if previous.get("golden", {}).get("fingerprint") != report["golden"]["fingerprint"]:
+                self.stderr.write("warning: the reports come from different golden sets")
+            baselines = {key: (previous.get("configs") or {}).get(key) for key in configs}
+            label = "previous report"
+        else:
+            first = next(iter(configs))
+            baselines = {key: configs[first] for key in configs if key != first}
+            label = first
+        regressed, clean = [], []
+        for key, base in baselines.items():
+            if base is None:
+                continue
+            s = configs[key]
+            drops = regressions(s, base, tolerance)
+            if previous is not None or drops:
+                deltas = ", ".join(
+                    f"{m} {base[m]:.0%}->{'-' if s[m] is None else format(s[m], '.0%')}"
+                    for m in QUALITY if base.get(m) is not None and base.get(m) != s.get(m)
+                )
+                self.stdout.write(f"{key} vs {label}: {deltas or 'no quality change'}"
+                                  + (" REGRESSION" if drops else ""))
+            (regressed if drops else clean).append(key)
+        if previous is not None:
+            old_rows = {(r["id"], r["config"]): r for r in previous.get("complaints") or []}
+            for row in report["complaints"]:
+                old = old_rows.get((row["id"], row["config"]))
+                if old is not None and old.get("routing_ok") and not row.get("routing_ok"):
+                    self.stdout.write(f"  {row['config']} {row['id']}: routed {row.get('category') or row.get('error')}")
+        else:
+            clean.insert(0, next(iter(configs)))
+        if clean and (previous is not None or len(configs) > 1):
+            best = min(clean, key=lambda k: (configs[k]["cost_usd"], configs[k]["latency_ms"]["p50"] or 0))
+            self.stdout.write(f"cheapest configuration without regressions: {best}")
+        return regressed
@@ -0,0 +1,66 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ticket_io import (
+    DEFAULT_BATCH_SIZE, DEFAULT_COMMIT_EVERY, FORMATS, STUDENT_KEYS, RowError, Throughput, TicketImporter,
+    format_for, read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import tickets from CSV (with a header row) or JSONL, e.g. a legacy helpdesk dump or an "
+        "export_tickets file. Streams the input, writes with bulk_create in batched transactions and "
+        "reports rows/s and peak RSS. Bad rows are skipped and listed (--strict stops at the first one)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="CSV / JSONL path, or '-' for stdin (then --format is required)")
+        parser.add_argument("--format", choices=FORMATS, help="Default: from the file extension")
+        parser.add_argument("--student-key", choices=STUDENT_KEYS, default="username",
+                            help="What the 'student' column holds (default username)")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per bulk_create")
+        parser.add_argument("--commit-every", type=int, default=DEFAULT_COMMIT_EVERY, help="Rows per transaction")
+        parser.add_argument("--strict", action="store_true", help="Stop at the first bad row")
+        parser.add_argument("--quiet", action="store_true", help="No progress lines")
+
+    def handle(self, *args, **opts):
+        try:
+            fmt = opts["format"] or format_for(opts["input"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        src = sys.stdin if opts["input"] == "-" else self._open(opts["input"])
+        importer = TicketImporter(student_key=opts["student_key"], batch_size=opts["batch_size"],
+                                  commit_every=opts["commit_every"], strict=opts["strict"])
+        clock = Throughput()
+        self.stderr.write(f"{importer.load_students():,} students preloaded by {opts['student_key']}")
+
+        def progress(imp):
+            if not opts["quiet"]:
+                self.stderr.write(clock.line(imp.stats["imported"], "imported"))
+
+        try:
+            stats = importer.run(read_rows(src, fmt), progress=progress)
+        except RowError as e:
+            raise CommandError(f"{e} ({importer.stats['imported']:,} rows were committed before it)")
+        finally:
+            if src is not sys.stdin:
+                src.close()
+
+        for line, message in importer.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if stats["skipped"] > len(importer.errors):
+            self.stderr.write(f"... and {stats['skipped'] - len(importer.errors):,} more bad rows")
+        self.stderr.write(
+            f"Done: {clock.line(stats['rows'], 'rows read')}; {stats['imported']:,} imported, "
+            f"{stats['skipped']:,} skipped, {stats['unknown_students']:,} with an unknown student "
+            f"over {stats['transactions']:,} transactions"
+        )
+
+    @staticmethod
+    def _open(path):
+        try:   # newline="": the csv module handles line breaks inside quoted fields
+            return open(path, encoding="utf-8", newline="")
+        except OSError as e:
+            raise CommandError(str(e))
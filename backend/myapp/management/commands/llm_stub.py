@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai.stub_server import StubConfig, StubServer, parse_latency
+
+
+def add_stub_arguments(parser, prefix=""):
+    """The stub's knobs; loadtest reuses them with prefix="stub-"."""
+    parser.add_argument(f"--{prefix}latency", default="lognormal:600:0.4",
+                        help="0 | fixed:MS | uniform:LO:HI | lognormal:MEDIAN:SIGMA (default: %(default)s)")
+    parser.add_argument(f"--{prefix}ttft-share", type=float, default=0.3,
+                        help="Streaming: share of the latency spent before the first chunk")
+    parser.add_argument(f"--{prefix}rate-429", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument(f"--{prefix}retry-after", type=float, default=1.0, help="Retry-After on 429s, in seconds")
+    parser.add_argument(f"--{prefix}fixtures", default="", help="Recorded answers (AI_REPLAY_FIXTURES JSONL format)")
+    parser.add_argument(f"--{prefix}strict", action="store_true", help="404 on a fixture miss instead of a fake answer")
+    parser.add_argument(f"--{prefix}seed", type=int, default=None)
+
+
+def stub_config(opts, prefix=""):
+    key = prefix.replace("-", "_")
+    try:
+        parse_latency(opts[f"{key}latency"])
+    except ValueError as e:
+        raise CommandError(str(e))
+    return StubConfig(
+        latency=opts[f"{key}latency"],
+        ttft_share=opts[f"{key}ttft_share"],
+        rate_429=opts[f"{key}rate_429"],
+        retry_after_s=opts[f"{key}retry_after"],
+        fixtures=opts[f"{key}fixtures"],
+        strict=opts[f"{key}strict"],
+        seed=opts[f"{key}seed"],
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local OpenAI-compatible stub (/v1/chat/completions, plain and streaming) that replays "
+        "recorded answers with a configurable latency distribution and 429 rate. Fully offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8900)
+        add_stub_arguments(parser)
+
+    def handle(self, *args, **opts):
+        server = StubServer((opts["host"], opts["port"]), stub_config(opts))
+        self.stdout.write(
+            f"LLM stub on {server.base_url} (latency {server.config.latency}, 429 rate {server.config.rate_429:g})\n"
+            f"  point the app at it: AI_PROVIDER=openai AI_PROVIDER_BASE_URL={server.base_url} OPENAI_API_KEY=stub\n"
+            f"  counters: GET {server.base_url[:-3]}/stats"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"stats: {server.stats.as_dict()}")
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from myapp.ai import providers, similar
+from myapp.ai.stub_server import start_stub, stub_client_factory
+from myapp.management.commands.llm_stub import add_stub_arguments, stub_config
+from myapp.models import AIRecord
+
+COMPLAINTS = [
+    "ModuleNotFoundError: No module named 'requests' when I run my script on Windows.",
+    "git push says 'rejected: non-fast-forward' after my teammate pushed.",
+    "Jupyter kernel keeps dying when I load the dataset with pandas.",
+    "pip install fails with 'error: Microsoft Visual C++ 14.0 is required'.",
+    "My Django server says 'That port is already in use'.",
+    "VS Code uses a different Python than my terminal and imports fail.",
+    "conda activate does nothing in PowerShell.",
+    "Permission denied (publickey) when cloning the course repo over SSH.",
+    "npm install hangs forever on the lab machines.",
+    "I can't see my grade for assignment 2 on the portal.",
+    "The lecture recording for week 5 is missing.",
+    "My account was locked after too many login attempts.",
+]
+
+
+@dataclass
+class Sample:
+    status: str      # HTTP status, or the exception class name
+    latency: float   # seconds from the scheduled send time (queueing included)
+    ttfb: float      # seconds to the first body byte (== latency unless streaming)
+
+
+def arrivals(rps, duration, poisson, rng):
+    """Send offsets in seconds: fixed spacing, or a Poisson process with the same mean rate."""
+    t, out = 0.0, []
+    while True:
+        t = t + rng.expovariate(rps) if poisson else len(out) / rps
+        if t >= duration:
+            return out
+        out.append(t)
+
+
+def complaints(n, unique, rng):
+    """`unique` share of the texts are one-off (cache misses); the rest repeat a small set."""
+    for i in range(n):
+        base = rng.choice(COMPLAINTS)
+        yield f"{base} (ticket {i})" if rng.random() < unique else base
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the analyze endpoint at a target request rate and report p50/p95/p99 latency, throughput "
+        "and error rate. By default the app runs in-process (WSGI or ASGI handler) against a throwaway "
+        "database and the local LLM stub, so it is fully offline and costs nothing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--app", choices=["wsgi", "asgi"], default="asgi",
+                            help="In-process handler to drive (default: %(default)s)")
+        parser.add_argument("--url", help="Drive an already running server instead, e.g. http://127.0.0.1:8000 "
+                                          "(start it with AI_PROVIDER_BASE_URL pointing at a stub)")
+        parser.add_argument("--provider", choices=["stub", "fake"], default="stub",
+                            help="stub = real openai SDK over HTTP to the local stub; fake = in-process answers")
+        parser.add_argument("--stub-url", help="Use a stub that is already running (see llm_stub)")
+        parser.add_argument("--rps", type=float, default=20.0, help="Target request rate")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load")
+        parser.add_argument("--concurrency", type=int, default=64, help="Max requests in flight (client side)")
+        parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of even spacing")
+        parser.add_argument("--stream", action="store_true", help="Use the SSE endpoint (?stream=1)")
+        parser.add_argument("--nocache", action="store_true", help="Send ?nocache=1 (skip the response cache)")
+        parser.add_argument("--unique", type=float, default=1.0,
+                            help="Share of one-off complaints; lower it to measure cache hits (default: 1.0). "
+                                 "Near-duplicates can still be answered by the similar-answer index (AI_SIMILAR)")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", metavar="PATH", help="Also write the summary as JSON (to compare runs)")
+        add_stub_arguments(parser, prefix="stub-")
+
+    def handle(self, *args, **opts):
+        if opts["rps"] <= 0 or opts["duration"] <= 0 or opts["concurrency"] < 1:
+            raise CommandError("--rps, --duration and --concurrency must be positive")
+        rng = random.Random(opts["seed"])
+        offsets = arrivals(opts["rps"], opts["duration"], opts["poisson"], rng)
+        texts = list(complaints(len(offsets), opts["unique"], rng))
+        query = "&".join(q for q, on in (("stream=1", opts["stream"]), ("nocache=1", opts["nocache"])) if on)
+        path = reverse("student_ai_analyze") + (f"?{query}" if query else "")
+
+        stub = None
+        if opts["provider"] == "stub" and not opts["stub_url"]:
+            stub = start_stub(stub_config(opts, prefix="stub-"))
+        stub_url = opts["stub_url"] or (stub.base_url if stub else None)
+        old_db_name = workdir = None
+        try:
+            if opts["url"]:
+                mode = f"external {opts['url']}"
+                if stub_url:
+                    self.stdout.write(f"LLM stub: {stub_url} (the server must use AI_PROVIDER_BASE_URL={stub_url})")
+                samples, wall = asyncio.run(self._run_external(opts, path, offsets, texts))
+            else:
+                mode = f"in-process {opts['app'].upper()}"
+                providers.set_client_factory(
+                    stub_client_factory(stub_url) if opts["provider"] == "stub" else providers.PROVIDERS["fake"]
+                )
+                workdir = tempfile.mkdtemp(prefix="loadtest_")
+                old_db_name = self._setup_db(workdir)
+                # keep fake answers out of the real similar-answer index
+                similar.AI_SIMILAR_INDEX = os.path.join(workdir, "similar_index")
+                if opts["app"] == "wsgi":
+                    samples, wall = self._run_wsgi(opts, path, offsets, texts)
+                else:
+                    samples, wall = asyncio.run(self._run_asgi(opts, path, offsets, texts))
+            summary = self._summarize(samples, wall, opts, mode)
+            if not opts["url"]:
+                summary["sources"] = dict(AIRecord.objects.values_list("source").annotate(n=Count("id")).order_by())
+            if stub is not None:
+                summary["stub"] = stub.stats.as_dict()
+            self._report(summary)
+            if opts["json"]:
+                with open(opts["json"], "w", encoding="utf-8") as fh:
+                    json.dump(summary, fh, indent=2)
+        finally:
+            providers.set_client_factory(None)
+            if old_db_name:
+                connections.close_all()
+                connection.creation.destroy_test_db(old_db_name, verbosity=0)
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+            if stub is not None:
+                stub.shutdown()
+                stub.server_close()
+
+    # ---- setup
+
+    def _setup_db(self, workdir):
+        """
+        Switch to a throwaway migrated SQLite file in `workdir` (shared by all worker
+        threads); the real DB is never touched. Returns the real DB name for destroy_test_db().
+        """
+        if connection.vendor != "sqlite":
+            raise CommandError("in-process mode needs the SQLite backend; use --url against a running server")
+        path = os.path.join(workdir, "loadtest.sqlite3")
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = path
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+        return old_name
+
+    # ---- drivers (latency is measured from the scheduled send time, so a
+    # saturated app shows up as latency instead of silently lowering the rate)
+
+    def _run_wsgi(self, opts, path, offsets, texts):
+        local = threading.local()
+        samples = []
+
+        def one(text, scheduled):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            client = local.client
+            try:
+                response = client.post(path, json.dumps({"text": text}), content_type="application/json")
+                if response.streaming:
+                    # like a WSGI server: iterating drains the async SSE generator first, so ttfb == latency
+                    b"".join(response)
+                done = time.perf_counter()
+                samples.append(Sample(str(response.status_code), done - scheduled, done - scheduled))
+            except Exception as e:
+                samples.append(Sample(type(e).__name__, time.perf_counter() - scheduled, 0.0))
+
+        warnings.filterwarnings("ignore", message="StreamingHttpResponse must consume asynchronous iterators")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts["concurrency"], thread_name_prefix="loadtest") as pool:
+            for text, offset in zip(texts, offsets):
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(one, text, start + offset)
+        return samples, time.perf_counter() - start
+
+    async def _run_asgi(self, opts, path, offsets, texts):
+        client = AsyncClient()
+
+        async def send(text):
+            response = await client.post(path, json.dumps({"text": text}), content_type="application/json")
+            ttfb = None
+            if response.streaming:
+                async for _ in response.streaming_content:
+                    if ttfb is None:
+                        ttfb = time.perf_counter()
+            return str(response.status_code), ttfb
+
+        return await self._open_loop(opts, offsets, texts, send)
+
+    async def _run_external(self, opts, path, offsets, texts):
+        import httpx
+        limits = httpx.Limits(max_connections=opts["concurrency"], max_keepalive_connections=opts["concurrency"])
+        async with httpx.AsyncClient(base_url=opts["url"], limits=limits, timeout=120) as http:
+            # the analyze endpoint is CSRF-protected like any browser form
+            await http.get(reverse("student_new_query"))
+            headers = {"X-CSRFToken": http.cookies.get("csrftoken", ""), "Referer": opts["url"]}
+
+            async def send(text):
+                async with http.stream("POST", path, json={"text": text}, headers=headers) as response:
+                    ttfb = None
+                    async for _ in response.aiter_raw():
+                        if ttfb is None:
+                            ttfb = time.perf_counter()
+                    return str(response.status_code), ttfb
+
+            return await self._open_loop(opts, offsets, texts, send)
+
+    async def _open_loop(self, opts, offsets, texts, send):
+        sem = asyncio.Semaphore(opts["concurrency"])
+        samples = []
+
+        async def one(text, scheduled):
+            async with sem:
+                try:
+                    status, ttfb = await send(text)
+                    done = time.perf_counter()
+                    samples.append(Sample(status, done - scheduled, (ttfb or done) - scheduled))
+                except Exception as e:
+                    samples.append(Sample(type(e).__name__, time.perf_counter() - scheduled, 0.0))
+
+        start = time.perf_counter()
+        tasks = []
+        for text, offset in zip(texts, offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(text, start + offset)))
+        await asyncio.gather(*tasks)
+        return samples, time.perf_counter() - start
+
+    # ---- report
+
+    def _summarize(self, samples, wall, opts, mode):
+        ok = sorted(s.latency for s in samples if s.status == "200")
+        ttfb = sorted(s.ttfb for s in samples if s.status == "200")
+        ms = lambda values, q: round(percentile(values, q) * 1000, 1)
+        return {
+            "mode": mode,
+            "provider": "external" if opts["url"] else opts["provider"],
+            "stream": opts["stream"],
+            "target_rps": opts["rps"],
+            "requests": len(samples),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+            "statuses": dict(Counter(s.status for s in samples)),
+            "throughput_rps": round(len(ok) / wall, 2) if wall else 0.0,
+            "latency_ms": {"p50": ms(ok, 50), "p95": ms(ok, 95), "p99": ms(ok, 99), "max": ms(ok, 100)},
+            "ttfb_ms": {"p50": ms(ttfb, 50), "p95": ms(ttfb, 95), "p99": ms(ttfb, 99)},
+        }
+
+    def _report(self, s):
+        lat, ttfb = s["latency_ms"], s["ttfb_ms"]
+        self.stdout.write(
+            f"{s['mode']}, provider={s['provider']}{', SSE' if s['stream'] else ''}: "
+            f"{s['requests']} requests at {s['target_rps']:g} rps target\n"
+            f"  throughput {s['throughput_rps']:.1f} ok/s, error rate {s['error_rate']:.2%}  {s['statuses']}\n"
+            f"  latency ms  p50 {lat['p50']:.0f}  p95 {lat['p95']:.0f}  p99 {lat['p99']:.0f}  max {lat['max']:.0f}"
+        )
+        if s["stream"]:
+            self.stdout.write(f"  ttfb ms     p50 {ttfb['p50']:.0f}  p95 {ttfb['p95']:.0f}  p99 {ttfb['p99']:.0f}")
+        if "sources" in s:
+            self.stdout.write(f"  answered by {s['sources']}")
+        if "stub" in s:
+            self.stdout.write(f"  stub {s['stub']}")
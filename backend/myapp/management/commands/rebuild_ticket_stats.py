@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import ticket_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the TicketDailyStats rollup from Ticket, one GROUP BY per --chunk-size primary keys, "
+        "and replace it in one transaction. --check only reports buckets that drifted (exit status 1 if any)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=ticket_stats.DEFAULT_CHUNK_SIZE,
+                            help="Ticket ids per GROUP BY")
+        parser.add_argument("--check", action="store_true", help="Compare with the stored rollup, don't write")
+        parser.add_argument("--quiet", action="store_true", help="No progress lines")
+
+    def handle(self, *args, **opts):
+        if opts["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        t0 = time.perf_counter()
+
+        def progress(done, total, buckets):
+            if not opts["quiet"]:
+                self.stderr.write(f"  ids <= {done:,} of {total:,}: {buckets:,} buckets "
+                                  f"({time.perf_counter() - t0:.1f}s)")
+
+        if opts["check"]:
+            drift = ticket_stats.diff(ticket_stats.aggregate(chunk_size=opts["chunk_size"], progress=progress),
+                                      ticket_stats.current())
+            for key, (expected, stored) in sorted(drift.items())[:20]:
+                day, category, type_, status = key
+                self.stdout.write(f"{day} {category or '-'} {type_} {status}: expected {expected}, stored {stored}")
+            if drift:
+                raise CommandError(f"{len(drift):,} buckets differ; run rebuild_ticket_stats to fix them")
+            self.stdout.write("TicketDailyStats matches Ticket")
+            return
+
+        result = ticket_stats.rebuild(chunk_size=opts["chunk_size"], progress=progress)
+        self.stdout.write(
+            f"Rebuilt {result['buckets']:,} buckets from {result['tickets']:,} tickets "
+            f"in {time.perf_counter() - t0:.1f}s"
+        )
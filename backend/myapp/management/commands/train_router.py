@@ -0,0 +1,76 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ai import router as local_router
+from myapp.models import Ticket
+
+
+class Command(BaseCommand):
+    help = (
+        "Train the local pre-router from stored Ticket labels (ai_category / ai_is_technical), "
+        "print a held-out accuracy/latency report and save the model used by ai_agent()."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="Model path (default: AI_ROUTER_MODEL, under AI_DATA_DIR)")
+        parser.add_argument("--from-jsonl", metavar="PATH",
+                            help="Train from a JSONL file of {text, category, is_technical} instead of tickets")
+        parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out for the report")
+        parser.add_argument("--epochs", type=int, default=8)
+        parser.add_argument("--dim", type=int, default=1 << 18, help="Hashed feature space size")
+        parser.add_argument("--min-rows", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=13)
+        parser.add_argument("--report-only", action="store_true", help="Evaluate but don't write the model")
+
+    def handle(self, *args, **opts):
+        texts, labels = local_router.training_rows(self._rows(opts))
+        if len(texts) < opts["min_rows"]:
+            raise CommandError(f"Only {len(texts)} labeled rows; need at least {opts['min_rows']}.")
+
+        order = list(range(len(texts)))
+        random.Random(opts["seed"]).shuffle(order)
+        n_test = int(len(order) * opts["holdout"])
+        test, train = order[:n_test], order[n_test:]
+        classes = sorted(set(labels))
+        self.stdout.write(f"{len(train)} train / {len(test)} held out, classes: {', '.join(classes)}")
+
+        t0 = time.perf_counter()
+        model = local_router.LocalRouter(classes, opts["dim"]).fit(
+            [texts[i] for i in train], [labels[i] for i in train], epochs=opts["epochs"], seed=opts["seed"],
+        )
+        train_s = time.perf_counter() - t0
+
+        report = {"train_rows": len(train), "train_seconds": round(train_s, 2)}
+        if test:
+            report.update(local_router.evaluate(model, [texts[i] for i in test], [labels[i] for i in test]))
+        report["skip_threshold"] = local_router.AI_ROUTER_SKIP_THRESHOLD
+        self.stdout.write(json.dumps(report, indent=2))
+
+        if opts["report_only"]:
+            return
+        # ship a model trained on everything we have
+        if test:
+            model = local_router.LocalRouter(classes, opts["dim"]).fit(texts, labels, epochs=opts["epochs"], seed=opts["seed"])
+        model.meta = {"trained_at": int(time.time()), "rows": len(texts), "report": report}
+        output = opts["output"] or local_router.model_path()
+        model.save(output)
+        self.stdout.write(self.style.SUCCESS(f"Saved router model to {output}"))
+
+    def _rows(self, opts):
+        if opts["from_jsonl"]:
+            try:
+                fh = open(opts["from_jsonl"], encoding="utf-8")
+            except OSError as e:
+                raise CommandError(str(e))
+            with fh:
+                for line in fh:
+                    if line.strip():
+                        obj = json.loads(line)
+                        yield obj.get("text", ""), obj.get("category", ""), bool(obj.get("is_technical"))
+            return
+        # tickets filed without an AI analysis carry no label
+        qs = Ticket.objects.exclude(text="").exclude(ai_category="").values_list("text", "ai_category", "ai_is_technical")
+        yield from qs.iterator(chunk_size=2000)
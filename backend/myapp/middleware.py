@@ -0,0 +1,103 @@
+# ==============================================
+# Response compression (gzip / brotli)
+# ==============================================
+# Django's GZipMiddleware compresses every content type and knows no brotli.
+# This one compresses JSON (and the plain-text /metrics page) only, from
+# RESPONSE_COMPRESS_MIN_BYTES up, with brotli when the client accepts it and
+# the `brotli` package is installed (pip install brotli), else gzip:
+# - HTML is left alone: it carries the CSRF token next to user input (BREACH);
+# - streamed responses (SSE, JSONL, CSV export) are left alone: compressing
+#   them would buffer the events the client is waiting for;
+# - a response that doesn't get smaller is sent as is.
+from __future__ import annotations
+import gzip
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+RESPONSE_COMPRESS = os.getenv("RESPONSE_COMPRESS", "true").strip().lower() not in ("0", "false", "no", "off")
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))   # 0-11; 4-6 suits per-request work
+
+COMPRESSIBLE_TYPES = ("application/json", "text/plain")
+
+_q_re = re.compile(r"^\s*q\s*=\s*([0-9.]+)\s*$")
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    out: Dict[str, float] = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        m = _q_re.match(params) if params else None
+        if m:
+            try:
+                q = float(m.group(1))
+            except ValueError:
+                q = 0.0
+        out[coding] = q
+    return out
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """"br", "gzip" or None for an Accept-Encoding header."""
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+def compressed_body(body: bytes, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+    """(body to send, Content-Encoding or None) for a compressible response."""
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return body, None
+    coding = choose_encoding(accept_encoding)
+    if coding is None:
+        return body, None
+    compressed = compress(body, coding)
+    if len(compressed) >= len(body):
+        return body, None
+    return compressed, coding
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        if not RESPONSE_COMPRESS or response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if response.get("Content-Type", "").split(";")[0].strip().lower() not in COMPRESSIBLE_TYPES:
+            return response
+        if len(response.content) < RESPONSE_COMPRESS_MIN_BYTES:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        compressed, coding = compressed_body(response.content, request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = coding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag   # the bytes changed
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:49
+
+import django.db.models.deletion
+import myapp.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint', models.TextField()),
+                ('prompt_hash', models.CharField(db_index=True, max_length=64)),
+                ('prompt_version', models.CharField(blank=True, max_length=16)),
+                ('model', models.CharField(max_length=64)),
+                ('source', models.CharField(choices=[('llm', 'LLM'), ('cache', 'Cache'), ('router', 'Local router'), ('similar', 'Similar answer')], default='llm', max_length=10)),
+                ('result', models.JSONField(encoder=myapp.models.CompactJSONEncoder)),
+                ('category', models.CharField(blank=True, max_length=50)),
+                ('is_technical', models.BooleanField(default=False)),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('completion_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('latency_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_ticket_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='airecord',
+            name='source',
+            field=models.CharField(choices=[('llm', 'LLM'), ('cache', 'Cache'), ('router', 'Local router'), ('similar', 'Similar answer'), ('coalesced', 'Coalesced request')], default='llm', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('complaint', models.TextField()),
+                ('model', models.CharField(max_length=64)),
+                ('max_tokens', models.PositiveIntegerField()),
+                ('use_cache', models.BooleanField(default=True)),
+                ('dedupe_key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('coalesced', 'Coalesced'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lease_owner', models.CharField(blank=True, max_length=64)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('leader', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='followers', to='myapp.analysisjob')),
+                ('record', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='myapp.airecord')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'available_at'], name='job_claim_idx'), models.Index(fields=['status', 'lease_expires_at'], name='job_lease_idx'), models.Index(fields=['dedupe_key', 'status'], name='job_dedupe_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:30
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    """One GROUP BY over the existing tickets; `manage.py rebuild_ticket_stats` does the same in chunks."""
+    Ticket = apps.get_model('myapp', 'Ticket')
+    TicketDailyStats = apps.get_model('myapp', 'TicketDailyStats')
+    db = schema_editor.connection.alias
+    rows = (
+        Ticket.objects.using(db).annotate(day=TruncDate('created_at')).order_by()
+        .values('day', 'ai_category', 'type', 'status').annotate(n=Count('id'))
+    )
+    TicketDailyStats.objects.using(db).bulk_create(
+        (TicketDailyStats(day=r['day'], ai_category=r['ai_category'], type=r['type'], status=r['status'], count=r['n'])
+         for r in rows.iterator()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_ticket_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('ai_category', models.CharField(blank=True, max_length=50)),
+                ('type', models.CharField(max_length=20)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'ai_category', 'type', 'status'), name='ticket_stats_bucket_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_ticketdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['type', 'created_at', 'id'], name='ticket_type_created_idx'),
+        ),
+    ]
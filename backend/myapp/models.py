@@ -1,8 +1,115 @@
-from django.db import models
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from django.core import signing
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
+
+class CompactJSONEncoder(json.JSONEncoder):
+    """No padding after separators and raw UTF-8 (answers are often Arabic)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.item_separator, self.key_separator = ",", ":"
+        self.ensure_ascii = False
+
+
+class AIRecord(models.Model):
+    """One stored analysis from ai_agent(); tickets link to it through Ticket.ai_record_id."""
+    SOURCE_CHOICES = [
+        ('llm','LLM'), ('cache','Cache'), ('router','Local router'), ('similar','Similar answer'),
+        ('coalesced','Coalesced request'),
+    ]
+
+    student         = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    complaint       = models.TextField()
+    prompt_hash     = models.CharField(max_length=64, db_index=True)
+    prompt_version  = models.CharField(max_length=16, blank=True)
+    model           = models.CharField(max_length=64)
+    source          = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='llm')
+    result          = models.JSONField(encoder=CompactJSONEncoder)
+    category        = models.CharField(max_length=50, blank=True)
+    is_technical    = models.BooleanField(default=False)
+    prompt_tokens     = models.PositiveIntegerField(null=True, blank=True)
+    completion_tokens = models.PositiveIntegerField(null=True, blank=True)
+    latency_ms      = models.PositiveIntegerField(null=True, blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def from_result(cls, result, *, complaint, model, info=None, student=None):
+        """Unsaved record for an ai_agent() result; `info` is the dict ai_agent filled in."""
+        info = info or {}
+        routing = result.get("routing") or {}
+        return cls(
+            student=student if student is not None and student.is_authenticated else None,
+            complaint=complaint,
+            prompt_hash=info.get("prompt_hash") or "",
+            prompt_version=info.get("prompt_version") or "",
+            model=info.get("model") or model,   # the cascade tier that answered, if any
+            source=info.get("source") or "llm",
+            result=result,
+            category=(routing.get("category") or "")[:50],
+            is_technical=bool(routing.get("is_technical", True)),
+            prompt_tokens=info.get("prompt_tokens"),
+            completion_tokens=info.get("completion_tokens"),
+            latency_ms=info.get("latency_ms"),
+        )
+
+    @property
+    def link_token(self):
+        """
+        Unguessable handle returned with the analysis: ticket_create links an anonymous
+        record only through it, since sequential ids alone would let anyone claim one.
+        """
+        return signing.Signer(salt="myapp.AIRecord.link").sign(str(self.pk))
+
+    @staticmethod
+    def pk_from_link_token(token):
+        """The record id a link_token was issued for, or None if it is missing or forged."""
+        try:
+            value = signing.Signer(salt="myapp.AIRecord.link").unsign(token or "")
+        except signing.BadSignature:
+            return None
+        return int(value) if value.isdigit() else None
+
+    def __str__(self):
+        return f"AIRecord #{self.pk} {self.category or 'unknown'} ({self.source})"
+
+
+class TicketQuerySet(models.QuerySet):
+    """Newest-first listing with keyset (seek) pagination on (created_at, id)."""
+
+    def newest_first(self):
+        return self.order_by('-created_at', '-id')
+
+    def before_cursor(self, cursor):
+        """Rows after `cursor` in newest_first() order. Raises ValueError on a malformed cursor."""
+        if not cursor:
+            return self
+        created_at, pk = decode_cursor(cursor)
+        # range on created_at (index seek) + a residual check for ties at the boundary
+        return self.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+
+
+def encode_cursor(created_at, pk):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{pk}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, _, pk = raw.partition("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"bad cursor: {cursor!r}") from e
+
+
 class Ticket(models.Model):
     TYPE_CHOICES = [('technical','Technical'), ('non-technical','Non-Technical')]
     STATUS_CHOICES = [('open','Open'), ('in_progress','In Progress'), ('closed','Closed')]
@@ -14,7 +121,92 @@ class Ticket(models.Model):
     ai_is_technical = models.BooleanField(default=False)
     ai_record_id  = models.CharField(max_length=64, blank=True)
     status        = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
-    created_at    = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add: import_tickets keeps the legacy helpdesk's timestamps
+    created_at    = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = TicketQuerySet.as_manager()
+
+    class Meta:
+        # staff dashboards: newest first, filtered by status / type+status / category.
+        # "id" breaks created_at ties for keyset pagination (see views.ticket_list).
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='ticket_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='ticket_status_created_idx'),
+            models.Index(fields=['type', 'status', 'created_at', 'id'], name='ticket_type_status_idx'),
+            models.Index(fields=['type', 'created_at', 'id'], name='ticket_type_created_idx'),
+            models.Index(fields=['ai_category', 'created_at', 'id'], name='ticket_category_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # one transaction with the TicketDailyStats update made by the post_save handler
+        # (ticket_stats.py): under autocommit the row would otherwise commit on its own first
+        with transaction.atomic(using=kwargs.get("using") or router.db_for_write(Ticket, instance=self)):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"#{self.pk} {self.type} ({self.status})"
+
+
+class TicketDailyStats(models.Model):
+    """
+    Tickets created per day (settings.TIME_ZONE) x ai_category x type x status, by current status.
+    Kept current by myapp/ticket_stats.py; `manage.py rebuild_ticket_stats` recomputes it.
+    """
+    day           = models.DateField()
+    ai_category   = models.CharField(max_length=50, blank=True)
+    type          = models.CharField(max_length=20)
+    status        = models.CharField(max_length=20)
+    count         = models.IntegerField(default=0)
+
+    class Meta:
+        # also the index for the stats endpoint's day range scans
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'ai_category', 'type', 'status'], name='ticket_stats_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.ai_category or 'unknown'} {self.type} {self.status}: {self.count}"
+
+
+class AnalysisJob(models.Model):
+    """
+    A queued analysis (POST /student/ai/analyze/?async=1), processed by `manage.py ai_workers`.
+    Workers lease a job by setting lease_owner/lease_expires_at; a lease that runs out
+    (crashed worker) makes the job claimable again. Identical complaints submitted while
+    a job is in flight become followers of it (status "coalesced") and get its answer.
+    """
+    STATUS_CHOICES = [
+        ('queued','Queued'), ('running','Running'), ('coalesced','Coalesced'), ('done','Done'), ('failed','Failed'),
+    ]
+    IN_FLIGHT = ('queued', 'running')
+    FINISHED = ('done', 'failed')
+
+    id              = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)   # unguessable: anonymous polling
+    student         = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    complaint       = models.TextField()
+    model           = models.CharField(max_length=64)
+    max_tokens      = models.PositiveIntegerField()
+    use_cache       = models.BooleanField(default=True)
+    dedupe_key      = models.CharField(max_length=64)   # same as AIRecord.prompt_hash
+    leader          = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL, related_name='followers')
+    status          = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts        = models.PositiveSmallIntegerField(default=0)
+    available_at    = models.DateTimeField(default=timezone.now)
+    lease_owner     = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    record          = models.ForeignKey(AIRecord, null=True, blank=True, on_delete=models.SET_NULL)
+    error           = models.TextField(blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    finished_at     = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # workers: next claimable job (queued and due, or running with an expired lease)
+            models.Index(fields=['status', 'available_at'], name='job_claim_idx'),
+            models.Index(fields=['status', 'lease_expires_at'], name='job_lease_idx'),
+            # enqueue: an in-flight job for the same complaint
+            models.Index(fields=['dedupe_key', 'status'], name='job_dedupe_idx'),
+        ]
+
+    def __str__(self):
+        return f"AnalysisJob {self.pk} ({self.status})"
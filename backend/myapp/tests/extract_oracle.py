@@ -0,0 +1,119 @@
+"""
+The original command extractor and step matcher, kept as oracles for the
+anchored versions in complaint_agent (test_extract.py checks they agree;
+`manage.py bench_extract` times them), plus the golden and fuzz corpora.
+"""
+import random
+
+from myapp.ai import complaint_agent as agent
+
+
+def reference_extract(code_raw):
+    """The original multi-pass extractor (one findall per pattern), kept as the oracle."""
+    if not code_raw:
+        return []
+    candidates = []
+    for block in agent._TRIPLE_BLOCK_RE.findall(code_raw):
+        for ln in agent._lines(block):
+            s = ln.strip()
+            if not s:
+                continue
+            if s.startswith("$"):
+                s = s[1:].strip()
+            if agent._CMD_LINE_RE.match(s):
+                candidates.append(s)
+    for inline in agent._INLINE_BT_RE.findall(code_raw):
+        s = inline.strip()
+        if s.startswith("$"):
+            s = s[1:].strip()
+        if agent._CMD_LINE_RE.match(s) or any(p.search(s) for p in agent._INLINE_CMD_PATTERNS):
+            candidates.append(s)
+    for patt in agent._INLINE_CMD_PATTERNS:
+        for m in patt.findall(code_raw):
+            s = m.strip()
+            if s.startswith("$"):
+                s = s[1:].strip()
+            candidates.append(s)
+    for ln in agent._lines(code_raw):
+        s = ln.strip()
+        if s.startswith("$"):
+            s = s[1:].strip()
+        if agent._CMD_LINE_RE.match(s):
+            candidates.append(s)
+    seen = set()
+    dedup = []
+    for c in candidates:
+        if c not in seen:
+            seen.add(c)
+            dedup.append(c)
+    return dedup
+
+
+def reference_best_step(cmd, steps_texts):
+    """The original matcher: re-tokenizes every step for every command."""
+    ctoks = set(agent._tokens(cmd))
+    if not ctoks:
+        return None
+    best_i, best_score = None, 0.0
+    for i, step in enumerate(steps_texts):
+        stoks = set(agent._tokens(step))
+        if not stoks:
+            continue
+        inter = len(ctoks & stoks)
+        score = inter / max(1, min(len(ctoks), len(stoks)))
+        if ("version" in ctoks and "version" in stoks) or ("install" in ctoks and "install" in stoks):
+            score += 0.25
+        if score > best_score:
+            best_i, best_score = i, score
+    return best_i if (best_i is not None and best_score >= 0.25) else None
+
+
+GOLDEN = [
+    "",
+    "no commands here, just prose about the lab",
+    "Run `pip install numpy` then `python -m venv .venv`.",
+    "```bash\n$ pip install -r requirements.txt\n$ python manage.py migrate\n```",
+    "```\ngit clone https://github.com/org/repo.git\ncd repo\nnpm i\n```\nthen yarn add react",
+    "Use sudo apt-get install build-essential and brew install python@3.12 on mac.",
+    "curl -L https://example.com/x.sh | sh; wget https://example.com/f.zip",
+    "powershell -ExecutionPolicy Bypass -File setup.ps1\ncmd /c dir",
+    "conda create -n lab python=3.11\nconda activate lab\nconda env create -f env.yml",
+    "PIP INSTALL Flask and Python3 -m pip install --upgrade pip",
+    "pnpm install\npnpm add vite\n`export PATH=$PATH:~/bin`\nset FOO=1",
+    "pip install a pip install b pip3 install c.d-e_f",
+    "اكتب الأمر pip install pandas ثم python -m jupyter notebook",
+    "git checkout main && git pull origin main\r\nsudo   systemctl restart nginx",
+    "`$ curl localhost:8000` and ``` ``` and `` and `not a command`",
+]
+
+_FRAGMENTS = [
+    "pip", "pip3", "install", "python", "python3", "-m", "git", "clone", "pull", "checkout",
+    "conda", "create", "activate", "env", "npm", "i", "yarn", "add", "pnpm", "sudo", "apt",
+    "apt-get", "brew", "curl", "wget", "powershell", "-Command", "cmd", "/c", "$", "`", "```",
+    "bash", "\n", "\r\n", "  ", "\t", "numpy", "https://x.io/a", "-r", "req.txt", "export", "X=1",
+    "set", "cd", "dir", "the", "error", "PIP", "Git", "PoWeRsHeLl", "خطأ", "pipx", "gitlab", "sudoku",
+    "ſudo", "pİp", "gıt", "\u212aey",
+]
+
+
+def fuzz_corpus(n, seed):
+    rng = random.Random(seed)
+    for _ in range(n):
+        parts = [rng.choice(_FRAGMENTS) for _ in range(rng.randint(1, 40))]
+        yield "".join(p + rng.choice(("", " ", " ", "\n")) for p in parts)
+
+
+_STEP_WORDS = _FRAGMENTS[:30] + [
+    "version", "check", "the", "open", "terminal", "environment", "package", "numpy", "pandas",
+    "restart", "editor", "interpreter", "select", "path", "PATH", "node", "3.11", "requirements",
+]
+
+
+def matcher_corpus(n, seed):
+    """(steps, commands) pairs shaped like a model answer."""
+    rng = random.Random(seed)
+    words = lambda k: " ".join(rng.choice(_STEP_WORDS) for _ in range(k))
+    for _ in range(n):
+        steps = [words(rng.randint(0, 14)) for _ in range(rng.randint(0, 8))]
+        cmds = [words(rng.randint(1, 6)) for _ in range(rng.randint(1, 6))]
+        yield steps, cmds
@@ -0,0 +1,34 @@
+import json
+
+from django.test import SimpleTestCase
+
+from myapp.ai import providers
+from myapp.ai.batch import parse_batch_output
+from myapp.ai.complaint_agent import _request_kwargs
+
+
+def _line(custom_id, content):
+    body = {"choices": [{"message": {"content": content}}]}
+    return json.dumps({"custom_id": custom_id, "response": {"status_code": 200, "body": body}})
+
+
+class ParseBatchOutputTests(SimpleTestCase):
+    """Batch API replies go through the same repair/validation as interactive ones."""
+
+    def test_repairs_and_errors(self):
+        content, _ = providers.fake_answer(_request_kwargs("pip install fails with permission denied", model="gpt-4o-mini", max_tokens=1000))
+        records = {r["id"]: r for r in parse_batch_output([
+            _line("plain", content),
+            _line("fenced", "Here you go:\n```json\n" + content + "\n```"),
+            _line("prose", "Sorry, I can't help with that."),
+            _line("list", "[1, 2]"),
+            _line("null", None),
+            "not json",
+        ])}
+        expected = json.loads(content)
+        self.assertEqual(records["plain"]["result"]["routing"], expected["routing"])
+        self.assertEqual(records["fenced"]["result"], records["plain"]["result"])
+        for item_id in ("prose", "list", "null"):
+            self.assertIn("error", records[item_id])
+            self.assertNotIn("result", records[item_id])
+        self.assertIn("invalid JSON", records[None]["error"])
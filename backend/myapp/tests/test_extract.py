@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+
+from myapp.ai import complaint_agent as agent
+
+from .extract_oracle import GOLDEN, fuzz_corpus, matcher_corpus, reference_best_step, reference_extract
+
+SEED = 7
+FUZZ = 300
+
+
+class ExtractCommandsTests(SimpleTestCase):
+    """_extract_commands_list() returns exactly what the original extractor did."""
+
+    def test_golden_outputs(self):
+        self.assertEqual(agent._extract_commands_list(""), [])
+        self.assertEqual(agent._extract_commands_list("no commands here, just prose about the lab"), [])
+        self.assertEqual(
+            agent._extract_commands_list("conda create -n lab python=3.11\nconda activate lab\nconda env create -f env.yml"),
+            ["conda create -n lab python=3.11", "conda activate lab", "conda env create -f env.yml"],
+        )
+        self.assertEqual(
+            agent._extract_commands_list("اكتب الأمر pip install pandas ثم python -m jupyter notebook"),
+            ["pip install pandas", "python -m jupyter notebook"],
+        )
+        self.assertEqual(
+            agent._extract_commands_list("git checkout main && git pull origin main\r\nsudo   systemctl restart nginx"),
+            ["git checkout main && git pull origin main", "sudo   systemctl restart nginx"],
+        )
+
+    def test_golden_matches_reference(self):
+        for text in GOLDEN:
+            with self.subTest(text=text):
+                self.assertEqual(agent._extract_commands_list(text), reference_extract(text))
+
+    def test_fuzz_matches_reference(self):
+        for text in fuzz_corpus(FUZZ, SEED):
+            with self.subTest(text=text):
+                self.assertEqual(agent._extract_commands_list(text), reference_extract(text))
+
+
+class StepMatcherTests(SimpleTestCase):
+    """StepMatcher picks the same step for each command as the original matcher."""
+
+    STEPS = [
+        "Open a terminal and check the python version",
+        "Install numpy into the environment",
+        "Restart the editor",
+    ]
+
+    def test_golden(self):
+        self.assertEqual(
+            agent.StepMatcher(self.STEPS).match(["python --version", "pip install numpy", "code .", "git pull"]),
+            [0, 1, None, None],
+        )
+        self.assertEqual(agent.StepMatcher([]).match(["pip install numpy"]), [None])
+
+    def test_fuzz_matches_reference(self):
+        for steps, cmds in matcher_corpus(FUZZ, SEED):
+            with self.subTest(steps=steps, cmds=cmds):
+                self.assertEqual(agent.StepMatcher(steps).match(cmds), [reference_best_step(c, steps) for c in cmds])
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from myapp.ai.ratelimit import LLMScheduler, LocalBuckets, RateLimited, SQLiteBuckets
+
+
+class _SlowBuckets:
+    """A shared backend stand-in that records whether take() ran under the scheduler lock."""
+
+    blocking = True
+
+    def __init__(self):
+        self.scheduler = None
+        self.locked = []
+
+    def take(self, requests, tokens):
+        self.locked.append(self.scheduler._lock.locked())
+        return 0.0
+
+
+class SchedulerLockTests(SimpleTestCase):
+    """Shared bucket backends are asked outside the scheduler lock; every request is still granted once."""
+
+    def _scheduler(self, buckets, rpm=1000, tpm=0):
+        scheduler = LLMScheduler(buckets, rpm, tpm)
+        buckets.scheduler = scheduler
+        return scheduler
+
+    def test_take_runs_outside_the_lock(self):
+        buckets = _SlowBuckets()
+        scheduler = self._scheduler(buckets)
+        scheduler.acquire(10)
+        asyncio.run(scheduler.aacquire(10))
+        self.assertEqual(buckets.locked, [False, False])
+        self.assertEqual((scheduler.stats()["granted"], scheduler.stats()["queue_depth"]), (2, 0))
+
+    def test_sqlite_threads(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = LLMScheduler(SQLiteBuckets(os.path.join(tmp, "rl.db"), 1000, 0), 1000, 0)
+            threads = [threading.Thread(target=scheduler.acquire, args=(10,)) for _ in range(20)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(10)
+            scheduler._buckets._conn.close()
+        self.assertEqual((scheduler.stats()["granted"], scheduler.stats()["queue_depth"]), (20, 0))
+
+    def test_local_buckets_unchanged(self):
+        scheduler = LLMScheduler(LocalBuckets(2, 0), 2, 0)
+        scheduler.acquire(10)
+        scheduler.acquire(10)
+        with self.assertRaises(RateLimited):
+            scheduler.acquire(10, max_wait_s=0)
+        self.assertEqual(scheduler.stats()["granted"], 2)
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from myapp.ai import providers
+from myapp.ai.complaint_agent import ai_agent, ai_agent_async
+from myapp.ai.singleflight import flights
+
+COMPLAINT = "pip install requests fails with 'Permission denied' on the lab machine"
+
+
+def _wait_for_waiters(base, n=2, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while flights.stats()["coalesced"] < base + n and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+class CoalescedInfoTests(SimpleTestCase):
+    """Callers that share the leader's answer also get the leader's info (prompt hash, model)."""
+
+    def tearDown(self):
+        providers.set_client_factory(None)
+
+    def assertSharedInfo(self, infos):
+        leaders = [i for i in infos if i["source"] != "coalesced"]
+        waiters = [i for i in infos if i["source"] == "coalesced"]
+        self.assertEqual((len(leaders), len(waiters)), (1, 2))
+        for info in waiters:
+            self.assertTrue(info["prompt_hash"])
+            for field in ("prompt_hash", "prompt_version", "model", "tier"):
+                self.assertEqual(info.get(field), leaders[0].get(field), field)
+            self.assertIsNone(info["prompt_tokens"])   # billed to the leader
+
+    def test_threads(self):
+        gate = threading.Event()
+
+        def answer(kwargs):
+            gate.wait(5)
+            return providers.fake_answer(kwargs)
+
+        providers.set_client_factory(lambda async_=False: providers._Client(answer, async_))
+        base = flights.stats()["coalesced"]
+        infos = [{} for _ in range(3)]
+        threads = [
+            threading.Thread(target=ai_agent, args=(COMPLAINT,), kwargs=dict(use_cache=False, cascade=True, info=i))
+            for i in infos
+        ]
+        for t in threads:
+            t.start()
+        _wait_for_waiters(base)
+        gate.set()
+        for t in threads:
+            t.join(10)
+        self.assertSharedInfo(infos)
+
+    def test_async(self):
+        async def run():
+            gate = asyncio.Event()
+
+            async def create(**kwargs):
+                await gate.wait()
+                return providers._completion(*providers.fake_answer(kwargs))
+
+            client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+            providers.set_client_factory(lambda async_=False: client)
+            base = flights.stats()["coalesced"]
+            infos = [{} for _ in range(3)]
+            tasks = [
+                asyncio.create_task(ai_agent_async(COMPLAINT, use_cache=False, cascade=True, info=i)) for i in infos
+            ]
+            while flights.stats()["coalesced"] < base + 2:
+                await asyncio.sleep(0.005)
+            gate.set()
+            await asyncio.wait_for(asyncio.gather(*tasks), 10)
+            return infos
+
+        self.assertSharedInfo(asyncio.run(run()))
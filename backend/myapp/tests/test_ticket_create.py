@@ -0,0 +1,54 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from myapp.models import AIRecord, Ticket
+
+
+class TicketCreateLinkTests(TestCase):
+    """ticket_create links an AIRecord only for the caller who received it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = get_user_model().objects
+        cls.alice = users.create_user("alice", password="x")
+        cls.bob = users.create_user("bob", password="x")
+
+    async def _create(self, **data):
+        response = await self.async_client.post(reverse("ticket_create"), data)
+        return response, await Ticket.objects.order_by("-id").afirst()
+
+    async def test_text_is_required(self):
+        record = await self._arecord()
+        response, ticket = await self._create(ai_record_token=record.link_token, complaint_text="  ")
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(ticket)
+
+    async def test_anonymous_record_needs_its_token(self):
+        record = await self._arecord()
+        _, ticket = await self._create(ai_record_id=str(record.pk), complaint_text="mine")
+        self.assertEqual((ticket.ai_record_id, ticket.text, ticket.ai_category), ("", "mine", ""))
+
+        _, ticket = await self._create(ai_record_token=record.link_token[:-1] + "x", complaint_text="forged")
+        self.assertEqual(ticket.ai_record_id, "")
+
+        _, ticket = await self._create(ai_record_token=record.link_token, complaint_text="mine")
+        self.assertEqual((ticket.ai_record_id, ticket.type), (str(record.pk), "technical"))
+
+    async def test_owned_record_by_id(self):
+        record = await self._arecord(self.alice)
+        await self.async_client.aforce_login(self.alice)
+        _, ticket = await self._create(ai_record_id=str(record.pk), complaint_text="mine")
+        self.assertEqual(ticket.ai_record_id, str(record.pk))
+
+        await self.async_client.aforce_login(self.bob)
+        _, ticket = await self._create(ai_record_id=str(record.pk), ai_record_token=record.link_token,
+                                       complaint_text="not mine")
+        self.assertEqual(ticket.ai_record_id, "")
+
+    async def _arecord(self, student=None):
+        return await AIRecord.objects.acreate(
+            student=student, complaint="pip install fails with permission denied", prompt_hash="h",
+            model="gpt-4o-mini", result={"routing": {"is_technical": True, "category": "dev_env_tooling"}},
+            category="dev_env_tooling", is_technical=True,
+        )
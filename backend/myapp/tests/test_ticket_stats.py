@@ -0,0 +1,44 @@
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from myapp import ticket_stats
+from myapp.models import Ticket, TicketDailyStats
+
+
+class TicketStatsTests(TestCase):
+    """The TicketDailyStats rollup matches a GROUP BY over Ticket after every write."""
+
+    def assertNoDrift(self):
+        self.assertEqual(ticket_stats.diff(ticket_stats.aggregate(), ticket_stats.current()), {})
+
+    def test_save_status_change_and_delete(self):
+        a = Ticket.objects.create(type="technical", text="a", ai_category="coding_bug")
+        Ticket.objects.create(type="non-technical", text="b", ai_category="non_technical")
+        self.assertNoDrift()
+        a.status = "closed"
+        a.save()
+        self.assertNoDrift()
+        partial = Ticket.objects.only("id", "text").get(pk=a.pk)
+        partial.text = "edited"
+        partial.save()
+        self.assertNoDrift()
+        a.delete()
+        self.assertNoDrift()
+
+    def test_rollup_failure_rolls_back_the_ticket(self):
+        with mock.patch.object(ticket_stats, "apply", side_effect=RuntimeError("stats down")):
+            with self.assertRaises(RuntimeError):
+                Ticket.objects.create(type="technical", text="a")
+        self.assertFalse(Ticket.objects.exists())
+        self.assertFalse(TicketDailyStats.objects.exists())
+
+    def test_naive_created_at(self):
+        naive = datetime(2026, 3, 1, 23, 30)
+        with self.assertWarns(RuntimeWarning):   # Django's "received a naive datetime"
+            ticket = Ticket.objects.create(type="technical", text="a", created_at=naive)
+        expected = timezone.make_aware(naive, timezone.get_default_timezone()).date()
+        self.assertEqual(ticket_stats.bucket(ticket)[0], expected)
+        self.assertNoDrift()
@@ -0,0 +1,302 @@
+# ==============================================
+# Bulk ticket import / streaming export
+# ==============================================
+# `manage.py import_tickets`, `manage.py export_tickets` and GET /tickets/export/
+# share the column layout below, so an export re-imports as is.
+# - import: rows are parsed lazily (CSV or JSONL), checked, and turned into
+#   Ticket objects; students are resolved through one preloaded
+#   {username: id} map (no query per row). Rows are written with bulk_create in
+#   chunks of `batch_size`, one transaction per `commit_every` rows. Memory
+#   holds one chunk, a bad row is skipped and reported, and a crash loses at
+#   most one transaction. Each transaction also adds its rows to
+#   TicketDailyStats (bulk_create sends no signals). Legacy ids are not kept
+#   (new primary keys), their created_at is;
+# - export: .values_list().iterator(chunk_size) (a server-side cursor on
+#   PostgreSQL, fetchmany() chunks elsewhere), so the queryset is never
+#   materialized and memory stays flat however many rows go out.
+from __future__ import annotations
+import csv
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import ticket_stats
+from .models import Ticket, User
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage
+    resource = None
+
+COLUMNS = ("id", "created_at", "student", "type", "status", "ai_category", "ai_is_technical", "ai_record_id", "text")
+_VALUES = ("id", "created_at", "student__username", "type", "status", "ai_category", "ai_is_technical",
+           "ai_record_id", "text")
+FORMATS = ("csv", "jsonl")
+STUDENT_KEYS = ("username", "email", "id")
+
+DEFAULT_BATCH_SIZE = 2000      # rows per bulk_create
+DEFAULT_COMMIT_EVERY = 20000   # rows per transaction
+DEFAULT_CHUNK_SIZE = 2000      # rows per export fetch
+
+_TYPES = {value for value, _ in Ticket.TYPE_CHOICES}
+_STATUSES = {value for value, _ in Ticket.STATUS_CHOICES}
+_CATEGORY_MAX = Ticket._meta.get_field("ai_category").max_length
+_RECORD_ID_MAX = Ticket._meta.get_field("ai_record_id").max_length
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n"}
+
+
+class RowError(ValueError):
+    """A row that cannot become a Ticket."""
+
+
+def peak_rss_mb() -> Optional[float]:
+    """This process' peak resident set size so far (None where getrusage is missing)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024   # bytes on macOS, KiB on Linux
+
+
+def format_for(path: str) -> str:
+    """csv / jsonl from a file name (.csv, .jsonl, .ndjson)."""
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        return "csv"
+    if lower.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"can't tell the format of {path!r}; pass --format")
+
+
+# ---- import
+
+def read_rows(fh, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, row) pairs, one at a time. JSON errors come out as RowError rows."""
+    if fmt == "csv":
+        reader = csv.DictReader(fh)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for n, line in enumerate(fh, 1):
+        if not line.strip():
+            continue
+        try:
+            yield n, json.loads(line)
+        except ValueError as e:
+            yield n, RowError(f"invalid JSON: {e}")
+
+
+def _text(row: Dict[str, Any], field: str) -> str:
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def _bool(value: Any) -> Optional[bool]:
+    """True / False, or None when the row leaves it out."""
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise RowError(f"ai_is_technical: not a boolean: {value!r}")
+
+
+def _created_at(value: str, now, tz):
+    if not value:
+        return now
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise RowError(f"created_at: not an ISO 8601 datetime: {value!r}")
+    if tz is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, tz)   # naive legacy timestamps are in TIME_ZONE
+    return parsed
+
+
+class TicketImporter:
+    """
+    Turns rows into Tickets and bulk-inserts them. `stats` counts rows read,
+    imported and skipped; `errors` keeps the first `max_errors` (line, message).
+    """
+
+    def __init__(self, *, student_key: str = "username", batch_size: int = DEFAULT_BATCH_SIZE,
+                 commit_every: int = DEFAULT_COMMIT_EVERY, strict: bool = False, max_errors: int = 50,
+                 using: str = "default"):
+        if student_key not in STUDENT_KEYS:
+            raise ValueError(f"student_key must be one of {STUDENT_KEYS}")
+        self.student_key = student_key
+        self.batch_size = max(1, batch_size)
+        self.commit_every = max(self.batch_size, commit_every)
+        self.strict = strict
+        self.max_errors = max_errors
+        self.using = using
+        self.students: Dict[str, int] = {}
+        self.stats = {"rows": 0, "imported": 0, "skipped": 0, "unknown_students": 0, "transactions": 0}
+        self.errors: List[Tuple[int, str]] = []
+
+    def load_students(self) -> int:
+        """Preload {username|email|id: pk}; one query instead of one per row."""
+        qs = User.objects.using(self.using).values_list(self.student_key, "id")
+        self.students = {self._key(key): pk for key, pk in qs.iterator(chunk_size=5000) if key}
+        return len(self.students)
+
+    def _key(self, value: Any) -> str:
+        key = str(value).strip()
+        return key.lower() if self.student_key == "email" else key
+
+    def ticket(self, row: Any, now, tz=None) -> Ticket:
+        if isinstance(row, RowError):
+            raise row
+        if not isinstance(row, dict):
+            raise RowError("not an object")
+        text = row.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise RowError("text: required")
+        is_technical = _bool(row.get("ai_is_technical"))
+        type_ = _text(row, "type") or ("technical" if is_technical else "non-technical")
+        if type_ not in _TYPES:
+            raise RowError(f"type: {type_!r} is not one of {sorted(_TYPES)}")
+        status = _text(row, "status") or "open"
+        if status not in _STATUSES:
+            raise RowError(f"status: {status!r} is not one of {sorted(_STATUSES)}")
+        category = _text(row, "ai_category")
+        if len(category) > _CATEGORY_MAX:
+            raise RowError(f"ai_category: longer than {_CATEGORY_MAX} characters")
+        record_id = _text(row, "ai_record_id")
+        if len(record_id) > _RECORD_ID_MAX:
+            raise RowError(f"ai_record_id: longer than {_RECORD_ID_MAX} characters")
+
+        student_id = None
+        student = _text(row, "student")
+        if student:
+            student_id = self.students.get(self._key(student))
+            if student_id is None:   # kept, unassigned (what SET_NULL would leave anyway)
+                self.stats["unknown_students"] += 1
+        return Ticket(
+            student_id=student_id,
+            type=type_,
+            text=text,
+            ai_category=category,
+            ai_is_technical=type_ == "technical" if is_technical is None else is_technical,
+            ai_record_id=record_id,
+            status=status,
+            created_at=_created_at(_text(row, "created_at"), now, tz),
+        )
+
+    def _tickets(self, rows: Iterable[Tuple[int, Any]]) -> Iterator[Ticket]:
+        now = timezone.now()
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        for line, row in rows:
+            self.stats["rows"] += 1
+            try:
+                yield self.ticket(row, now, tz)
+            except RowError as e:
+                if self.strict:
+                    raise RowError(f"line {line}: {e}") from None
+                self.stats["skipped"] += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append((line, str(e)))
+
+    def run(self, rows: Iterable[Tuple[int, Any]],
+            progress: Optional[Callable[["TicketImporter"], None]] = None) -> Dict[str, int]:
+        """Import every row; `progress(self)` is called after each committed transaction."""
+        tickets = self._tickets(rows)
+        while True:
+            committed = 0
+            with transaction.atomic(using=self.using):
+                counts = Counter()
+                for _ in range(self.commit_every // self.batch_size):
+                    batch = list(itertools.islice(tickets, self.batch_size))
+                    if not batch:
+                        break
+                    Ticket.objects.using(self.using).bulk_create(batch)
+                    counts.update(ticket_stats.count_tickets(batch))   # bulk_create sends no post_save
+                    committed += len(batch)
+                ticket_stats.apply(counts, self.using)
+            if not committed:
+                return self.stats
+            self.stats["imported"] += committed
+            self.stats["transactions"] += 1
+            if progress is not None:
+                progress(self)
+
+
+# ---- export
+
+def export_queryset(filters: Optional[Dict[str, str]] = None, using: str = "default"):
+    """Rows in COLUMNS order, oldest first (the primary key index)."""
+    return Ticket.objects.using(using).filter(**(filters or {})).order_by("id").values_list(*_VALUES)
+
+
+def _cells(values: Tuple) -> Tuple:
+    values = list(values)
+    values[1] = values[1].isoformat()
+    values[2] = values[2] or ""
+    return tuple(values)
+
+
+def _formatter(fmt: str) -> Tuple[str, Callable[[Tuple], str]]:
+    """(header, row -> line) for CSV or JSONL."""
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        return writer.writerow(COLUMNS), lambda values: writer.writerow(_cells(values))
+    return "", lambda values: json.dumps(dict(zip(COLUMNS, _cells(values))), ensure_ascii=False) + "\n"
+
+
+def iter_export(rows: Iterable[Tuple], fmt: str) -> Iterator[str]:
+    """Lines of CSV (with a header) or JSONL for `rows` from export_queryset()."""
+    header, line = _formatter(fmt)
+    if header:
+        yield header
+    for values in rows:
+        yield line(values)
+
+
+async def aiter_export(qs, fmt: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[str]:
+    """
+    iter_export() for async views: one string (one HTTP chunk) per fetched chunk.
+    Not QuerySet.aiterator(), which runs a values_list() query on the event loop.
+    """
+    header, line = _formatter(fmt)
+    rows = qs.iterator(chunk_size=chunk_size)   # a generator: no query yet
+    fetch = sync_to_async(lambda: list(itertools.islice(rows, chunk_size)))
+    if header:
+        yield header
+    while True:
+        chunk = await fetch()
+        if not chunk:
+            return
+        yield "".join(line(values) for values in chunk)
+
+
+class _Echo:
+    """csv.writer target that hands each formatted row back instead of buffering it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+class Throughput:
+    """rows/s and peak RSS for progress lines."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def line(self, rows: int, label: str = "rows") -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = rows / elapsed if elapsed else 0.0
+        rss = peak_rss_mb()
+        peak = f", peak RSS {rss:.0f} MB" if rss is not None else ""
+        return f"{rows:,} {label} in {elapsed:.1f}s ({rate:,.0f} rows/s{peak})"
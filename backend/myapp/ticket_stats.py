@@ -0,0 +1,196 @@
+# ==============================================
+# Ticket daily rollup (TicketDailyStats)
+# ==============================================
+# Staff dashboards count tickets per day x ai_category x type x status. A GROUP BY
+# over Ticket gets slower as the table grows; the rollup holds one row per
+# bucket, so a dashboard reads O(days x buckets) rows however many tickets exist.
+# - a bucket counts the tickets created that day (created_at's date in
+#   settings.TIME_ZONE) by their current status: the same numbers as a GROUP BY
+#   over Ticket, so a status change moves one count from one bucket to another;
+# - Ticket.save() / delete() keep it current through the signals below
+#   (connected in apps.py), in the same transaction as the ticket write:
+#   Ticket.save() wraps itself in transaction.atomic() for that, and
+#   delete() sends post_delete inside the deletion's own transaction;
+# - bulk_create and QuerySet.update() / delete() send no signals: code using
+#   them applies count_tickets() itself (TicketImporter does) or runs
+#   `manage.py rebuild_ticket_stats` afterwards;
+# - rebuild_ticket_stats recomputes everything in primary-key chunks, and
+#   `--check` reports drift without writing.
+from __future__ import annotations
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Ticket, TicketDailyStats
+
+Bucket = Tuple[date, str, str, str]   # (day, ai_category, type, status)
+
+BUCKET_FIELDS = ("day", "ai_category", "type", "status")
+DEFAULT_CHUNK_SIZE = 50000   # tickets per GROUP BY in rebuild()
+_BATCH = 2000                # buckets per INSERT
+
+_TICKET_FIELDS = {"created_at", "ai_category", "type", "status"}
+_CREATED_AT = Ticket._meta.get_field("created_at")
+
+
+def day_of(value) -> date:
+    """
+    The local date of a created_at value. Naive datetimes (USE_TZ off, or assigned by hand)
+    are read in the default time zone, as Django does when saving them; strings are parsed.
+    """
+    value = _CREATED_AT.to_python(value)
+    if value is None:
+        raise ValueError("Ticket.created_at is not set")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return timezone.localdate(value)
+
+
+def bucket(ticket: Ticket) -> Bucket:
+    return day_of(ticket.created_at), ticket.ai_category, ticket.type, ticket.status
+
+
+def count_tickets(tickets: Iterable[Ticket]) -> Counter:
+    """{bucket: +n} for new tickets, e.g. a bulk_create batch."""
+    return Counter(bucket(t) for t in tickets)
+
+
+def _bucket_ids(keys, using: str) -> Dict[Bucket, int]:
+    rows = (
+        TicketDailyStats.objects.using(using).filter(day__in={k[0] for k in keys}).values_list("id", *BUCKET_FIELDS)
+    )
+    wanted = set(keys)
+    return {key: r[0] for r in rows.iterator() if (key := tuple(r[1:])) in wanted}
+
+
+def apply(deltas: Mapping[Bucket, int], using: str = "default") -> None:
+    """
+    Add `deltas` to the rollup, in one transaction (joins the caller's, if any). Missing buckets
+    are created at 0 (ignoring ones another writer just created), then every count moves with
+    one executemany() of UPDATE ... SET count = count + delta: no ORM work per bucket.
+    """
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    stats = TicketDailyStats.objects.using(using)
+    with transaction.atomic(using=using):
+        ids = _bucket_ids(deltas, using)
+        missing = [k for k in deltas if k not in ids]
+        if missing:
+            stats.bulk_create([TicketDailyStats(**dict(zip(BUCKET_FIELDS, k)), count=0) for k in missing],
+                              batch_size=_BATCH, ignore_conflicts=True)
+            ids.update(_bucket_ids(missing, using))
+        qn = connections[using].ops.quote_name
+        with connections[using].cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {qn(TicketDailyStats._meta.db_table)} SET {qn('count')} = {qn('count')} + %s "
+                f"WHERE {qn('id')} = %s",
+                [(v, pk) for pk, v in sorted((ids[k], v) for k, v in deltas.items())],   # fixed lock order
+            )
+
+
+# ---- signals (connected in MyappConfig.ready)
+
+def _stored_bucket(instance: Ticket) -> Optional[Bucket]:
+    if instance.get_deferred_fields() & _TICKET_FIELDS:
+        return None
+    try:
+        return bucket(instance)
+    except (ValueError, ValidationError):   # unset / unparsable created_at: saving it fails anyway
+        return None
+
+
+def remember(sender, instance: Ticket, **kwargs) -> None:
+    """post_init: the bucket the row is counted in, before any change."""
+    instance._stats_bucket = _stored_bucket(instance) if instance.pk is not None else None
+
+
+def before_save(sender, instance: Ticket, raw: bool = False, using: str = "default", **kwargs) -> None:
+    """pre_save: a row loaded with deferred fields has no remembered bucket; read it."""
+    if instance._state.adding or getattr(instance, "_stats_bucket", None) is not None:
+        return
+    old = Ticket.objects.using(using).filter(pk=instance.pk).values_list("created_at", *BUCKET_FIELDS[1:]).first()
+    if old is not None:
+        instance._stats_bucket = (day_of(old[0]),) + tuple(old[1:])
+
+
+def after_save(sender, instance: Ticket, created: bool, using: str = "default", **kwargs) -> None:
+    new = bucket(instance)
+    old = None if created else getattr(instance, "_stats_bucket", None)
+    if old != new:
+        deltas = Counter({new: 1})
+        if old is not None:
+            deltas[old] -= 1
+        apply(deltas, using)
+    instance._stats_bucket = new
+
+
+def after_delete(sender, instance: Ticket, using: str = "default", **kwargs) -> None:
+    old = getattr(instance, "_stats_bucket", None) or bucket(instance)
+    apply({old: -1}, using)
+    instance._stats_bucket = None
+
+
+# ---- rebuild
+
+def _group(qs) -> Iterable[Tuple[Bucket, int]]:
+    rows = qs.annotate(day=TruncDate("created_at")).order_by().values(*BUCKET_FIELDS).annotate(n=Count("id"))
+    for r in rows:
+        yield (r["day"], r["ai_category"], r["type"], r["status"]), r["n"]
+
+
+def aggregate(using: str = "default", chunk_size: int = DEFAULT_CHUNK_SIZE, after_id: int = 0,
+              upto_id: Optional[int] = None, progress=None) -> Counter:
+    """The rollup computed from Ticket, one GROUP BY per `chunk_size` primary keys."""
+    tickets = Ticket.objects.using(using)
+    if upto_id is None:
+        upto_id = tickets.order_by("-id").values_list("id", flat=True).first() or 0
+    totals: Counter = Counter()
+    lo = after_id
+    while lo < upto_id:
+        hi = min(lo + chunk_size, upto_id)
+        for key, n in _group(tickets.filter(id__gt=lo, id__lte=hi)):
+            totals[key] += n
+        lo = hi
+        if progress is not None:
+            progress(lo, upto_id, len(totals))
+    return totals
+
+
+def current(using: str = "default") -> Dict[Bucket, int]:
+    """The rollup as stored (non-zero buckets)."""
+    rows = TicketDailyStats.objects.using(using).exclude(count=0).values_list(*BUCKET_FIELDS, "count")
+    return {tuple(r[:4]): r[4] for r in rows.iterator()}
+
+
+def diff(expected: Mapping[Bucket, int], stored: Mapping[Bucket, int]) -> Dict[Bucket, Tuple[int, int]]:
+    """{bucket: (expected, stored)} where they disagree."""
+    return {
+        key: (expected.get(key, 0), stored.get(key, 0))
+        for key in set(expected) | set(stored)
+        if expected.get(key, 0) != stored.get(key, 0)
+    }
+
+
+def rebuild(using: str = "default", chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None) -> Dict[str, int]:
+    """
+    Recompute the rollup from Ticket and replace it. The scan runs outside any transaction;
+    tickets created meanwhile are picked up in the final one, but a status change to an
+    already scanned ticket during the scan is lost (run --check afterwards, or again).
+    """
+    upto = Ticket.objects.using(using).order_by("-id").values_list("id", flat=True).first() or 0
+    totals = aggregate(using, chunk_size, upto_id=upto, progress=progress)
+    with transaction.atomic(using=using):
+        totals.update(aggregate(using, chunk_size, after_id=upto))
+        TicketDailyStats.objects.using(using).all().delete()
+        TicketDailyStats.objects.using(using).bulk_create(
+            (TicketDailyStats(**dict(zip(BUCKET_FIELDS, key)), count=n) for key, n in totals.items() if n),
+            batch_size=_BATCH,
+        )
+    return {"buckets": sum(1 for n in totals.values() if n), "tickets": sum(totals.values())}
@@ -4,7 +4,14 @@ urlpatterns = [
     path("ping/", views.ping, name="myapp_ping"),
     path("student/new/", views.new_query, name="student_new_query"),
     path("student/ai/analyze/", views.ai_analyze, name="student_ai_analyze"),
+    path("student/ai/analyze/batch/", views.ai_analyze_batch, name="student_ai_analyze_batch"),
+    path("student/ai/jobs/<uuid:job_id>/", views.ai_job_status, name="ai_job_status"),
+    path("student/ai/jobs/<uuid:job_id>/events/", views.ai_job_events, name="ai_job_events"),
+    path("tickets/", views.ticket_list, name="ticket_list"),
     path("tickets/create/", views.ticket_create, name="ticket_create"),
+    path("tickets/export/", views.ticket_export, name="ticket_export"),
+    path("tickets/stats/", views.ticket_stats, name="ticket_stats"),
     path("tickets/<int:pk>/", views.ticket_detail, name="ticket_detail"),
+    path("metrics", views.metrics, name="metrics"),   # Prometheus' default metrics_path
 ]
 
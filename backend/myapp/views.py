@@ -1,26 +1,35 @@
-from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest
+import asyncio
+import functools
+import hmac
+import json
+import time
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+from django.db.models.functions import Substr
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_POST
-from django.views.decorators.csrf import ensure_csrf_cookie
-from .models import Ticket
-
-# If you already copied your AI file to backend/myapp/ai/complaint_agent.py:
-try:
-    from myapp.ai.complaint_agent import ai_agent, for_frontend
-    AI_OK = True
-except Exception as _e:
-    # Fallback stub so the page still loads even if AI file isn't ready yet
-    AI_OK = False
-    def ai_agent(text, **kwargs):
-        return {"summary": "AI not wired yet.", "routing": {"is_technical": False}, "steps_to_apply": []}
-    def for_frontend(result):
-        return {
-            "is_technical": result.get("routing", {}).get("is_technical", False),
-            "category": result.get("routing", {}).get("category", "unknown"),
-            "summary": result.get("summary", ""),
-            "steps": result.get("steps_to_apply", []),
-            "ai_record_id": None,
-        }
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from .models import AIRecord, AnalysisJob, Ticket, TicketDailyStats, encode_cursor
+# no side effects at import: the LLM client is built on the first call
+# from settings.AI_PROVIDER (see myapp/ai/providers.py)
+from .ai.batch import DEFAULT_CONCURRENCY, ai_agent_many_async, iter_jsonl_items
+from .ai.complaint_agent import ai_agent_async, ai_agent_stream_async, for_frontend, shape_step
+from .ai.metrics import activate, deactivate, finish_trace, new_trace, render_prometheus, span
+from .fastjson import JsonResponse, dumps_str
+from .jobs import AI_JOB_EVENTS_MAX_S, AI_JOB_POLL_S, aenqueue, job_payload
+from .ticket_io import aiter_export, export_queryset
+
+BATCH_MAX_ITEMS = 500
+BATCH_MAX_CONCURRENCY = 32
+AI_MODEL = "gpt-4o-mini"
+AI_MAX_TOKENS = 1200
+SSE_KEEPALIVE_S = 15
 
 def ping(request):
     return HttpResponse("pong from myapp")
@@ -30,39 +39,393 @@ def new_query(request):
     # Renders the template below; change path if your template file is elsewhere
     return render(request, "student/new_query.html")
 
+def _complaint_text(request) -> str:
+    """The page posts JSON {"text": ...}; plain form posts and raw bodies still work."""
+    text = request.POST.get("text")
+    if text is None and request.body:
+        body = request.body.decode("utf-8")
+        if request.content_type == "application/json":
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            text = data.get("text") if isinstance(data, dict) else None
+        else:
+            text = body
+    return (text or "").strip()
+
+def _error_response(result: dict) -> JsonResponse:
+    """Upstream outages (breaker open, retries exhausted) are a 503 with Retry-After; anything else is a 502."""
+    if result.get("retry_after") is not None:
+        response = JsonResponse({"error": result["error"], "retry_after": result["retry_after"]}, status=503)
+        response["Retry-After"] = str(result["retry_after"])
+        return response
+    return JsonResponse({"error": result["error"]}, status=502)
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {dumps_str(data)}\n\n"
+
+async def _detail(request) -> tuple:
+    """
+    (compact, raw) for AI answers: compact ui by default; ?debug=1 sends the full ui, plus the
+    model's raw answer to internal callers (or to anyone under DEBUG).
+    """
+    if request.GET.get("debug") != "1":
+        return True, False
+    return False, settings.DEBUG or await _is_internal(request)
+
+async def _finish_after(content, trace, status):
+    """Re-attach the request trace while a streamed body is produced; finish it after the last byte."""
+    token = activate(trace)
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        deactivate(token)
+        finish_trace(trace, status)
+
+def _traced(endpoint: str):
+    """Per-stage timings for an async view (ai_request_seconds, ai_stage_seconds, AI_METRICS_LOG)."""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            trace = new_trace(endpoint)
+            token = activate(trace)
+            try:
+                response = await view(request, *args, **kwargs)
+            except Exception:
+                finish_trace(trace, 500)
+                raise
+            finally:
+                deactivate(token)
+            if response.streaming and response.is_async:
+                response.streaming_content = _finish_after(response.streaming_content, trace, response.status_code)
+            else:
+                finish_trace(trace, response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+async def _save_record(result: dict, text: str, info: dict, user) -> AIRecord:
+    """Store the analysis once; the browser only gets its id back (ticket_create links by id)."""
+    record = AIRecord.from_result(result, complaint=text, model=AI_MODEL, info=info, student=user)
+    await record.asave()
+    return record
+
+async def _analyze_events(text: str, use_cache: bool, user, compact: bool = True, raw: bool = False):
+    """SSE stream: routing, summary and each shaped step as soon as the model finishes them."""
+    is_technical = True
+    info = {}
+    async for event in ai_agent_stream_async(text, model=AI_MODEL, max_tokens=AI_MAX_TOKENS, use_cache=use_cache, info=info):
+        kind = event[0]
+        if kind == "field":
+            _, key, value = event
+            if key == "routing" and isinstance(value, dict):
+                is_technical = bool(value.get("is_technical", True))
+                yield _sse("routing", {"is_technical": is_technical, "category": value.get("category")})
+            elif key == "summary" and is_technical:
+                yield _sse("summary", {"summary": value})
+        elif kind == "step" and is_technical:
+            _, index, step = event
+            step = step if isinstance(step, dict) else {"text": str(step)}
+            if (step.get("text") or "").strip():
+                yield _sse("step", {"index": index, "text": shape_step(step)})
+        elif kind == "done":
+            result = event[1]
+            if isinstance(result, dict) and "error" in result:
+                yield _sse("error", {"error": result["error"], "retry_after": result.get("retry_after")})
+            else:
+                with span("record_write"):
+                    record = await _save_record(result, text, info, user)
+                # final shaping also attaches commands from solution.code, so it supersedes the partial steps
+                with span("shape"):
+                    ui = for_frontend(result, compact=compact)
+                yield _sse("done", {"ai_record_id": record.pk, "ai_record_token": record.link_token, "ui": ui,
+                                    **({"raw": result} if raw else {})})
+
+# ai_analyze / ticket_create are async views: served through config/asgi.py
+# (uvicorn/daphne) they don't pin a worker thread while the LLM call is in flight.
 @require_POST
-def ai_analyze(request):
-    body = request.body.decode("utf-8") if request.body else ""
-    text = (request.POST.get("text") or body).strip()
+@_traced("analyze")
+async def ai_analyze(request):
+    with span("parse_request"):
+        text = _complaint_text(request)
     if not text:
         return HttpResponseBadRequest("text required")
+    # ?nocache=1 skips the response cache (e.g. when a student asks for a fresh answer)
+    use_cache = request.GET.get("nocache") != "1"
+    with span("auth"):
+        user = await request.auser()
+        compact, raw = await _detail(request)
+    if request.GET.get("async", "1" if settings.AI_ANALYZE_ASYNC else "0") == "1":
+        with span("enqueue"):
+            job = await aenqueue(text, model=AI_MODEL, max_tokens=AI_MAX_TOKENS, use_cache=use_cache, user=user)
+        return JsonResponse({
+            "job_id": str(job.pk),
+            "status": job.status,
+            "status_url": reverse("ai_job_status", args=[job.pk]),
+            "events_url": reverse("ai_job_events", args=[job.pk]),
+        }, status=202)
+    if request.GET.get("stream") == "1":
+        response = StreamingHttpResponse(_analyze_events(text, use_cache, user, compact, raw), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+        return response
     try:
-        result = ai_agent(text, model="gpt-4o-mini", temperature=0.0, max_tokens=1200)
+        info = {}
+        result = await ai_agent_async(text, model=AI_MODEL, temperature=0.0, max_tokens=AI_MAX_TOKENS, use_cache=use_cache,
+                                      info=info)
         # if your real ai_agent returns strict JSON dict with 'error', handle it:
         if isinstance(result, dict) and "error" in result:
-            return JsonResponse({"error": result["error"]}, status=502)
-        ui = for_frontend(result) if callable(for_frontend) else result
-        return JsonResponse({"ui": ui, "raw": result})
+            return _error_response(result)
+        with span("record_write"):
+            record = await _save_record(result, text, info, user)
+        with span("shape"):
+            ui = for_frontend(result, compact=compact)
+        payload = {"ai_record_id": record.pk, "ai_record_token": record.link_token, "ui": ui}
+        if raw:
+            payload["raw"] = result
+        return JsonResponse(payload)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=502)
-    
+
+async def _own_job(job_id, user):
+    """The job if this user submitted it (anonymous jobs: whoever holds the unguessable id)."""
+    job = await AnalysisJob.objects.select_related("record").filter(pk=job_id).afirst()
+    if job is None or (job.student_id is not None and job.student_id != user.pk):
+        return None
+    return job
+
+@require_GET
+async def ai_job_status(request, job_id):
+    """
+    GET: {"job_id", "status", "attempts"} plus {"ai_record_id", "ai_record_token", "ui"} when done
+    or {"error"} when failed.
+    """
+    job = await _own_job(job_id, await request.auser())
+    if job is None:
+        return JsonResponse({"error": "not found"}, status=404)
+    compact, raw = await _detail(request)
+    return JsonResponse(job_payload(job, compact=compact, raw=raw))
+
+async def _job_events(job, compact: bool = True, raw: bool = False):
+    """SSE: "status" on every change, then "done" / "error" (same payload as ai_job_status)."""
+    deadline = time.monotonic() + AI_JOB_EVENTS_MAX_S
+    last_status, last_write = None, time.monotonic()
+    while True:
+        if job.status != last_status:
+            last_status, last_write = job.status, time.monotonic()
+            if job.status in AnalysisJob.FINISHED:
+                yield _sse("done" if job.status == "done" else "error", job_payload(job, compact=compact, raw=raw))
+                return
+            yield _sse("status", {"job_id": str(job.pk), "status": job.status, "attempts": job.attempts})
+        elif time.monotonic() - last_write >= SSE_KEEPALIVE_S:
+            last_write = time.monotonic()
+            yield ": keepalive\n\n"   # comment line: keeps proxies from timing out the idle stream
+        if time.monotonic() >= deadline:
+            yield _sse("timeout", {
+                "job_id": str(job.pk), "status": job.status, "status_url": reverse("ai_job_status", args=[job.pk]),
+            })
+            return
+        await asyncio.sleep(AI_JOB_POLL_S)
+        job = await AnalysisJob.objects.select_related("record").aget(pk=job.pk)
+
+@require_GET
+async def ai_job_events(request, job_id):
+    job = await _own_job(job_id, await request.auser())
+    if job is None:
+        return JsonResponse({"error": "not found"}, status=404)
+    compact, raw = await _detail(request)
+    response = StreamingHttpResponse(_job_events(job, compact, raw), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def _has_internal_token(request) -> bool:
+    token = getattr(settings, "INTERNAL_API_TOKEN", "")
+    auth = request.headers.get("Authorization", "")
+    return bool(token) and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:], token)
+
+async def _is_internal(request) -> bool:
+    """Scripts authenticate with INTERNAL_API_TOKEN; staff users may call from a browser session."""
+    if _has_internal_token(request):
+        return True
+    user = await request.auser()
+    return user.is_authenticated and user.is_staff
+
+async def _csrf_rejected(request):
+    """CsrfViewMiddleware's verdict for a csrf_exempt view: None if the request passes, else its 403."""
+    request.body   # read first: a form body must stay readable after the check parses request.POST
+    return await sync_to_async(CsrfViewMiddleware(lambda r: None).process_view)(request, None, (), {})
+
+@csrf_exempt
 @require_POST
-def ticket_create(request):
-    text            = request.POST.get("complaint_text", "")
-    ai_is_technical = request.POST.get("ai_is_technical") == "true"
-    ai_category     = request.POST.get("ai_category", "")
-    ai_record_id    = request.POST.get("ai_record_id", "")
-
-    ticket = Ticket.objects.create(
-        student=request.user if request.user.is_authenticated else None,
-        type="technical" if ai_is_technical else "non-technical",
-        text=text,
-        ai_category=ai_category,
-        ai_is_technical=ai_is_technical,
-        ai_record_id=ai_record_id,
-    )
+async def ai_analyze_batch(request):
+    """
+    Body: JSONL, one {"id": ..., "text": ...} per line (max BATCH_MAX_ITEMS).
+    Response: JSONL streamed in completion order, {"id", "result"} or {"id", "error"} per line.
+    Exempt from CSRF for scripts sending the INTERNAL_API_TOKEN; a staff session (a browser,
+    where a cross-site form could start a paid batch) must pass the CSRF check.
+    """
+    if not _has_internal_token(request):
+        if not await _is_internal(request):
+            return JsonResponse({"error": "forbidden"}, status=403)
+        rejected = await _csrf_rejected(request)
+        if rejected is not None:
+            return rejected
+    body = request.body.decode("utf-8") if request.body else ""
+    items = list(iter_jsonl_items(body.splitlines()))
+    if not items:
+        return HttpResponseBadRequest("JSONL body required")
+    if len(items) > BATCH_MAX_ITEMS:
+        return HttpResponseBadRequest(f"at most {BATCH_MAX_ITEMS} complaints per request")
+    try:
+        concurrency = int(request.GET.get("concurrency") or DEFAULT_CONCURRENCY)
+    except ValueError:
+        return HttpResponseBadRequest("concurrency must be an integer")
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+    async def stream():
+        async for rec in ai_agent_many_async(items, concurrency=concurrency, model=AI_MODEL, max_tokens=AI_MAX_TOKENS):
+            yield dumps_str(rec) + "\n"
+
+    return StreamingHttpResponse(stream(), content_type="application/x-ndjson")
+
+async def _linked_record(request, user):
+    """
+    The AIRecord the form points at: through `ai_record_token` (handed out with the analysis,
+    so it also covers anonymous records), or by `ai_record_id` for a record this user owns.
+    """
+    pk = AIRecord.pk_from_link_token(request.POST.get("ai_record_token", "").strip())
+    if pk is not None:
+        record = await AIRecord.objects.filter(pk=pk).afirst()
+        if record is not None and (record.student_id is None or record.student_id == user.pk):
+            return record
+    record_id = request.POST.get("ai_record_id", "").strip()
+    if not record_id.isdigit() or not user.is_authenticated:
+        return None
+    return await AIRecord.objects.filter(pk=int(record_id), student_id=user.pk).afirst()
+
+@require_POST
+@_traced("ticket_create")
+async def ticket_create(request):
+    text = request.POST.get("complaint_text", "").strip()
+    if not text:
+        return HttpResponseBadRequest("complaint_text required")
+    user = await request.auser()
+    # routing labels come from the stored analysis, never from the posted form
+    with span("record_read"):
+        record = await _linked_record(request, user)
+
+    with span("ticket_write"):
+        ticket = await Ticket.objects.acreate(
+            student=user if user.is_authenticated else None,
+            type="technical" if record is not None and record.is_technical else "non-technical",
+            text=text,
+            ai_category=record.category if record is not None else "",
+            ai_is_technical=record.is_technical if record is not None else False,
+            ai_record_id=str(record.pk) if record is not None else "",
+        )
     return redirect("ticket_detail", pk=ticket.pk)
 
+TICKET_PAGE_SIZE = 50
+TICKET_PAGE_MAX = 200
+_TICKET_FILTERS = {"status": "status", "type": "type", "category": "ai_category"}
+
+@require_GET
+async def ticket_list(request):
+    """
+    GET ?status=&type=&category=&limit=&cursor=  (staff / INTERNAL_API_TOKEN)
+    Newest first, keyset-paginated: pass back `next_cursor` to get the following page.
+    No filter, status, type, category and type+status (all with or without a cursor) each
+    have an index ending in (created_at, id) in Ticket.Meta.indexes, so a page reads only its
+    rows. category+status / category+type walk one of those indexes in order and filter the
+    rest, reading past non-matching rows (no sort, but not bounded by the page size).
+    """
+    if not await _is_internal(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or TICKET_PAGE_SIZE), TICKET_PAGE_MAX))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    filters = {field: request.GET[param] for param, field in _TICKET_FILTERS.items() if request.GET.get(param)}
+    try:
+        qs = Ticket.objects.filter(**filters).before_cursor(request.GET.get("cursor")).newest_first()
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    rows = [
+        row async for row in qs.annotate(preview=Substr("text", 1, 200)).values(
+            "id", "type", "status", "ai_category", "ai_is_technical", "ai_record_id", "created_at", "preview",
+        )[:limit + 1]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return JsonResponse({"results": rows, "next_cursor": next_cursor})
+
+@require_GET
+async def ticket_export(request):
+    """
+    GET ?status=&type=&category=  (staff / INTERNAL_API_TOKEN)
+    Every matching ticket as CSV (ticket_io.COLUMNS), streamed a chunk at a time.
+    """
+    if not await _is_internal(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+    filters = {field: request.GET[param] for param, field in _TICKET_FILTERS.items() if request.GET.get(param)}
+    response = StreamingHttpResponse(aiter_export(export_queryset(filters), "csv"),
+                                     content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = 'attachment; filename="tickets.csv"'
+    return response
+
+TICKET_STATS_DAYS = 30
+TICKET_STATS_MAX_DAYS = 366
+_TICKET_STATS_BY = {"category": "ai_category", "type": "type", "status": "status"}
+
+@require_GET
+async def ticket_stats(request):
+    """
+    GET ?days=30 | ?from=YYYY-MM-DD&to=YYYY-MM-DD, ?by=category,type,status, ?status=&type=&category=
+    (staff / INTERNAL_API_TOKEN). Tickets created per day, split by the `by` dimensions (by= for
+    day totals). Reads only TicketDailyStats: O(days x buckets) rows however many tickets exist.
+    """
+    if not await _is_internal(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+    try:
+        end = date.fromisoformat(request.GET["to"]) if request.GET.get("to") else timezone.localdate()
+        if request.GET.get("from"):
+            start = date.fromisoformat(request.GET["from"])
+        else:
+            start = end - timedelta(days=int(request.GET.get("days") or TICKET_STATS_DAYS) - 1)
+    except ValueError:
+        return HttpResponseBadRequest("from/to must be YYYY-MM-DD and days an integer")
+    if start > end or (end - start).days >= TICKET_STATS_MAX_DAYS:
+        return HttpResponseBadRequest(f"from must be before to, at most {TICKET_STATS_MAX_DAYS} days apart")
+    by = [b.strip() for b in request.GET.get("by", "category,type,status").split(",") if b.strip()]
+    if any(b not in _TICKET_STATS_BY for b in by):
+        return HttpResponseBadRequest(f"by must be a subset of {','.join(_TICKET_STATS_BY)}")
+    dims = [_TICKET_STATS_BY[b] for b in dict.fromkeys(by)]
+    filters = {field: request.GET[param] for param, field in _TICKET_FILTERS.items() if request.GET.get(param)}
+
+    qs = (
+        TicketDailyStats.objects.filter(day__range=(start, end), count__gt=0, **filters)
+        .values("day", *dims).annotate(tickets=Sum("count")).order_by("day", *dims)
+    )
+    rows = [row async for row in qs]
+    return JsonResponse({
+        "from": start, "to": end, "by": dims,
+        "rows": rows,
+        "total": sum(row["tickets"] for row in rows),
+    })
+
+@require_GET
+async def metrics(request):
+    """Prometheus scrape target (staff / INTERNAL_API_TOKEN as a bearer token)."""
+    if not await _is_internal(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def ticket_detail(request, pk):
     ticket = get_object_or_404(Ticket, pk=pk)
     return render(request, "tickets/detail.html", {"ticket": ticket})